@@ -0,0 +1,85 @@
+"""
+📊 Benchmark codec serialize giá trị cache Redis (config/cache_codecs.py)
+
+So sánh trên các giá trị thật của app, không cần Redis:
+- dict nhỏ  : dict 8 trường kiểu session / field_config   - json (cách cũ) vs orjson vs msgpack
+- dashboard : kết quả get_dashboard_summary                - json vs orjson vs msgpack
+- embedding : vector float32 3072 chiều                    - json list (cách cũ) vs float32 bytes
+
+Đo kích thước (byte lưu trong Redis) và thời gian encode / decode trung bình.
+
+Usage:
+    python benchmark_cache_codecs.py
+    python benchmark_cache_codecs.py --iterations 50000 --dim 1536
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from config.cache_codecs import CODECS
+
+SESSION_DATA = {
+    "id": 123456, "name": "F-8b3f9c2a", "status": "true", "channel": "facebook",
+    "page_id": "104729385618273", "current_receiver": "Bot", "previous_receiver": "Nguyễn Thị Lan",
+    "time": "2026-10-18T09:30:00+07:00",
+}
+DASHBOARD_DATA = {
+    "barData": [{"channel": c, "messages": m} for c, m in (("facebook", 182331), ("web", 93211), ("zalo", 40122))],
+    "pieData": [{"name": c, "value": m} for c, m in (("facebook", 182331), ("web", 93211), ("zalo", 40122))],
+    "lineData": [{"month": "Tháng trước", "facebook": 15123, "web": 8012}, {"month": "Tháng hiện tại", "facebook": 9876, "web": 5321}],
+    "tableData": [{"channel": "facebook", "customers": 1203, "messages": 9876, "change": -34.7}],
+}
+
+
+def measure(codec, value, iterations: int):
+    raw = codec.encode(value)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(value)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(raw)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+    return len(raw), encode_us, decode_us
+
+
+def report(title: str, cases, iterations: int):
+    """cases: [(tên codec, giá trị)], dòng đầu tiên là mốc so sánh (cách cũ)"""
+    print(f"\n{title}")
+    print(f"  {'codec':<10}{'bytes':>10}{'encode (µs)':>14}{'decode (µs)':>14}{'nhanh hơn json':>17}")
+    baseline = None
+    for name, value in cases:
+        size, encode_us, decode_us = measure(CODECS[name], value, iterations)
+        total = encode_us + decode_us
+        baseline = baseline or total
+        print(f"  {name:<10}{size:>10}{encode_us:>14.2f}{decode_us:>14.2f}{baseline / total:>16.1f}x")
+
+
+def main(args):
+    print(f"\n{'='*70}")
+    print(f"📊 BENCHMARK: codec cache Redis ({args.iterations} lần / giá trị)")
+    print(f"{'='*70}")
+
+    for title, value in (
+        ("dict nhỏ (session)", SESSION_DATA),
+        ("dashboard (async_cache_result)", DASHBOARD_DATA),
+    ):
+        report(title, [(name, value) for name in ("json", "orjson", "msgpack")], args.iterations)
+
+    # Cách cũ lưu vector dạng JSON list
+    vector = np.random.default_rng(0).standard_normal(args.dim).astype(np.float32)
+    report(
+        f"embedding ({args.dim} chiều)",
+        [("json", vector.tolist()), ("float32", vector)],
+        max(args.iterations // 100, 10),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark codec serialize giá trị cache Redis")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    main(parser.parse_args())
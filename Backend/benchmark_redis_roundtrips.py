@@ -0,0 +1,150 @@
+"""
+📊 Benchmark số round-trip Redis trên đường xử lý 1 tin nhắn (cache hit)
+
+So sánh:
+1. Cách cũ: client redis.Redis đồng bộ, mỗi key 1 lệnh (GET session, GET check_repply...)
+   → mỗi lệnh chặn event loop trong suốt round-trip
+2. Cách mới (services/session_state.py): client aioredis dùng pool, trạng thái session là 1 Redis hash
+   (can_reply suy ra từ hash) → ít round-trip hơn và các tin nhắn đồng thời không chặn nhau
+
+Các đường đo:
+- customer : tin nhắn khách (web)      - cũ: GET session + GET check_repply        | mới: 1 HGETALL
+- admin    : admin nhắn (chặn bot)     - cũ: GET session + SETEX session + DEL     | mới: HGETALL + 1 EVAL (Lua)
+- platform : tin nhắn Facebook/Zalo... - cũ: GET name + GET session + GET repply   | mới: GET name + HGETALL
+
+Cần Redis đang chạy (REDIS_URL / REDIS_HOST như app).
+
+Usage:
+    python benchmark_redis_roundtrips.py
+    python benchmark_redis_roundtrips.py --messages 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from config.redis_cache import redis_cache
+from services.session_state import _TAKEOVER_SCRIPT, SESSION_STATE_TTL, session_state, state_key
+
+SESSION_ID = 999_999
+SESSION_KEY = f"session:{SESSION_ID}"
+REPPLY_KEY = f"check_repply:{SESSION_ID}"
+STATE_KEY = state_key(SESSION_ID)
+NAME_KEY = "session_by_name:F-benchmark"
+SESSION_DATA = {
+    "id": SESSION_ID, "name": "F-benchmark", "status": "true", "channel": "facebook",
+    "page_id": "1", "current_receiver": "Bot", "previous_receiver": None, "time": None,
+}
+
+
+class Counter:
+    def __init__(self):
+        self.round_trips = 0
+
+
+def old_paths(client, counter: Counter):
+    """Đúng như code cũ trong services/chat_service.py (cache_get / cache_set / cache_delete)"""
+
+    def get(key):
+        counter.round_trips += 1
+        value = client.get(key)
+        return json.loads(value) if value else None
+
+    def customer():
+        get(SESSION_KEY)
+        get(REPPLY_KEY)
+
+    def admin():
+        get(SESSION_KEY)
+        counter.round_trips += 2
+        client.setex(SESSION_KEY, 300, json.dumps(SESSION_DATA))
+        client.delete(f"{REPPLY_KEY}:admin")
+
+    def platform():
+        get(NAME_KEY)
+        get(SESSION_KEY)
+        get(REPPLY_KEY)
+
+    return {"customer": customer, "admin": admin, "platform": platform}
+
+
+def new_paths(client, counter: Counter):
+    """Phần Redis của session_state.get / admin_takeover (bỏ qua UPDATE Postgres)"""
+    async def get():
+        counter.round_trips += 1
+        return await session_state.get(SESSION_ID)
+
+    async def customer():
+        await get()
+
+    async def admin():
+        await get()
+        counter.round_trips += 1
+        await client.eval(_TAKEOVER_SCRIPT, 1, STATE_KEY, SESSION_STATE_TTL, "2099-01-01T00:00:00", "Admin")
+
+    async def platform():
+        counter.round_trips += 1
+        await redis_cache.async_get(NAME_KEY)
+        await get()
+
+    return {"customer": customer, "admin": admin, "platform": platform}
+
+
+async def run_old(fn, messages: int, concurrency: int) -> float:
+    """Tin nhắn đồng thời nhưng lệnh Redis đồng bộ → thực chất chạy tuần tự"""
+    async def one():
+        fn()
+        await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    for i in range(0, messages, concurrency):
+        await asyncio.gather(*(one() for _ in range(min(concurrency, messages - i))))
+    return time.perf_counter() - start
+
+
+async def run_new(fn, messages: int, concurrency: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, messages, concurrency):
+        await asyncio.gather(*(fn() for _ in range(min(concurrency, messages - i))))
+    return time.perf_counter() - start
+
+
+async def main(args):
+    sync_client = redis_cache.get_sync_client()
+    async_client = await redis_cache.get_async_client()
+    if sync_client is None or async_client is None:
+        print("❌ Không kết nối được Redis")
+        return
+
+    sync_client.setex(SESSION_KEY, 300, json.dumps(SESSION_DATA))
+    sync_client.setex(REPPLY_KEY, 300, json.dumps({"can_reply": True}))
+    sync_client.setex(NAME_KEY, 300, SESSION_ID)
+    sync_client.hset(STATE_KEY, mapping={k: v for k, v in SESSION_DATA.items() if v is not None})
+    sync_client.expire(STATE_KEY, SESSION_STATE_TTL)
+
+    print(f"\n{'='*78}")
+    print(f"📊 BENCHMARK: Redis round-trip / tin nhắn ({args.messages} tin, {args.concurrency} đồng thời)")
+    print(f"{'='*78}\n")
+    print(f"{'':<12}{'round-trip cũ':>15}{'round-trip mới':>16}{'cũ (ms)':>12}{'mới (ms)':>12}{'nhanh hơn':>11}")
+
+    for name in ("customer", "admin", "platform"):
+        old_counter, new_counter = Counter(), Counter()
+        old_time = await run_old(old_paths(sync_client, old_counter)[name], args.messages, args.concurrency)
+        new_time = await run_new(new_paths(async_client, new_counter)[name], args.messages, args.concurrency)
+        print(
+            f"{name:<12}{old_counter.round_trips / args.messages:>15.1f}"
+            f"{new_counter.round_trips / args.messages:>16.1f}"
+            f"{old_time * 1000:>12.0f}{new_time * 1000:>12.0f}{old_time / new_time:>10.1f}x"
+        )
+
+    sync_client.delete(SESSION_KEY, REPPLY_KEY, NAME_KEY, STATE_KEY)
+    print("\n(Redis càng xa / càng chậm thì cách cũ càng tệ: mỗi round-trip chặn toàn bộ event loop)")
+    await async_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Redis round-trip trên đường xử lý tin nhắn")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,191 @@
+"""
+📊 Benchmark ingest Google Sheet (config/sheet.py) với server embedding giả lập
+
+So sánh:
+1. Cách cũ: mỗi chunk 1 request embedding, chạy tuần tự
+2. Pipeline mới: embed_chunks() gom nhiều chunk / 1 request, các batch chạy song song
+
+Server giả lập nói giao thức OpenAI /v1/embeddings (HTTP/1.1 keep-alive),
+mỗi request trễ LATENCY_MS + PER_INPUT_MS * số input → không cần API key.
+
+Tùy chọn --db: đo thêm bulk insert vào Postgres (biến môi trường DATABASE)
+trong 1 transaction rồi ROLLBACK → không đụng dữ liệu thật.
+
+Usage:
+    python benchmark_sheet_ingestion.py
+    python benchmark_sheet_ingestion.py --rows 3000 --latency-ms 300
+    python benchmark_sheet_ingestion.py --db
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+import numpy as np
+
+# ===== CẤU HÌNH MẶC ĐỊNH =====
+NUM_ROWS = 2000
+LATENCY_MS = 200
+PER_INPUT_MS = 1
+EMBEDDING_DIM = 3072
+OLD_PATH_SAMPLE = 50  # cách cũ quá chậm → chỉ đo trên 1 mẫu rồi quy ra rows/sec
+
+
+async def handle_embeddings(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, args):
+    """Server giả lập OpenAI embeddings, hỗ trợ keep-alive"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+
+            content_length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.strip().lower() == "content-length":
+                    content_length = int(value.strip())
+
+            body = json.loads(await reader.readexactly(content_length))
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            await asyncio.sleep((args.latency_ms + args.per_input_ms * len(inputs)) / 1000)
+
+            data = []
+            for i in range(len(inputs)):
+                vector = np.random.rand(args.dim).astype(np.float32)
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.tobytes()).decode()
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+            payload = json.dumps({
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            }).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+def make_records(num_rows: int) -> list:
+    """Sinh dữ liệu giống sheet lịch khai giảng / khóa học"""
+    return [
+        {
+            "Khóa học": f"HSK{i % 6 + 1}",
+            "Cơ sở": ["Đống Đa Hà Nội", "Lê Lợi Đà Nẵng", "Quận 3 TP.HCM", "Trực tuyến"][i % 4],
+            "Ngày khai giảng": f"{i % 28 + 1:02d}/{i % 12 + 1:02d}/2025",
+            "Lịch học": "Thứ 2-4-6, 18h00-19h30",
+            "Học phí": f"{3 + i % 5},{i % 10}00,000 VNĐ",
+            "Ghi chú": f"Lớp số {i}, sĩ số tối đa 15 học viên",
+        }
+        for i in range(num_rows)
+    ]
+
+
+async def bench_old_path(chunks: list) -> float:
+    """Cách cũ: 1 chunk = 1 request, tuần tự"""
+    from config.get_embedding import get_embedding_service
+    service = get_embedding_service("openai")
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        await service.embed_many([chunk], use_cache=False)
+    return time.perf_counter() - start
+
+
+async def bench_new_path(chunks: list) -> float:
+    from config.sheet import embed_chunks
+
+    start = time.perf_counter()
+    vectors = await embed_chunks(chunks)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(chunks) and all(v is not None for v in vectors)
+    return elapsed
+
+
+async def bench_db_insert(chunks: list) -> float:
+    """Bulk insert trong 1 transaction rồi rollback"""
+    from config.database import AsyncSessionLocal
+    from config.sheet import bulk_insert_chunks
+
+    rows = [
+        {
+            "chunk_text": chunk,
+            "search_vector": np.random.rand(EMBEDDING_DIM).astype(np.float32),
+            "knowledge_base_id": None
+        }
+        for chunk in chunks
+    ]
+    async with AsyncSessionLocal() as session:
+        start = time.perf_counter()
+        await bulk_insert_chunks(session, rows)
+        elapsed = time.perf_counter() - start
+        await session.rollback()
+    return elapsed
+
+
+async def main(args):
+    server = await asyncio.start_server(lambda r, w: handle_embeddings(r, w, args), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # AsyncOpenAI đọc OPENAI_BASE_URL khi khởi tạo (client của embedding service tạo lazy)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+
+    from config.sheet import records_to_chunks
+    from config.get_embedding import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+
+    chunks = records_to_chunks(make_records(args.rows))
+
+    print(f"\n{'='*70}")
+    print(f"📊 BENCHMARK: ingest {args.rows} rows → {len(chunks)} chunks")
+    print(f"   Server giả lập: {args.latency_ms}ms/request + {args.per_input_ms}ms/input, dim={args.dim}")
+    print(f"   Batch size: {EMBEDDING_BATCH_SIZE}, concurrency: {EMBEDDING_MAX_CONCURRENCY}")
+    print(f"{'='*70}\n")
+
+    sample = chunks[:OLD_PATH_SAMPLE]
+    old_time = await bench_old_path(sample)
+    old_rate = len(sample) / old_time
+    print(f"🐢 Cách cũ (1 chunk/request, tuần tự):  {old_rate:8.1f} rows/sec  "
+          f"(đo trên {len(sample)} chunk, ước tính {len(chunks) / old_rate:.0f}s cho cả sheet)")
+
+    new_time = await bench_new_path(chunks)
+    new_rate = len(chunks) / new_time
+    print(f"🚀 Pipeline mới (batch + song song):   {new_rate:8.1f} rows/sec  "
+          f"({new_time:.1f}s cho cả sheet)")
+    print(f"\n⚡ Nhanh hơn ~{new_rate / old_rate:.0f} lần ở bước embedding")
+
+    if args.db:
+        insert_time = await bench_db_insert(chunks)
+        print(f"🗄️  Bulk insert (executemany, 1 transaction, rollback): "
+              f"{len(chunks) / insert_time:8.1f} rows/sec ({insert_time:.1f}s)")
+
+    # Đóng kết nối keep-alive của client trước khi tắt server giả lập
+    from config.get_embedding import get_embedding_service
+    await get_embedding_service("openai").client.close()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest Google Sheet")
+    parser.add_argument("--rows", type=int, default=NUM_ROWS)
+    parser.add_argument("--latency-ms", type=int, default=LATENCY_MS)
+    parser.add_argument("--per-input-ms", type=float, default=PER_INPUT_MS)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--db", action="store_true", help="Đo thêm bulk insert vào Postgres (rollback)")
+    asyncio.run(main(parser.parse_args()))
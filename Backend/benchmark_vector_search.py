@@ -0,0 +1,184 @@
+"""
+📊 Benchmark tìm kiếm vector: ANN (HNSW trên vector rút gọn + re-rank) vs exact scan
+
+Đo trên cùng 1 bộ query:
+- recall@k: tỉ lệ kết quả ANN trùng với top-k của exact scan (exact = ground truth)
+- latency p50 / p95 / mean của mỗi chế độ
+
+2 nguồn dữ liệu:
+- Mặc định: bảng tạm document_chunks_bench với N vector tổng hợp (dạng cụm, đã chuẩn hóa),
+  tự tạo index HNSW, xóa bảng khi xong → không đụng dữ liệu thật
+- --live: bảng document_chunks (phiên bản đang active), query = vector có sẵn + nhiễu
+
+Cần Postgres có extension pgvector >= 0.5.0 (biến môi trường DATABASE).
+
+Usage:
+    python benchmark_vector_search.py
+    python benchmark_vector_search.py --rows 20000 --queries 200 --top-k 10
+    python benchmark_vector_search.py --live
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from config.database import AsyncSessionLocal, engine
+from config.get_embedding import ANN_DIMENSIONS, reduce_embedding
+from llm import retrieval
+from llm.retrieval import search_by_embedding, to_query_vector
+
+# ===== CẤU HÌNH MẶC ĐỊNH =====
+NUM_ROWS = 5000
+NUM_QUERIES = 100
+TOP_K = 10
+DIM = 3072
+NUM_CLUSTERS = 50
+BENCH_TABLE = "document_chunks_bench"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def make_vectors(num_rows: int, rng: np.random.Generator) -> np.ndarray:
+    """Vector dạng cụm (giống embedding thật: nhiều chunk cùng chủ đề nằm gần nhau)"""
+    centers = normalize(rng.standard_normal((NUM_CLUSTERS, DIM)))
+    labels = rng.integers(0, NUM_CLUSTERS, num_rows)
+    noise = rng.standard_normal((num_rows, DIM)) * (0.6 / np.sqrt(DIM))
+    return normalize(centers[labels] + noise).astype(np.float32)
+
+
+async def create_bench_table(vectors: np.ndarray):
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        await conn.execute(text(f"""
+            CREATE TABLE {BENCH_TABLE} (
+                id SERIAL PRIMARY KEY,
+                chunk_text TEXT,
+                search_vector vector({DIM}),
+                search_vector_ann vector({ANN_DIMENSIONS})
+            )
+        """))
+
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        for offset in range(0, len(vectors), 500):
+            await session.execute(
+                text(f"""
+                    INSERT INTO {BENCH_TABLE} (chunk_text, search_vector, search_vector_ann)
+                    VALUES (:chunk_text, CAST(:search_vector AS vector), CAST(:search_vector_ann AS vector))
+                """),
+                [
+                    {
+                        "chunk_text": f"chunk {offset + i}",
+                        "search_vector": to_query_vector(vector),
+                        "search_vector_ann": to_query_vector(reduce_embedding(vector)),
+                    }
+                    for i, vector in enumerate(vectors[offset:offset + 500])
+                ]
+            )
+        await session.commit()
+    print(f"📥 Insert {len(vectors)} rows: {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            f"CREATE INDEX ON {BENCH_TABLE} USING hnsw (search_vector_ann vector_l2_ops)"
+        ))
+        await conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+    print(f"🏗️  Build HNSW index: {time.perf_counter() - start:.1f}s")
+
+
+async def drop_bench_table():
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+
+async def load_live_vectors(limit: int) -> np.ndarray:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(text(f"""
+            SELECT search_vector FROM document_chunks
+            WHERE kb_version = {retrieval.ACTIVE_VERSION_SQL}
+            ORDER BY random()
+            LIMIT :limit
+        """), {"limit": limit})
+        rows = result.all()
+    return np.array([np.asarray(row.search_vector, dtype=np.float32) for row in rows])
+
+
+async def run_queries(queries: np.ndarray, mode: str, top_k: int, table: str, version_filter: bool):
+    ids, latencies = [], []
+    for query in queries:
+        async with AsyncSessionLocal() as session:
+            start = time.perf_counter()
+            rows = await search_by_embedding(
+                session, query, top_k, mode=mode, table=table, version_filter=version_filter
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([row.id for row in rows])
+    return ids, np.array(latencies)
+
+
+def report(name: str, latencies: np.ndarray):
+    print(f"   {name:<6} p50: {np.percentile(latencies, 50):7.1f}ms | "
+          f"p95: {np.percentile(latencies, 95):7.1f}ms | mean: {latencies.mean():7.1f}ms")
+
+
+async def main(args):
+    rng = np.random.default_rng(42)
+
+    if args.live:
+        table, version_filter = "document_chunks", True
+        base = await load_live_vectors(args.queries)
+        if len(base) == 0:
+            print("❌ document_chunks chưa có dữ liệu ở phiên bản active")
+            return
+    else:
+        table, version_filter = BENCH_TABLE, False
+        vectors = make_vectors(args.rows, rng)
+        await create_bench_table(vectors)
+        base = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+
+    # Query = vector có sẵn + nhiễu nhỏ (giống câu hỏi gần nghĩa với 1 chunk)
+    noise = rng.standard_normal(base.shape) * (0.3 / np.sqrt(base.shape[1]))
+    queries = normalize(base + noise).astype(np.float32)
+
+    print(f"\n{'='*70}")
+    print(f"📊 BENCHMARK: {len(queries)} query, top_k={args.top_k}, "
+          f"ANN {ANN_DIMENSIONS} chiều + re-rank {max(retrieval.ANN_CANDIDATES, args.top_k)} ứng viên")
+    print(f"   Bảng: {table}")
+    print(f"{'='*70}\n")
+
+    try:
+        # Warm-up để cache / plan ổn định
+        await run_queries(queries[:5], "exact", args.top_k, table, version_filter)
+        await run_queries(queries[:5], "ann", args.top_k, table, version_filter)
+
+        exact_ids, exact_lat = await run_queries(queries, "exact", args.top_k, table, version_filter)
+        ann_ids, ann_lat = await run_queries(queries, "ann", args.top_k, table, version_filter)
+    finally:
+        if not args.live and not args.keep:
+            await drop_bench_table()
+
+    recall = np.mean([
+        len(set(a) & set(e)) / max(len(e), 1) for a, e in zip(ann_ids, exact_ids)
+    ])
+
+    print("⏱️  Latency:")
+    report("exact", exact_lat)
+    report("ann", ann_lat)
+    print(f"\n🎯 recall@{args.top_k}: {recall:.3f}")
+    print(f"⚡ Nhanh hơn ~{np.median(exact_lat) / np.median(ann_lat):.1f} lần (p50)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN vs exact vector search")
+    parser.add_argument("--rows", type=int, default=NUM_ROWS)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--live", action="store_true", help="Dùng bảng document_chunks thật")
+    parser.add_argument("--keep", action="store_true", help="Không xóa bảng tạm sau khi chạy")
+    asyncio.run(main(parser.parse_args()))
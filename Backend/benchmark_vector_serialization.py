@@ -0,0 +1,68 @@
+"""
+📊 Microbenchmark chi phí serialize vector query (3072 chiều) phía Python
+
+So sánh:
+1. Cách cũ: "[" + ",".join(str(x) for x in emb.tolist()) + "]" → Postgres parse text
+2. Codec mới (config/pgvector_codec.py): ndarray float32 → bytes big-endian (binary asyncpg)
+
+Đo cả chiều ngược lại (decode kết quả trả về: text → ndarray vs binary → ndarray)
+và kích thước payload gửi qua mạng. Không cần database.
+
+Usage:
+    python benchmark_vector_serialization.py
+    python benchmark_vector_serialization.py --dim 1536 --iterations 5000
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+from pgvector.utils import from_db, from_db_binary
+
+from config.pgvector_codec import encode_vector
+
+DIM = 3072
+ITERATIONS = 2000
+
+
+def old_encode(embedding: np.ndarray) -> str:
+    """Đúng như code cũ trong llm/llm.py và llm/gpt.py"""
+    embedding = embedding.tolist()
+    return "[" + ",".join([str(x) for x in embedding]) + "]"
+
+
+def bench(fn, iterations: int) -> float:
+    """Thời gian trung bình mỗi lần gọi (µs)"""
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def main(args):
+    embedding = np.random.default_rng(0).standard_normal(args.dim).astype(np.float32)
+    text_payload = old_encode(embedding)
+    binary_payload = encode_vector(embedding)
+
+    # Đảm bảo 2 cách cho cùng 1 vector
+    assert np.allclose(from_db(text_payload), from_db_binary(binary_payload))
+
+    print(f"\n{'='*70}")
+    print(f"📊 MICROBENCHMARK: serialize vector {args.dim} chiều, {args.iterations} lần/phép đo")
+    print(f"{'='*70}\n")
+
+    old_enc = bench(lambda: old_encode(embedding), args.iterations)
+    new_enc = bench(lambda: encode_vector(embedding), args.iterations)
+    old_dec = bench(lambda: from_db(text_payload), args.iterations)
+    new_dec = bench(lambda: from_db_binary(binary_payload), args.iterations)
+
+    print(f"{'':<22}{'text (cũ)':>14}{'binary (mới)':>16}{'nhanh hơn':>12}")
+    print(f"{'Encode query':<22}{old_enc:>11.1f} µs{new_enc:>13.1f} µs{old_enc / new_enc:>10.0f}x")
+    print(f"{'Decode kết quả':<22}{old_dec:>11.1f} µs{new_dec:>13.1f} µs{old_dec / new_dec:>10.0f}x")
+    print(f"{'Payload':<22}{len(text_payload):>9,} bytes{len(binary_payload):>11,} bytes"
+          f"{len(text_payload) / len(binary_payload):>10.1f}x")
+    print("\n(Chưa tính phần Postgres parse chuỗi text → vector, cách binary bỏ qua bước này)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark serialize vector")
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    main(parser.parse_args())
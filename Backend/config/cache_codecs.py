@@ -0,0 +1,129 @@
+"""
+Codec serialize giá trị cache Redis, chọn theo namespace của key (phần trước dấu ":" đầu tiên)
+
+- json    : mặc định, giữ nguyên cách cũ (str lưu thẳng, còn lại json.dumps; đọc thử json.loads)
+- text    : chuỗi thuần, đọc ra luôn là str (json đọc "2025" thành int, "null" thành None)
+            → giá trị là text tự do (search_key:{hash})
+- orjson  : JSON nhưng encode / decode nhanh hơn nhiều (~6x), hỗ trợ sẵn datetime / numpy
+            → giá trị nhỏ đọc thường xuyên (session_by_name:{name}, field_configs...)
+- msgpack : nhị phân nhỏ hơn JSON ~25% nhưng decode chậm hơn orjson
+            → kết quả lớn, ít đọc (dashboard, danh sách hội thoại admin) để tiết kiệm bộ nhớ Redis
+- float32 : vector numpy lưu thẳng bytes (4 byte / chiều), đọc bằng np.frombuffer không copy
+
+Người gọi cache_get / cache_set / async_cache_get... không cần biết codec: RedisCache tự chọn theo key.
+Giá trị cũ không decode được bằng codec mới (vd JSON còn lại sau khi đổi namespace sang msgpack)
+được coi như miss và sẽ được ghi lại bằng codec mới.
+Benchmark: python benchmark_cache_codecs.py
+"""
+import json
+import logging
+from typing import Any, Dict, Optional
+import msgpack
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False)
+        return value.encode("utf-8")
+
+    def decode(self, raw: bytes) -> Any:
+        text = raw.decode("utf-8")
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return text
+
+
+class TextCodec:
+    name = "text"
+
+    def encode(self, value: Any) -> bytes:
+        return str(value).encode("utf-8")
+
+    def decode(self, raw: bytes) -> str:
+        return raw.decode("utf-8")
+
+
+class OrjsonCodec:
+    name = "orjson"
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value, option=self.options)
+
+    def decode(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+class NumpyCodec:
+    """Mảng 1 chiều dtype cố định ↔ bytes thô; mảng đọc ra là read-only"""
+
+    def __init__(self, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self.name = self.dtype.name
+
+    def encode(self, value: Any) -> bytes:
+        return np.asarray(value, dtype=self.dtype).tobytes()
+
+    def decode(self, raw: bytes) -> np.ndarray:
+        return np.frombuffer(raw, dtype=self.dtype)
+
+
+JSON_CODEC = JsonCodec()
+
+CODECS = {
+    codec.name: codec
+    for codec in (JSON_CODEC, TextCodec(), OrjsonCodec(), MsgpackCodec(), NumpyCodec(np.float32))
+}
+
+# namespace → codec, namespace không có ở đây dùng json
+NAMESPACE_CODECS: Dict[str, str] = {
+    "session_by_name": "orjson",
+    "field_configs": "orjson",
+    "dashboard": "msgpack",
+    "admin_history": "msgpack",
+    "embedding": "float32",
+    "search_key": "text",
+}
+
+
+def register_namespace_codec(namespace: str, codec_name: str):
+    if codec_name not in CODECS:
+        raise ValueError(f"Codec không hỗ trợ: {codec_name} (có: {', '.join(CODECS)})")
+    NAMESPACE_CODECS[namespace] = codec_name
+
+
+def codec_for(key: str):
+    return CODECS[NAMESPACE_CODECS.get(key.split(":", 1)[0], JSON_CODEC.name)]
+
+
+def encode_value(key: str, value: Any) -> bytes:
+    return codec_for(key).encode(value)
+
+
+def decode_value(key: str, raw: Optional[bytes]) -> Optional[Any]:
+    if raw is None:
+        return None
+    codec = codec_for(key)
+    try:
+        return codec.decode(raw)
+    except Exception as e:
+        logger.warning(f"Cannot decode cache key {key} with {codec.name}, treating as miss: {e}")
+        return None
@@ -1,6 +1,9 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import NullPool
+from sqlalchemy import event, text
+from config.get_embedding import ANN_DIMENSIONS
+from config.pgvector_codec import register_vector_codec
 from typing import AsyncGenerator
 
 from dotenv import load_dotenv
@@ -27,6 +30,16 @@ engine = create_async_engine(
     echo=False,              # Set True để debug SQL queries
 )
 
+@event.listens_for(engine.sync_engine, "connect")
+def _register_pgvector_codec(dbapi_connection, connection_record):
+    """Mỗi connection asyncpg mới → đăng ký codec binary cho kiểu vector"""
+    try:
+        dbapi_connection.run_async(register_vector_codec)
+    except Exception as e:
+        # VD extension vector chưa được cài → giữ nguyên kiểu text mặc định
+        print(f"⚠️ [DB] Không đăng ký được codec pgvector: {e}")
+
+
 # Tạo async session maker
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -55,7 +68,44 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+# Cột / index bổ sung cho bảng ĐÃ tồn tại (create_all không ALTER bảng cũ)
+# Mỗi câu lệnh phải idempotent (IF NOT EXISTS) vì chạy lại mỗi lần startup
+SCHEMA_PATCHES = [
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_content_hash ON document_chunks (content_hash)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS kb_version INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_kb_version ON document_chunks (kb_version)",
+    f"ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS search_vector_ann vector({ANN_DIMENSIONS})",
+    # HNSW cần pgvector >= 0.5.0; nếu lỗi, ORDER BY search_vector_ann vẫn chạy (scan tuần tự trên vector rút gọn)
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_ann_hnsw ON document_chunks "
+    "USING hnsw (search_vector_ann vector_l2_ops)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS search_text TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_search_text_fts ON document_chunks "
+    "USING gin (to_tsvector('simple', coalesce(search_text, '')))",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS course VARCHAR(255)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS city VARCHAR(255)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS campus VARCHAR(255)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS study_mode VARCHAR(20)",
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS start_date DATE",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_course ON document_chunks (course)",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_city ON document_chunks (city)",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_campus ON document_chunks (campus)",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_study_mode ON document_chunks (study_mode)",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_start_date ON document_chunks (start_date)",
+    "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_message_id INTEGER",
+]
+
+
 # Async function để tạo tables
 async def create_tables():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Mỗi patch 1 transaction riêng: 1 patch lỗi (VD pgvector cũ) không chặn app khởi động
+    for statement in SCHEMA_PATCHES:
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(statement))
+        except Exception as e:
+            print(f"⚠️ [DB] Schema patch lỗi: {statement[:80]}... → {e}")
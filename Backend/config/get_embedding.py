@@ -1,66 +1,249 @@
+"""
+Embedding service dùng chung toàn process
+- Client sống lâu: tái sử dụng connection pool HTTP, không tạo / đóng client mỗi lần gọi
+- Giới hạn số request đồng thời theo provider bằng Semaphore (thay cho ThreadPoolExecutor(max_workers=1))
+- Cache 2 tầng theo hash của text đã chuẩn hóa:
+    1. LRU trong process (nhanh nhất, không I/O)
+    2. Redis lưu vector float32 dạng bytes (dùng chung giữa các worker, sống qua restart)
+"""
+import asyncio
+import hashlib
 import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
 import numpy as np
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
-import numpy as np
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from config.redis_cache import async_cache_get, async_cache_set
 
 # Load biến môi trường
 load_dotenv()
 
-# Thread pool để chạy sync operations
-thread_pool = ThreadPoolExecutor(max_workers=1)
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 16))
+EMBEDDING_LRU_SIZE = int(os.getenv("EMBEDDING_LRU_SIZE", 1024))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+# Số input tối đa trong 1 request embedding (OpenAI cho phép tối đa 2048)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 128))
 
-async def get_embedding_gemini(text: str) -> np.ndarray | None:
+
+# Số chiều của vector rút gọn dùng cho index ANN (HNSW của pgvector chỉ hỗ trợ tối đa 2000 chiều)
+ANN_DIMENSIONS = int(os.getenv("ANN_DIMENSIONS", 1536))
+
+
+def reduce_embedding(vector, dimensions: int = ANN_DIMENSIONS) -> np.ndarray:
     """
-    Async version của get_embedding_gemini
-    Sử dụng ThreadPoolExecutor để không block event loop
+    Rút gọn embedding text-embedding-3-* bằng cách cắt lấy `dimensions` chiều đầu
+    rồi chuẩn hóa L2 (tương đương tham số `dimensions` của OpenAI API, không cần gọi lại API)
     """
-    if not text or not text.strip():
-        return None
-    
-    def _get_gemini_embedding():
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        response = genai.embed_content(
-            model="gemini-embedding-001",
-            content=text
+    reduced = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = np.linalg.norm(reduced)
+    return reduced / norm if norm > 0 else reduced
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa text trước khi hash: Unicode NFC, gộp khoảng trắng, chữ thường"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EmbeddingLRU:
+    """LRU cache đơn giản trong process: key → np.ndarray (read-only)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vector = self._data.get(key)
+        if vector is not None:
+            self._data.move_to_end(key)
+        return vector
+
+    def set(self, key: str, vector: np.ndarray):
+        self._data[key] = vector
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class EmbeddingService:
+    """Interface chung: embed(text) -> np.ndarray float32 | None"""
+
+    provider = None
+
+    def __init__(self, model: str):
+        self.model = model
+        self.semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+        self.lru = EmbeddingLRU(EMBEDDING_LRU_SIZE)
+        self.hits = {"lru": 0, "redis": 0, "miss": 0}
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"embedding:{self.provider}:{self.model}:{digest}"
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        if not text or not text.strip():
+            return None
+
+        key = self.cache_key(text)
+
+        # Tầng 1: LRU trong process
+        vector = self.lru.get(key)
+        if vector is not None:
+            self.hits["lru"] += 1
+            return vector
+
+        # Tầng 2: Redis (namespace "embedding" → codec float32 bytes)
+        vector = await async_cache_get(key)
+        if vector is not None and vector.size:
+            self.lru.set(key, vector)
+            self.hits["redis"] += 1
+            return vector
+
+        # Miss: gọi API
+        self.hits["miss"] += 1
+        async with self.semaphore:
+            vector = await self._embed(text)
+        if vector is None:
+            return None
+
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        self.lru.set(key, vector)
+        await async_cache_set(key, vector, ttl=EMBEDDING_CACHE_TTL)
+        return vector
+
+    async def embed_many(self, texts: List[str], batch_size: int = None, use_cache: bool = True) -> List[Optional[np.ndarray]]:
+        """
+        Embedding nhiều text: gom các text chưa có trong cache thành batch
+        (nhiều input / 1 request), các batch chạy song song trong giới hạn semaphore
+        - Chỉ dùng tầng LRU (không đọc / ghi Redis từng key cho batch lớn)
+        - use_cache=False: bỏ qua cache (VD ingest hàng nghìn chunk không nên
+          đẩy các câu hỏi hay gặp ra khỏi LRU)
+        """
+        batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        pending = []
+        for i, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            if use_cache:
+                vector = self.lru.get(self.cache_key(text))
+                if vector is not None:
+                    self.hits["lru"] += 1
+                    results[i] = vector
+                    continue
+            pending.append(i)
+
+        async def _run_batch(indexes):
+            async with self.semaphore:
+                vectors = await self._embed_batch([texts[i] for i in indexes])
+            for i, vector in zip(indexes, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                vector.flags.writeable = False
+                results[i] = vector
+                if use_cache:
+                    self.lru.set(self.cache_key(texts[i]), vector)
+
+        self.hits["miss"] += len(pending)
+        await asyncio.gather(*[
+            _run_batch(pending[start:start + batch_size])
+            for start in range(0, len(pending), batch_size)
+        ])
+        return results
+
+    async def _embed(self, text: str):
+        vectors = await self._embed_batch([text])
+        return vectors[0] if vectors else None
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError("Subclass must implement _embed_batch method")
+
+
+class OpenAIEmbeddingService(EmbeddingService):
+    provider = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-large"):
+        super().__init__(model)
+        self._client: Optional[AsyncOpenAI] = None
+        self._api_key = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Tạo lại client nếu OPENAI_API_KEY thay đổi
+        api_key = os.getenv("OPENAI_API_KEY")
+        if self._client is None or api_key != self._api_key:
+            self._client = AsyncOpenAI(api_key=api_key)
+            self._api_key = api_key
+        return self._client
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        # API trả về theo index, sort lại cho chắc chắn đúng thứ tự input
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class GeminiEmbeddingService(EmbeddingService):
+    provider = "gemini"
+
+    def __init__(self, model: str = "gemini-embedding-001"):
+        super().__init__(model)
+        self._client = None
+        self._api_key = None
+
+    @property
+    def client(self):
+        # Client riêng → không đụng genai.configure() toàn cục của lớp completion
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if self._client is None or api_key != self._api_key:
+            self._client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+            self._api_key = api_key
+        return self._client
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = await genai.embed_content_async(
+            model=self.model,
+            content=texts,
+            client=self.client
         )
-        return np.array(response["embedding"], dtype=np.float32)
-    
-    try:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(thread_pool, _get_gemini_embedding)
-    except Exception as e:
-        print(f"Error getting Gemini embedding: {e}")
-        return None
+        return response["embedding"]
 
 
+_services: Dict[str, EmbeddingService] = {}
 
 
+def get_embedding_service(provider: str) -> EmbeddingService:
+    if provider not in _services:
+        _services[provider] = {
+            "openai": OpenAIEmbeddingService,
+            "gemini": GeminiEmbeddingService,
+        }[provider]()
+    return _services[provider]
 
 
-async def get_embedding_chatgpt(text: str) -> np.ndarray | None:
-    """
-    Async version của get_embedding_chatgpt
-    Sử dụng AsyncOpenAI client
-    """
-    if not text or not text.strip():
+async def get_embedding_gemini(text: str) -> np.ndarray | None:
+    """Embedding Gemini (gemini-embedding-001) qua service dùng chung"""
+    try:
+        return await get_embedding_service("gemini").embed(text)
+    except Exception as e:
+        print(f"Error getting Gemini embedding: {e}")
         return None
 
+
+async def get_embedding_chatgpt(text: str) -> np.ndarray | None:
+    """Embedding OpenAI (text-embedding-3-large) qua service dùng chung"""
     try:
-        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = await client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
-        )
-        await client.close()
-        
-        if not response.data or not response.data[0].embedding:
-            return None
-        
-        return np.array(response.data[0].embedding, dtype=np.float32)
+        return await get_embedding_service("openai").embed(text)
     except Exception as e:
         print(f"Error getting ChatGPT embedding: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_embeddings_chatgpt(texts: List[str], batch_size: int = None, use_cache: bool = True) -> List[Optional[np.ndarray]]:
+    """Embedding OpenAI cho nhiều text (batch), giữ nguyên thứ tự input. Lỗi API → raise"""
+    return await get_embedding_service("openai").embed_many(texts, batch_size, use_cache)
@@ -0,0 +1,165 @@
+"""
+Cache 2 tầng cho cấu hình gần như không đổi (LLM, field_config, token bot...)
+
+- L1: dict trong process (TTL + LRU), đọc không tốn round-trip nào
+- L2: Redis (config/redis_cache.py), dùng chung giữa các worker
+- Nguồn: hàm loader (query Postgres) khi cả 2 tầng đều miss
+
+Khi ghi (service llm / field_config / bot...) gọi invalidate(key): xóa L1 + L2 và publish lên
+kênh Redis INVALIDATION_CHANNEL → mọi worker uvicorn đang chạy start_invalidation_listener()
+xóa L1 của mình. Mất kết nối pub/sub thì xóa toàn bộ L1 khi kết nối lại (có thể đã lỡ tin
+invalidate); Redis chết hẳn thì LOCAL_CACHE_TTL giới hạn thời gian dữ liệu cũ.
+
+Giá trị phải serialize được JSON (L2 lưu JSON) → cache dict, không cache ORM object.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from redis import asyncio as aioredis
+from dotenv import load_dotenv
+from config.redis_cache import async_cache_get, async_cache_set, async_cache_write_many, redis_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 60))
+LOCAL_CACHE_MAX_SIZE = int(os.getenv("LOCAL_CACHE_MAX_SIZE", 1024))
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Key dùng chung giữa các module
+LLM_CONFIG_KEY = "llm_config:1"
+FIELD_CONFIGS_KEY = "field_configs:required_optional"
+
+
+def bot_token_key(platform: str, bot_id) -> str:
+    return f"bot_token:{platform}:{bot_id}"
+
+
+class LocalCache:
+    """TTL + LRU, chỉ dùng trong 1 event loop nên không cần lock"""
+
+    def __init__(self, max_size: int = LOCAL_CACHE_MAX_SIZE, default_ttl: int = LOCAL_CACHE_TTL):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str):
+        """(True, value) nếu hit, (False, None) nếu miss / hết hạn"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self._data[key] = (value, time.monotonic() + (ttl or self.default_ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+local_cache = LocalCache()
+
+
+async def cached(key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[int] = None,
+                 redis_ttl: Optional[int] = None, shared: bool = True) -> Any:
+    """
+    L1 → L2 (Redis) → loader(); kết quả None không được cache
+
+    Args:
+        ttl: TTL của L1 (giây), mặc định LOCAL_CACHE_TTL
+        redis_ttl: TTL của L2 (giây), mặc định REDIS_DEFAULT_TTL
+        shared: False → bỏ qua L2 (dữ liệu nhạy cảm như API key / access token không chép sang Redis)
+    """
+    hit, value = local_cache.get(key)
+    if hit:
+        return value
+
+    value = await async_cache_get(key) if shared else None
+    if value is None:
+        value = await loader()
+        if value is None:
+            return None
+        if shared:
+            await async_cache_set(key, value, redis_ttl)
+    local_cache.set(key, value, ttl)
+    return value
+
+
+async def invalidate(*keys: str):
+    """Xóa key ở L1 + L2 của process này và báo các worker khác xóa L1"""
+    local_cache.delete(*keys)
+    await async_cache_write_many(delete_keys=keys)
+    try:
+        client = await redis_cache.get_async_client()
+        if client is not None:
+            await client.publish(INVALIDATION_CHANNEL, json.dumps(list(keys)))
+    except Exception as e:
+        logger.error(f"Error publishing cache invalidation {keys}: {e}")
+
+
+async def _listen():
+    # Kết nối riêng, không đặt socket_timeout vì pub/sub chờ tin nhắn vô thời hạn
+    client = aioredis.from_url(
+        redis_cache.redis_url,
+        password=redis_cache.redis_password,
+        decode_responses=True,
+        socket_connect_timeout=5,
+        health_check_interval=30,
+    )
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        # Có thể đã lỡ tin invalidate trong lúc mất kết nối
+        local_cache.clear()
+        print(f"📡 [CACHE] Đang nghe invalidation trên kênh {INVALIDATION_CHANNEL}")
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                local_cache.delete(*json.loads(message["data"]))
+            except (TypeError, ValueError):
+                local_cache.clear()
+    finally:
+        await pubsub.close()
+        await client.close()
+
+
+async def _listen_forever():
+    delay = 1
+    while True:
+        try:
+            await _listen()
+            delay = 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ [CACHE] Mất kết nối pub/sub invalidation, thử lại sau {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+def start_invalidation_listener():
+    """Gọi 1 lần lúc startup của mỗi worker"""
+    global _listener_task
+    if _listener_task is None or _listener_task.done():
+        _listener_task = asyncio.create_task(_listen_forever())
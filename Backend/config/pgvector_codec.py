@@ -0,0 +1,43 @@
+"""
+Truyền vector pgvector dạng nhị phân qua asyncpg
+
+Mặc định pgvector.sqlalchemy.Vector đổi ndarray → chuỗi "[0.1,0.2,...]" (3072 lần float → str)
+rồi Postgres lại parse chuỗi đó. Module này:
+- Đăng ký codec binary của pgvector cho kiểu `vector` trên mọi connection asyncpg
+  (float32 big-endian, ~12KB cho 3072 chiều, không parse text ở cả 2 đầu)
+- BinaryVector: kiểu cột giống Vector nhưng đưa thẳng ndarray xuống codec
+"""
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from pgvector.utils import from_db, from_db_binary, to_db_binary
+
+
+def encode_vector(value):
+    # Vẫn nhận chuỗi "[...]" để code cũ / câu SQL viết tay không bị lỗi
+    if isinstance(value, str):
+        value = from_db(value)
+    return to_db_binary(value)
+
+
+async def register_vector_codec(connection):
+    await connection.set_type_codec(
+        "vector",
+        encoder=encode_vector,
+        decoder=from_db_binary,
+        format="binary"
+    )
+
+
+class BinaryVector(Vector):
+    """Vector(dim) nhưng bind ndarray float32 trực tiếp cho codec binary"""
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            value = np.asarray(value, dtype=np.float32)
+            if self.dim is not None and value.shape[0] != self.dim:
+                raise ValueError('expected %d dimensions, not %d' % (self.dim, value.shape[0]))
+            return value
+        return process
@@ -1,9 +1,19 @@
 import redis
 import json
 import asyncio
+import functools
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
 from redis import asyncio as aioredis
-from typing import Any, Optional
+from typing import Any, Dict, Iterable, List, Optional
 from dotenv import load_dotenv
+from config.cache_codecs import decode_value, encode_value
 import os
 import logging
 
@@ -22,8 +32,15 @@ class RedisCache:
 
         # Sync Redis client
         self._sync_client: Optional[redis.Redis] = None
+        # Sync Redis client trả về bytes (get / set qua codec)
+        self._sync_binary_client: Optional[redis.Redis] = None
         # Async Redis client
         self._async_client: Optional[aioredis.Redis] = None
+        # Async Redis client trả về bytes (dùng cho dữ liệu nhị phân như embedding)
+        self._async_binary_client: Optional[aioredis.Redis] = None
+
+        # Số connection tối đa của pool async (dùng chung giữa các request)
+        self.max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
 
         # Default TTL (Time To Live) - 1 hour
         self.default_ttl = int(os.getenv("REDIS_DEFAULT_TTL", 3600))
@@ -51,6 +68,28 @@ class RedisCache:
                 self._sync_client = None
         return self._sync_client
 
+    def get_sync_binary_client(self) -> redis.Redis:
+        if self._sync_binary_client is None:
+            try:
+                self._sync_binary_client = redis.Redis(
+                    host=self.redis_host,
+                    port=self.redis_port,
+                    db=self.redis_db,
+                    password=self.redis_password,
+                    decode_responses=False,
+                    socket_connect_timeout=5,
+                    socket_timeout=5,
+                    retry_on_timeout=True,
+                    health_check_interval=30,
+                )
+                # Test connection
+                self._sync_binary_client.ping()
+                logger.info("Redis sync binary connection established successfully")
+            except Exception as e:
+                logger.error(f"Failed to connect to Redis sync binary: {e}")
+                self._sync_binary_client = None
+        return self._sync_binary_client
+
     # ================== ASYNC CLIENT ==================
     async def get_async_client(self) -> aioredis.Redis:
         if self._async_client is None:
@@ -63,6 +102,7 @@ class RedisCache:
                     socket_timeout=5,
                     retry_on_timeout=True,
                     health_check_interval=30,
+                    max_connections=self.max_connections,
                 )
                 # Test connection
                 await self._async_client.ping()
@@ -72,37 +112,47 @@ class RedisCache:
                 self._async_client = None
         return self._async_client
 
+    async def get_async_binary_client(self) -> aioredis.Redis:
+        if self._async_binary_client is None:
+            try:
+                self._async_binary_client = aioredis.from_url(
+                    self.redis_url,
+                    password=self.redis_password,
+                    decode_responses=False,
+                    socket_connect_timeout=5,
+                    socket_timeout=5,
+                    retry_on_timeout=True,
+                    health_check_interval=30,
+                    max_connections=self.max_connections,
+                )
+                # Test connection
+                await self._async_binary_client.ping()
+                logger.info("Redis async binary connection established successfully")
+            except Exception as e:
+                logger.error(f"Failed to connect to Redis async binary: {e}")
+                self._async_binary_client = None
+        return self._async_binary_client
+
     # ================== SYNC OPERATIONS ==================
+    # get / set / mget... encode giá trị bằng codec theo namespace của key (config/cache_codecs.py)
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         try:
-            client = self.get_sync_client()
+            client = self.get_sync_binary_client()
             if client is None:
                 return False
 
             ttl = ttl or self.default_ttl
-
-            if not isinstance(value, str):
-                value = json.dumps(value, ensure_ascii=False)
-
-            return client.setex(key, ttl, value)
+            return client.setex(key, ttl, encode_value(key, value))
         except Exception as e:
             logger.error(f"Error setting cache key {key}: {e}")
             return False
 
     def get(self, key: str) -> Optional[Any]:
         try:
-            client = self.get_sync_client()
+            client = self.get_sync_binary_client()
             if client is None:
                 return None
-
-            value = client.get(key)
-            if value is None:
-                return None
-
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
+            return decode_value(key, client.get(key))
         except Exception as e:
             logger.error(f"Error getting cache key {key}: {e}")
             return None
@@ -140,34 +190,22 @@ class RedisCache:
     # ================== ASYNC OPERATIONS ==================
     async def async_set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         try:
-            client = await self.get_async_client()
+            client = await self.get_async_binary_client()
             if client is None:
                 return False
 
             ttl = ttl or self.default_ttl
-
-            if not isinstance(value, str):
-                value = json.dumps(value, ensure_ascii=False)
-
-            return await client.setex(key, ttl, value)
+            return await client.setex(key, ttl, encode_value(key, value))
         except Exception as e:
             logger.error(f"Error async setting cache key {key}: {e}")
             return False
 
     async def async_get(self, key: str) -> Optional[Any]:
         try:
-            client = await self.get_async_client()
+            client = await self.get_async_binary_client()
             if client is None:
                 return None
-
-            value = await client.get(key)
-            if value is None:
-                return None
-
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
+            return decode_value(key, await client.get(key))
         except Exception as e:
             logger.error(f"Error async getting cache key {key}: {e}")
             return None
@@ -192,6 +230,60 @@ class RedisCache:
             logger.error(f"Error async checking cache key {key}: {e}")
             return False
 
+    async def async_mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Đọc nhiều key trong 1 round-trip (MGET), key không có / lỗi → None"""
+        if not keys:
+            return []
+        try:
+            client = await self.get_async_binary_client()
+            if client is None:
+                return [None] * len(keys)
+            return [decode_value(key, value) for key, value in zip(keys, await client.mget(keys))]
+        except Exception as e:
+            logger.error(f"Error async mget keys {keys}: {e}")
+            return [None] * len(keys)
+
+    async def async_write_many(self, items: Optional[Dict[str, Any]] = None, ttl: Optional[int] = None,
+                               delete_keys: Iterable[str] = ()) -> bool:
+        """SETEX nhiều key + DEL nhiều key trong 1 round-trip (pipeline, không transaction)"""
+        items, delete_keys = items or {}, list(delete_keys)
+        if not items and not delete_keys:
+            return True
+        try:
+            client = await self.get_async_binary_client()
+            if client is None:
+                return False
+            pipe = client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.setex(key, ttl or self.default_ttl, encode_value(key, value))
+            if delete_keys:
+                pipe.delete(*delete_keys)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error async writing keys {list(items) + delete_keys}: {e}")
+            return False
+
+    async def async_set_bytes(self, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        try:
+            client = await self.get_async_binary_client()
+            if client is None:
+                return False
+            return await client.setex(key, ttl or self.default_ttl, value)
+        except Exception as e:
+            logger.error(f"Error async setting bytes key {key}: {e}")
+            return False
+
+    async def async_get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            client = await self.get_async_binary_client()
+            if client is None:
+                return None
+            return await client.get(key)
+        except Exception as e:
+            logger.error(f"Error async getting bytes key {key}: {e}")
+            return None
+
     # ================== UTILITY ==================
     def flush_all(self) -> bool:
         try:
@@ -219,9 +311,15 @@ class RedisCache:
             if self._sync_client:
                 self._sync_client.close()
                 self._sync_client = None
+            if self._sync_binary_client:
+                self._sync_binary_client.close()
+                self._sync_binary_client = None
             if self._async_client:
                 asyncio.create_task(self._async_client.close())
                 self._async_client = None
+            if self._async_binary_client:
+                asyncio.create_task(self._async_binary_client.close())
+                self._async_binary_client = None
         except Exception as e:
             logger.error(f"Error closing Redis connections: {e}")
 
@@ -262,42 +360,388 @@ async def async_cache_exists(key: str) -> bool:
     return await redis_cache.async_exists(key)
 
 
+async def async_cache_mget(keys: List[str]) -> List[Optional[Any]]:
+    return await redis_cache.async_mget(keys)
+
+
+async def async_cache_write_many(items: Optional[Dict[str, Any]] = None, ttl: Optional[int] = None,
+                                 delete_keys: Iterable[str] = ()) -> bool:
+    return await redis_cache.async_write_many(items, ttl, delete_keys)
+
+
+async def async_cache_set_bytes(key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+    return await redis_cache.async_set_bytes(key, value, ttl)
+
+
+async def async_cache_get_bytes(key: str) -> Optional[bytes]:
+    return await redis_cache.async_get_bytes(key)
+
+
 # ================== DECORATORS ==================
-def cache_result(key_prefix: str, ttl: Optional[int] = None):
+# Entry của decorator lưu trong Redis: {"v": kết quả, "fresh_until": epoch, "neg": True nếu kết quả None}
+# - còn fresh                     → trả ngay (hit / negative hit)
+# - hết fresh, còn trong stale_ttl → trả giá trị cũ + làm mới nền (stale-while-revalidate)
+# - không có                      → chỉ 1 request tính (single-flight trong process + lock Redis giữa
+#                                   các worker), các request khác chờ kết quả thay vì cùng query DB
+# - invalidate()                  → tăng generation {key}:gen + xóa entry; kết quả tính xong chỉ được ghi
+#                                   (Lua) nếu generation chưa đổi kể từ lúc bắt đầu tính → lần tính /
+#                                   làm mới nền đang chạy dở không ghi đè giá trị cũ lên sau invalidate
+# Key = prefix:module.hàm:blake2b(JSON chuẩn hóa của tham số) → giống nhau giữa các worker và sau restart
+# (hash() của Python bị random theo PYTHONHASHSEED). Tham số phải encode JSON được: KHÔNG truyền db
+# session / object vào hàm được cache (hàm tự mở AsyncSessionLocal), vì làm mới nền chạy sau khi request
+# đã kết thúc.
+
+CACHE_LOCK_POLL_INTERVAL = 0.05
+# Generation phải sống lâu hơn mọi lần tính đang chạy (hết hạn giữa chừng → ghi nhầm giá trị cũ)
+CACHE_GENERATION_TTL = 86400
+
+_LOCK_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Ghi entry chỉ khi generation không đổi (ARGV[1] = generation đọc lúc bắt đầu tính, "" = chưa có)
+_SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+_INVALIDATE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return redis.call('DEL', KEYS[1])
+"""
+
+# Bộ đếm theo từng hàm được cache (trong process): hits, stale_hits, negative_hits, misses, loads,
+# lock_waits, errors
+_cache_stats: Dict[str, Counter] = defaultdict(Counter)
+
+# Trả về bởi lần làm mới nền khi worker khác đang giữ lock
+_NOT_LOADED = object()
+
+
+def _canonical_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    raise TypeError(f"Không tạo được cache key ổn định cho tham số kiểu {type(value).__name__}")
+
+
+def make_cache_key(key_prefix: str, func, args: tuple, kwargs: dict) -> str:
+    payload = json.dumps(
+        [list(args), kwargs],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=_canonical_default,
+    )
+    digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{key_prefix}:{func.__module__}.{func.__qualname__}:{digest}"
+
+
+def _generation_key(cache_key: str) -> str:
+    return f"{cache_key}:gen"
+
+
+def _read_generation(client, cache_key: str) -> Optional[str]:
+    """Generation hiện tại ("" nếu chưa invalidate lần nào), None nếu không dùng được Redis"""
+    if client is None:
+        return None
+    try:
+        return client.get(_generation_key(cache_key)) or ""
+    except Exception as e:
+        logger.error(f"Error reading cache generation {cache_key}: {e}")
+        return None
+
+
+def _write_entry(client, cache_key: str, entry: dict, entry_ttl: int, generation: Optional[str]) -> bool:
+    if client is None or generation is None:
+        return False
+    try:
+        written = client.eval(
+            _SET_IF_GENERATION_SCRIPT, 2, cache_key, _generation_key(cache_key),
+            generation, encode_value(cache_key, entry), entry_ttl,
+        )
+        return bool(written)
+    except Exception as e:
+        logger.error(f"Error setting cache key {cache_key}: {e}")
+        return False
+
+
+def _invalidate(client, cache_key: str) -> bool:
+    try:
+        if client is None:
+            return False
+        return bool(client.eval(_INVALIDATE_SCRIPT, 2, cache_key, _generation_key(cache_key), CACHE_GENERATION_TTL))
+    except Exception as e:
+        logger.error(f"Error invalidating cache key {cache_key}: {e}")
+        return False
+
+
+async def _async_read_generation(client, cache_key: str) -> Optional[str]:
+    if client is None:
+        return None
+    try:
+        return await client.get(_generation_key(cache_key)) or ""
+    except Exception as e:
+        logger.error(f"Error reading cache generation {cache_key}: {e}")
+        return None
+
+
+async def _async_write_entry(client, cache_key: str, entry: dict, entry_ttl: int,
+                             generation: Optional[str]) -> bool:
+    if client is None or generation is None:
+        return False
+    try:
+        written = await client.eval(
+            _SET_IF_GENERATION_SCRIPT, 2, cache_key, _generation_key(cache_key),
+            generation, encode_value(cache_key, entry), entry_ttl,
+        )
+        return bool(written)
+    except Exception as e:
+        logger.error(f"Error setting cache key {cache_key}: {e}")
+        return False
+
+
+async def _async_invalidate(client, cache_key: str) -> bool:
+    try:
+        if client is None:
+            return False
+        return bool(await client.eval(
+            _INVALIDATE_SCRIPT, 2, cache_key, _generation_key(cache_key), CACHE_GENERATION_TTL
+        ))
+    except Exception as e:
+        logger.error(f"Error invalidating cache key {cache_key}: {e}")
+        return False
+
+
+def _make_entry(result: Any, ttl: int, stale_ttl: int, negative_ttl: int):
+    """(entry, TTL Redis), entry None nếu kết quả không được cache"""
+    if result is None:
+        if not negative_ttl:
+            return None, 0
+        return {"v": None, "fresh_until": time.time() + negative_ttl, "neg": True}, negative_ttl
+    return {"v": result, "fresh_until": time.time() + ttl, "neg": False}, ttl + stale_ttl
+
+
+def _as_entry(value: Any) -> Optional[dict]:
+    return value if isinstance(value, dict) and "fresh_until" in value and "v" in value else None
+
+
+def _count_hit(stats: Counter, entry: dict) -> bool:
+    """Đếm hit, True nếu entry đã stale (cần làm mới)"""
+    if entry["fresh_until"] > time.time():
+        stats["negative_hits" if entry.get("neg") else "hits"] += 1
+        return False
+    stats["stale_hits"] += 1
+    return True
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Bộ đếm hit/miss của các hàm dùng cache_result / async_cache_result (riêng từng worker)"""
+    stats = {}
+    for name, counter in _cache_stats.items():
+        served = counter["hits"] + counter["stale_hits"] + counter["negative_hits"]
+        total = served + counter["misses"]
+        stats[name] = {**counter, "hit_ratio": round(served / total, 3) if total else None}
+    return stats
+
+
+def cache_result(key_prefix: str, ttl: Optional[int] = None, stale_ttl: int = 0,
+                 negative_ttl: int = 30, lock_timeout: int = 30):
+    """
+    Cache kết quả hàm sync trong Redis
+
+    Args:
+        ttl: thời gian kết quả còn fresh (giây), mặc định REDIS_DEFAULT_TTL
+        stale_ttl: thêm bao lâu sau ttl vẫn trả giá trị cũ trong lúc 1 thread làm mới
+        negative_ttl: cache kết quả None bao lâu (0 = không cache None)
+        lock_timeout: thời gian giữ lock khi tính lại / thời gian tối đa chờ request khác tính
+    """
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            cache_key = f"{key_prefix}:{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
-
-            cached_result = cache_get(cache_key)
-            if cached_result is not None:
-                return cached_result
+        stats = _cache_stats[f"{key_prefix}:{func.__module__}.{func.__qualname__}"]
+        fresh_ttl = ttl or redis_cache.default_ttl
 
-            result = func(*args, **kwargs)
-            if result is not None:
-                cache_set(cache_key, result, ttl)
+        def lock(lock_key: str, token: str) -> Optional[bool]:
+            """True: giữ lock, False: request khác đang giữ, None: không dùng được Redis"""
+            try:
+                client = redis_cache.get_sync_client()
+                if client is None:
+                    return None
+                return bool(client.set(lock_key, token, nx=True, ex=lock_timeout))
+            except Exception as e:
+                logger.error(f"Error acquiring cache lock {lock_key}: {e}")
+                return None
 
-            return result
+        def unlock(lock_key: str, token: str):
+            try:
+                client = redis_cache.get_sync_client()
+                if client is not None:
+                    client.eval(_LOCK_RELEASE_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                logger.error(f"Error releasing cache lock {lock_key}: {e}")
+
+        def load(cache_key: str, args: tuple, kwargs: dict, wait: bool):
+            lock_key, token = f"{cache_key}:lock", uuid.uuid4().hex
+            locked = lock(lock_key, token)
+            if locked is False:
+                if not wait:
+                    return _NOT_LOADED
+                stats["lock_waits"] += 1
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(CACHE_LOCK_POLL_INTERVAL)
+                    entry = _as_entry(redis_cache.get(cache_key))
+                    if entry is not None:
+                        return entry["v"]
+            try:
+                stats["loads"] += 1
+                generation = _read_generation(redis_cache.get_sync_client(), cache_key)
+                result = func(*args, **kwargs)
+                entry, entry_ttl = _make_entry(result, fresh_ttl, stale_ttl, negative_ttl)
+                if entry is not None:
+                    _write_entry(redis_cache.get_sync_client(), cache_key, entry, entry_ttl, generation)
+                return result
+            except Exception:
+                stats["errors"] += 1
+                raise
+            finally:
+                if locked:
+                    unlock(lock_key, token)
+
+        def refresh(cache_key: str, args: tuple, kwargs: dict):
+            try:
+                load(cache_key, args, kwargs, wait=False)
+            except Exception as e:
+                logger.error(f"Error refreshing cache key {cache_key}: {e}")
 
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = make_cache_key(key_prefix, func, args, kwargs)
+            entry = _as_entry(redis_cache.get(cache_key))
+            if entry is not None:
+                if _count_hit(stats, entry):
+                    threading.Thread(target=refresh, args=(cache_key, args, kwargs), daemon=True).start()
+                return entry["v"]
+            stats["misses"] += 1
+            return load(cache_key, args, kwargs, wait=True)
+
+        def invalidate(*args, **kwargs) -> bool:
+            return _invalidate(redis_cache.get_sync_client(), make_cache_key(key_prefix, func, args, kwargs))
+
+        wrapper.invalidate = invalidate
         return wrapper
 
     return decorator
 
 
-def async_cache_result(key_prefix: str, ttl: Optional[int] = None):
-    def decorator(func):
-        async def wrapper(*args, **kwargs):
-            cache_key = f"{key_prefix}:{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
+def async_cache_result(key_prefix: str, ttl: Optional[int] = None, stale_ttl: int = 0,
+                       negative_ttl: int = 30, lock_timeout: int = 30):
+    """
+    Cache kết quả coroutine trong Redis (tham số giống cache_result)
 
-            cached_result = await async_cache_get(cache_key)
-            if cached_result is not None:
-                return cached_result
+    Các request cùng key trong 1 process dùng chung 1 task tính, làm mới nền chạy bằng asyncio task.
+    Xóa cache: await func.invalidate(<cùng tham số>)
+    """
+    def decorator(func):
+        stats = _cache_stats[f"{key_prefix}:{func.__module__}.{func.__qualname__}"]
+        fresh_ttl = ttl or redis_cache.default_ttl
+        # cache_key → task đang tính trong process này (single-flight)
+        inflight: Dict[str, asyncio.Task] = {}
 
-            result = await func(*args, **kwargs)
-            if result is not None:
-                await async_cache_set(cache_key, result, ttl)
+        async def lock(lock_key: str, token: str) -> Optional[bool]:
+            """True: giữ lock, False: worker khác đang giữ, None: không dùng được Redis"""
+            try:
+                client = await redis_cache.get_async_client()
+                if client is None:
+                    return None
+                return bool(await client.set(lock_key, token, nx=True, ex=lock_timeout))
+            except Exception as e:
+                logger.error(f"Error acquiring cache lock {lock_key}: {e}")
+                return None
 
+        async def unlock(lock_key: str, token: str):
+            try:
+                client = await redis_cache.get_async_client()
+                if client is not None:
+                    await client.eval(_LOCK_RELEASE_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                logger.error(f"Error releasing cache lock {lock_key}: {e}")
+
+        async def load(cache_key: str, args: tuple, kwargs: dict, wait: bool):
+            lock_key, token = f"{cache_key}:lock", uuid.uuid4().hex
+            locked = await lock(lock_key, token)
+            if locked is False:
+                if not wait:
+                    return _NOT_LOADED
+                stats["lock_waits"] += 1
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+                    entry = _as_entry(await redis_cache.async_get(cache_key))
+                    if entry is not None:
+                        return entry["v"]
+            try:
+                stats["loads"] += 1
+                generation = await _async_read_generation(await redis_cache.get_async_client(), cache_key)
+                result = await func(*args, **kwargs)
+                entry, entry_ttl = _make_entry(result, fresh_ttl, stale_ttl, negative_ttl)
+                if entry is not None:
+                    await _async_write_entry(
+                        await redis_cache.get_async_client(), cache_key, entry, entry_ttl, generation
+                    )
+                return result
+            except Exception:
+                stats["errors"] += 1
+                raise
+            finally:
+                if locked:
+                    await unlock(lock_key, token)
+
+        def start(cache_key: str, args: tuple, kwargs: dict, wait: bool) -> asyncio.Task:
+            task = inflight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(load(cache_key, args, kwargs, wait))
+                inflight[cache_key] = task
+                task.add_done_callback(lambda done: done_callback(cache_key, done))
+            return task
+
+        def done_callback(cache_key: str, task: asyncio.Task):
+            inflight.pop(cache_key, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Error loading cache key {cache_key}: {task.exception()}")
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = make_cache_key(key_prefix, func, args, kwargs)
+            entry = _as_entry(await redis_cache.async_get(cache_key))
+            if entry is not None:
+                if _count_hit(stats, entry):
+                    start(cache_key, args, kwargs, wait=False)
+                return entry["v"]
+
+            stats["misses"] += 1
+            # shield: request bị hủy không hủy task mà các request khác đang chờ
+            result = await asyncio.shield(start(cache_key, args, kwargs, wait=True))
+            if result is _NOT_LOADED:
+                # Đã nhập vào lần làm mới nền (bị bỏ qua vì worker khác giữ lock) → tự chờ / tính
+                result = await load(cache_key, args, kwargs, wait=True)
             return result
 
+        async def invalidate(*args, **kwargs) -> bool:
+            return await _async_invalidate(
+                await redis_cache.get_async_client(), make_cache_key(key_prefix, func, args, kwargs)
+            )
+
+        wrapper.invalidate = invalidate
         return wrapper
 
     return decorator
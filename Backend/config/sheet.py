@@ -1,47 +1,343 @@
 import gspread
 from google.oauth2.service_account import Credentials
-from config.get_embedding import get_embedding_chatgpt, get_embedding_gemini
-from models.knowledge_base import DocumentChunk
-from config.database import AsyncSessionLocal
+from config.get_embedding import get_embeddings_chatgpt, reduce_embedding
+from helper.vietnamese import normalize_vietnamese
+from helper.chunk_metadata import METADATA_FIELDS, extract_row_metadata
+from models.knowledge_base import DocumentChunk, KnowledgeIndexState
+from config.database import AsyncSessionLocal, engine
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete, select
+from sqlalchemy import delete, select, insert, update, literal, or_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import json
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import asyncio
+import hashlib
+import os
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 # Thread pool để chạy sync operations
 thread_pool = ThreadPoolExecutor(max_workers=1)
 
 
+def chunk_hash(chunk_text: str) -> str:
+    return hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+
+
+# Chỉ 1 lần sync chạy tại 1 thời điểm (diff đọc trạng thái trước rồi mới ghi)
+_sync_lock = asyncio.Lock()
+_background_tasks = set()
+
+# Số row mỗi lệnh INSERT executemany
+INSERT_BATCH_SIZE = int(os.getenv("SHEET_INSERT_BATCH_SIZE", 500))
+# Khóa advisory Postgres cho backfill_ann_vectors (số bất kỳ, cố định)
+ANN_BACKFILL_LOCK_ID = 7310001
+
+
+async def bulk_insert_chunks(session: AsyncSession, chunks_data: list):
+    """Bulk insert DocumentChunk bằng executemany, KHÔNG commit (caller quản lý transaction)"""
+    for start in range(0, len(chunks_data), INSERT_BATCH_SIZE):
+        batch = chunks_data[start:start + INSERT_BATCH_SIZE]
+        await session.execute(insert(DocumentChunk), [
+            {
+                "chunk_text": str(d['chunk_text']),
+                "search_text": normalize_vietnamese(str(d['chunk_text'])),
+                "search_vector": d.get('search_vector'),
+                "search_vector_ann": (
+                    reduce_embedding(d['search_vector']) if d.get('search_vector') is not None else None
+                ),
+                "knowledge_base_id": d['knowledge_base_id'],
+                "content_hash": d.get('content_hash') or chunk_hash(str(d['chunk_text'])),
+                "kb_version": d.get('kb_version', 0),
+                **{field: d.get(field) for field in METADATA_FIELDS}
+            }
+            for d in batch
+        ])
+
+
 async def insert_chunks(chunks_data: list):
     async with AsyncSessionLocal() as session:
         try:
-            # Chèn từng record một
-            for d in chunks_data:
-                chunk = DocumentChunk(
-                    chunk_text=str(d['chunk_text']),
-                    search_vector=d.get('search_vector'), 
-                    knowledge_base_id=d['knowledge_base_id']
-                )
-                session.add(chunk)
-                await session.commit()  # commit ngay sau mỗi record
+            # Chèn tất cả trong 1 transaction
+            await bulk_insert_chunks(session, chunks_data)
+            await session.commit()
         except Exception as e:
             print(e)
             await session.rollback()
             raise
 
 
+def records_to_chunk_rows(all_records: list) -> list:
+    """Mỗi row của sheet → chunk dạng JSON kèm metadata của row, row quá dài thì chia nhỏ"""
+    # Nếu hàng quá dài, mới chunk, không cần overlap nhiều
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,   # nhỏ hơn chunk size trước
+        chunk_overlap=0   # tránh trộn hàng khác
+    )
+
+    all_chunks = []
+    for row in all_records:
+        # Biến row thành JSON string
+        row_str = "{ " + ",".join(
+            [f"\"{k}\":\"{v}\"" for k, v in row.items() if v not in ("", None)]
+        ) + " }"
+
+        metadata = extract_row_metadata(row)
+        for chunk in splitter.split_text(row_str):
+            all_chunks.append({"chunk_text": chunk, **metadata})
+    return all_chunks
+
+
+def records_to_chunks(all_records: list) -> list:
+    """Chỉ phần text của records_to_chunk_rows"""
+    return [chunk["chunk_text"] for chunk in records_to_chunk_rows(all_records)]
+
+
+def chunk_key(content_hash: str, metadata) -> tuple:
+    """Khóa diff: cùng text nhưng metadata khác (VD đổi cột cơ sở) vẫn tính là chunk thay đổi"""
+    return (content_hash, *(metadata[field] for field in METADATA_FIELDS))
+
+
+async def embed_chunks(chunks: list) -> list:
+    """Embedding theo batch (nhiều chunk / 1 request), các batch chạy song song có giới hạn"""
+    vectors = await get_embeddings_chatgpt(chunks, use_cache=False)
+    missing = sum(1 for v in vectors if v is None)
+    if missing:
+        raise Exception(f"Không tạo được embedding cho {missing} chunk")
+    return vectors
+
+
+async def backfill_chunk_hashes(session: AsyncSession):
+    """Chunk cũ (trước khi có cột content_hash / search_text) → tính từ chunk_text"""
+    result = await session.execute(
+        select(DocumentChunk.id, DocumentChunk.chunk_text).where(
+            or_(DocumentChunk.content_hash.is_(None), DocumentChunk.search_text.is_(None))
+        )
+    )
+    rows = result.all()
+    if rows:
+        await session.execute(
+            update(DocumentChunk),
+            [
+                {
+                    "id": row.id,
+                    "content_hash": chunk_hash(row.chunk_text),
+                    "search_text": normalize_vietnamese(row.chunk_text)
+                }
+                for row in rows
+            ]
+        )
+        print(f"🔧 [SHEET] Backfill content_hash / search_text cho {len(rows)} chunk cũ")
+
+
+async def backfill_ann_vectors(batch_size: int = INSERT_BATCH_SIZE) -> int:
+    """
+    Chunk cũ (trước khi có cột search_vector_ann) → tính vector rút gọn từ search_vector
+
+    Chạy lúc khởi động ở MỌI worker uvicorn và trước mỗi lần sync → chỉ 1 worker làm:
+    pg_try_advisory_lock trên 1 connection riêng giữ suốt lúc chạy, worker khác thấy đang
+    bị giữ thì bỏ qua (lock tự nhả nếu connection / process chết)
+    """
+    try:
+        async with engine.connect() as conn:
+            params = {"lock_id": ANN_BACKFILL_LOCK_ID}
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:lock_id)"), params):
+                print("⏭️ [SHEET] Worker khác đang backfill search_vector_ann, bỏ qua")
+                return 0
+            try:
+                return await _backfill_ann_vectors(batch_size)
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), params)
+    except Exception as e:
+        print(f"⚠️ [SHEET] Backfill search_vector_ann lỗi: {e}")
+        return 0
+
+
+async def _backfill_ann_vectors(batch_size: int) -> int:
+    total = 0
+    try:
+        while True:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(DocumentChunk.id, DocumentChunk.search_vector)
+                    .where(DocumentChunk.search_vector_ann.is_(None))
+                    .where(DocumentChunk.search_vector.is_not(None))
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+                await session.execute(
+                    update(DocumentChunk),
+                    [{"id": row.id, "search_vector_ann": reduce_embedding(row.search_vector)} for row in rows]
+                )
+                await session.commit()
+                total += len(rows)
+    except Exception as e:
+        print(f"⚠️ [SHEET] Backfill search_vector_ann lỗi: {e}")
+    if total:
+        print(f"🔧 [SHEET] Backfill search_vector_ann cho {total} chunk cũ")
+    return total
+
+
+async def get_active_version(session: AsyncSession, for_update: bool = False) -> int:
+    """Phiên bản chunk đang active, tạo row con trỏ nếu chưa có (dữ liệu cũ = version 0)"""
+    await session.execute(
+        pg_insert(KnowledgeIndexState)
+        .values(id=1, active_version=0)
+        .on_conflict_do_nothing(index_elements=["id"])
+    )
+    query = select(KnowledgeIndexState.active_version).where(KnowledgeIndexState.id == 1)
+    if for_update:
+        query = query.with_for_update()
+    result = await session.execute(query)
+    return result.scalar_one()
+
+
+async def gc_old_versions():
+    """Xóa các phiên bản chunk không còn active (chạy background sau khi flip)"""
+    try:
+        async with AsyncSessionLocal() as session:
+            active_version = await get_active_version(session)
+            result = await session.execute(
+                delete(DocumentChunk).where(DocumentChunk.kb_version != active_version)
+            )
+            await session.commit()
+            print(f"🧹 [SHEET] GC: xóa {result.rowcount} chunk của phiên bản cũ (active = {active_version})")
+    except Exception as e:
+        print(f"⚠️ [SHEET] GC phiên bản cũ lỗi: {e}")
+
+
+async def sync_chunks(all_chunks: list, knowledge_base_id: int) -> dict:
+    """
+    Đồng bộ document_chunks theo diff content_hash, ghi ra PHIÊN BẢN MỚI (blue/green)
+    - Chunk có text không đổi → copy row cũ sang phiên bản mới (dùng lại vector, không embed)
+    - Chunk mới / thay đổi → embed (batch) rồi insert vào phiên bản mới
+    - Chunk không còn trong sheet → không copy sang, bị GC cùng phiên bản cũ
+    Ghi phiên bản mới + flip con trỏ active trong 1 transaction → search luôn thấy
+    1 bộ chunk đầy đủ; phiên bản cũ được xóa ở background
+    Các lần sync trong process chạy tuần tự (lock) để diff không bị lệch
+    """
+    # Chấp nhận chuỗi (không metadata) hoặc dict từ records_to_chunk_rows
+    all_chunks = [
+        chunk if isinstance(chunk, dict) else {"chunk_text": chunk}
+        for chunk in all_chunks
+    ]
+
+    # khóa (hash + metadata) → các chunk cần có (sheet có thể có 2 row giống hệt nhau)
+    wanted = {}
+    for chunk in all_chunks:
+        key = chunk_key(chunk_hash(chunk["chunk_text"]), {f: chunk.get(f) for f in METADATA_FIELDS})
+        wanted.setdefault(key, []).append(chunk)
+
+    async with _sync_lock:
+        await backfill_ann_vectors()
+
+        # Đọc phiên bản đang active (transaction ngắn)
+        async with AsyncSessionLocal() as session:
+            await backfill_chunk_hashes(session)
+            active_version = await get_active_version(session)
+            result = await session.execute(
+                select(
+                    DocumentChunk.id,
+                    DocumentChunk.content_hash,
+                    *(getattr(DocumentChunk, field) for field in METADATA_FIELDS)
+                ).where(DocumentChunk.kb_version == active_version)
+            )
+            rows = result.all()
+            await session.commit()
+
+        existing = {}
+        for row in rows:
+            existing.setdefault(chunk_key(row.content_hash, row._mapping), []).append(row.id)
+
+        keep_ids = []
+        to_insert = []
+        deleted = 0
+        for key, ids in existing.items():
+            keep = len(wanted.get(key, []))
+            keep_ids.extend(ids[:keep])
+            deleted += max(len(ids) - keep, 0)
+        for key, chunks in wanted.items():
+            to_insert.extend(chunks[len(existing.get(key, [])):])
+
+        # Chỉ embed chunk mới / thay đổi (ngoài transaction, không giữ connection DB)
+        start = time.perf_counter()
+        vectors = await embed_chunks([chunk["chunk_text"] for chunk in to_insert]) if to_insert else []
+        embed_time = time.perf_counter() - start
+
+        # Ghi phiên bản mới + flip con trỏ trong 1 transaction
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            try:
+                # Khóa row con trỏ → sync ở worker khác phải chờ, và phát hiện nếu đã bị flip
+                current_version = await get_active_version(session, for_update=True)
+                if current_version != active_version:
+                    raise Exception(
+                        f"Phiên bản active đã đổi ({active_version} → {current_version}) trong lúc sync, vui lòng sync lại"
+                    )
+                new_version = active_version + 1
+
+                if keep_ids:
+                    await session.execute(
+                        insert(DocumentChunk).from_select(
+                            ["chunk_text", "search_text", "search_vector", "search_vector_ann",
+                             "knowledge_base_id", "content_hash", "kb_version", *METADATA_FIELDS],
+                            select(
+                                DocumentChunk.chunk_text,
+                                DocumentChunk.search_text,
+                                DocumentChunk.search_vector,
+                                DocumentChunk.search_vector_ann,
+                                literal(knowledge_base_id),
+                                DocumentChunk.content_hash,
+                                literal(new_version),
+                                *(getattr(DocumentChunk, field) for field in METADATA_FIELDS)
+                            ).where(DocumentChunk.id.in_(keep_ids))
+                        )
+                    )
+                await bulk_insert_chunks(session, [
+                    {
+                        **chunk,
+                        "search_vector": vector,
+                        "knowledge_base_id": knowledge_base_id,
+                        "kb_version": new_version
+                    }
+                    for chunk, vector in zip(to_insert, vectors)
+                ])
+                await session.execute(
+                    update(KnowledgeIndexState)
+                    .where(KnowledgeIndexState.id == 1)
+                    .values(active_version=new_version)
+                )
+                await session.commit()
+            except Exception as e:
+                print(e)
+                await session.rollback()
+                raise
+        write_time = time.perf_counter() - start
+
+    # Giữ reference tới task để không bị garbage collect giữa chừng
+    task = asyncio.create_task(gc_old_versions())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    print(
+        f"📄 [SHEET] {len(all_chunks)} chunks → version {new_version} | thêm {len(to_insert)} | xóa {deleted} | "
+        f"giữ nguyên {len(keep_ids)} | embedding: {embed_time:.1f}s | ghi DB: {write_time:.1f}s"
+    )
+    return {
+        "added": len(to_insert),
+        "deleted": deleted,
+        "unchanged": len(keep_ids),
+        "version": new_version
+    }
+
+
 async def get_sheet(sheet_id: str, id: int):
     scopes = [
         'https://www.googleapis.com/auth/spreadsheets'
     ]
     
-    async with AsyncSessionLocal() as session:
-        # Xóa tất cả dữ liệu cũ
-        await session.execute(delete(DocumentChunk))
-        await session.commit()  # commit để xác nhận bảng trống
-    
     creds = Credentials.from_service_account_file('/app/config_sheet.json', scopes=scopes)
     
     def _get_sheet_data():
@@ -61,38 +357,18 @@ async def get_sheet(sheet_id: str, id: int):
     loop = asyncio.get_event_loop()
     all_records, sheets_count = await loop.run_in_executor(thread_pool, _get_sheet_data)
 
-    all_chunks = []
+    all_chunks = records_to_chunk_rows(all_records)
 
-    for row in all_records:
-        # Biến row thành JSON string
-        row_str = "{ " + ",".join(
-            [f"\"{k}\":\"{v}\"" for k, v in row.items() if v not in ("", None)]
-        ) + " }"
-
-        # Nếu hàng quá dài, mới chunk, không cần overlap nhiều
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,   # nhỏ hơn chunk size trước
-            chunk_overlap=0   # tránh trộn hàng khác
-        )
-        row_chunks = splitter.split_text(row_str)
-        all_chunks.extend(row_chunks)
+    diff = await sync_chunks(all_chunks, id)
 
-    # Tạo vector và lưu
-    for chunk in all_chunks:
-        vector = await get_embedding_chatgpt(chunk)
-        await insert_chunks([{
-            "chunk_text": chunk,
-            "search_vector": vector.tolist(),
-            "knowledge_base_id": id
-        }])
-    
     return {
         "success": True,
-        "message": f"Đã xử lý {len(all_chunks)} chunks từ Google Sheet",
-        "chunks_created": len(all_chunks),
+        "message": (
+            f"Đã xử lý {len(all_chunks)} chunks từ Google Sheet "
+            f"(thêm {diff['added']}, xóa {diff['deleted']}, giữ nguyên {diff['unchanged']})"
+        ),
+        "chunks_created": diff["added"],
+        "chunks_deleted": diff["deleted"],
+        "chunks_unchanged": diff["unchanged"],
         "sheets_processed": sheets_count
     }
-    
-        
-        
-    
\ No newline at end of file
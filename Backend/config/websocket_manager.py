@@ -76,6 +76,14 @@ class ConnectionManager:
         for admin in disconnected:
             self.admins.remove(admin)
 
+    async def broadcast_to_session(self, session_id: int, message):
+        """
+        ✅ Gửi 1 frame đến customer của session VÀ tất cả admin
+        - Dùng cho stream câu trả lời bot (bot_delta + frame cuối)
+        """
+        await self.send_to_customer(session_id, message)
+        await self.broadcast_to_admins(message)
+
     async def broadcast_to_other_admins(self, sender_websocket: WebSocket, message): 
         """
         ✅ Gửi tin nhắn đến TẤT CẢ admin KHÁC (trừ admin đang gửi)
@@ -12,6 +12,7 @@ from services.chat_service import (
     get_all_customer_service,
     sendMessage,
     send_message_fast_service,
+    send_message_stream_service,
     get_dashboard_summary
 )
 from models.chat import ChatSession, CustomerInfo
@@ -26,8 +27,9 @@ import datetime
 import json
 import asyncio
 from llm.llm import RAGModel
+from llm.intent_router import NON_TEXT_PLACEHOLDER
 manager = ConnectionManager()
-from helper.task import extract_customer_info_background
+from helper.extraction_scheduler import schedule_customer_info_extraction
 
 
 async def create_session_controller(url_channel: str, db: AsyncSession):
@@ -88,18 +90,25 @@ async def customer_chat(websocket: WebSocket, session_id: int):
             print(f"🔧 [DB] Tạo AsyncSession mới cho session {session_id}...")
             async with AsyncSessionLocal() as db:
                 
-                # Xử lý tin nhắn nhanh (< 50ms)
                 start_service = datetime.datetime.now()
-                print(f"⚙️ [SERVICE] Gọi send_message_fast_service...")
-                res_messages = await send_message_fast_service(data, None, db)
-                service_time = (datetime.datetime.now() - start_service).total_seconds() * 1000
-                print(f"✅ [SERVICE] Hoàn tất trong {service_time:.0f}ms")
+                if data.get("stream"):
+                    # 🌊 Client bật stream → đẩy từng delta ngay khi model sinh ra
+                    print(f"⚙️ [SERVICE] Gọi send_message_stream_service...")
+                    async for frame in send_message_stream_service(data, db):
+                        await manager.broadcast_to_session(session_id, frame)
+                    service_time = (datetime.datetime.now() - start_service).total_seconds() * 1000
+                    print(f"✅ [SERVICE] Stream hoàn tất trong {service_time:.0f}ms")
+                else:
+                    # Xử lý tin nhắn nhanh (< 50ms)
+                    print(f"⚙️ [SERVICE] Gọi send_message_fast_service...")
+                    res_messages = await send_message_fast_service(data, None, db)
+                    service_time = (datetime.datetime.now() - start_service).total_seconds() * 1000
+                    print(f"✅ [SERVICE] Hoàn tất trong {service_time:.0f}ms")
 
-                # Gửi tin nhắn đến người dùng ngay lập tức
-                print(f"📤 [SEND] Gửi {len(res_messages)} tin nhắn qua WebSocket...")
-                for msg in res_messages:
-                    await manager.broadcast_to_admins(msg)
-                    await manager.send_to_customer(session_id, msg)
+                    # Gửi tin nhắn đến người dùng ngay lập tức
+                    print(f"📤 [SEND] Gửi {len(res_messages)} tin nhắn qua WebSocket...")
+                    for msg in res_messages:
+                        await manager.broadcast_to_session(session_id, msg)
                 
                 send_time = datetime.datetime.now()
                 total_time = (send_time - receive_time).total_seconds() * 1000
@@ -110,8 +119,8 @@ async def customer_chat(websocket: WebSocket, session_id: int):
             # ✅ db session đã đóng tại đây
             print(f"🔒 [DB] AsyncSession đã đóng cho session {session_id}")
             
-            # ✅ Thu thập thông tin khách hàng (background - không truyền db)
-            asyncio.create_task(extract_customer_info_background(session_id, None, manager))
+            # ✅ Thu thập thông tin khách hàng (debounce theo session, background - không truyền db)
+            schedule_customer_info_extraction(session_id, manager)
 
     except WebSocketDisconnect:
         print(f"\n{'='*70}")
@@ -212,7 +221,7 @@ def parse_telegram(body: dict):
     # Kiểm tra nếu không phải tin nhắn text
     if not text:
         # Kiểm tra các loại tin nhắn khác (photo, video, document, etc.)
-        text = "Hiện tại hệ thống chỉ hỗ trợ tin nhắn dạng text. Vui lòng gửi lại tin nhắn bằng văn bản."
+        text = NON_TEXT_PLACEHOLDER
             
 
     return {
@@ -237,7 +246,7 @@ def parse_facebook(body: dict):
     
     # Kiểm tra nếu không phải tin nhắn text
     if not message_text:
-        message_text = "Hiện tại hệ thống chỉ hỗ trợ tin nhắn dạng text. Vui lòng gửi lại tin nhắn bằng văn bản."
+        message_text = NON_TEXT_PLACEHOLDER
 
 
     return {
@@ -260,7 +269,7 @@ def parse_zalo(body: dict):
     else:
         # Xử lý các loại tin nhắn không phải text
         sender_id = body["sender"]["id"]
-        text = "Hiện tại hệ thống chỉ hỗ trợ tin nhắn dạng text. Vui lòng gửi lại tin nhắn bằng văn bản."
+        text = NON_TEXT_PLACEHOLDER
         
 
     return {
@@ -291,10 +300,10 @@ async def chat_platform(channel, body: dict, db: AsyncSession):
     for msg in message:
         await manager.broadcast_to_admins(msg)
     
-    # Thu thập thông tin khách hàng sau MỖI tin nhắn từ platform - chạy background task
+    # Thu thập thông tin khách hàng - gộp các tin nhắn liên tiếp, chạy background sau khoảng lặng
     if message:
         session_id = message[0].get("chat_session_id")
-        asyncio.create_task(extract_customer_info_background(session_id, db, manager))
+        schedule_customer_info_extraction(session_id, manager)
 
 async def delete_chat_session_controller(ids: list[int], db: AsyncSession):
     deleted_count = await delete_chat_session(ids, db)   # gọi xuống service
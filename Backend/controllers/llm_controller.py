@@ -4,7 +4,8 @@ from services.llm_service import (
     update_llm_service,
     delete_llm_service,
     get_llm_by_id_service,
-    get_all_llms_service
+    get_all_llms_service,
+    get_answer_cache_stats_service
 )
 
 async def create_llm_controller(data: dict, db: AsyncSession):
@@ -67,4 +68,7 @@ async def get_all_llms_controller(db: AsyncSession):
             "botName": l.botName
         }
         for l in llms
-    ]
\ No newline at end of file
+    ]
+
+async def get_answer_cache_stats_controller():
+    return await get_answer_cache_stats_service()
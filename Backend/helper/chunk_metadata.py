@@ -0,0 +1,105 @@
+"""
+Metadata có cấu trúc của chunk (khóa học, thành phố, cơ sở, hình thức học, ngày khai giảng)
+
+- Lúc ingest: lấy từ các cột của row Google Sheet (nhận nhiều tên cột khác nhau)
+- Lúc tìm kiếm: nhận diện bộ lọc từ câu hỏi / thông tin khách hàng để thu hẹp
+  tập chunk trước khi search vector
+
+Mọi giá trị chữ đều lưu dạng đã chuẩn hóa (helper/vietnamese.py): "Đống Đa" → "dong da",
+"HSK 5" → "hsk5"
+"""
+import re
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+from helper.vietnamese import normalize_vietnamese
+
+METADATA_FIELDS = ("course", "city", "campus", "study_mode", "start_date")
+TEXT_FIELDS = ("course", "city", "campus")
+
+# Tên cột (đã chuẩn hóa) → field metadata
+HEADER_ALIASES = {
+    "course": {"khoa hoc", "ten khoa hoc", "khoa", "lop", "ten lop", "cap do", "trinh do", "course"},
+    "city": {"thanh pho", "tinh", "tinh thanh", "tinh thanh pho", "khu vuc", "city"},
+    "campus": {"co so", "chi nhanh", "dia diem", "dia diem hoc", "campus"},
+    "study_mode": {"hinh thuc", "hinh thuc hoc", "online offline", "mode"},
+    "start_date": {"khai giang", "ngay khai giang", "lich khai giang", "ngay bat dau", "start date"},
+}
+
+# Mã chứng chỉ hay bị viết tách số: "HSK 5", "HSKK 2" → gộp lại để khớp nhau
+COURSE_CODE_RE = re.compile(r"\b(hskk|hsk|yct|bct|tocfl) (\d+)\b")
+
+ONLINE_KEYWORDS = ("online", "truc tuyen", "zoom")
+OFFLINE_KEYWORDS = ("offline", "truc tiep", "tai lop", "tai trung tam")
+
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%y", "%d.%m.%Y")
+
+
+def normalize_value(value) -> str:
+    """Chuẩn hóa giá trị metadata chữ, gộp mã khóa học "hsk 5" → "hsk5" """
+    text = normalize_vietnamese(str(value))
+    return COURSE_CODE_RE.sub(r"\1\2", text)
+
+
+def parse_study_mode(value) -> Optional[str]:
+    text = normalize_vietnamese(str(value))
+    if any(keyword in text for keyword in ONLINE_KEYWORDS):
+        return "online"
+    if any(keyword in text for keyword in OFFLINE_KEYWORDS):
+        return "offline"
+    return None
+
+
+def parse_date(value) -> Optional[date]:
+    # Ô ngày có thể kèm chữ, VD "Khai giảng 15/11/2025 (tối 2-4-6)"
+    match = re.search(r"\d{1,4}[/.-]\d{1,2}[/.-]\d{2,4}", str(value))
+    if not match:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(match.group(0), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def extract_row_metadata(row: dict) -> Dict:
+    """Metadata của 1 row sheet, field không có cột tương ứng = None"""
+    metadata = dict.fromkeys(METADATA_FIELDS)
+    for header, value in row.items():
+        if value in ("", None):
+            continue
+        normalized_header = normalize_vietnamese(str(header))
+        for field, aliases in HEADER_ALIASES.items():
+            if metadata[field] is None and normalized_header in aliases:
+                if field == "study_mode":
+                    metadata[field] = parse_study_mode(value)
+                elif field == "start_date":
+                    metadata[field] = parse_date(value)
+                else:
+                    metadata[field] = normalize_value(value)[:255] or None
+    return metadata
+
+
+def extract_filters(text: str, vocabulary: Dict[str, Iterable[str]]) -> Dict:
+    """
+    Bộ lọc nhận diện được trong text
+
+    vocabulary: field → các giá trị đang có trong knowledge base (VD {"campus": {"dong da", ...}}),
+    chỉ giá trị xuất hiện nguyên cụm trong text mới thành bộ lọc. Nếu khớp nhiều giá trị
+    của cùng 1 field thì lấy giá trị dài nhất ("ha noi" vs "noi" → "ha noi")
+    """
+    normalized = f" {normalize_value(text)} "
+    filters = {}
+    for field in TEXT_FIELDS:
+        matches = [value for value in vocabulary.get(field, ()) if value and f" {value} " in normalized]
+        if matches:
+            filters[field] = max(matches, key=len)
+
+    study_mode = parse_study_mode(normalized)
+    if study_mode:
+        filters["study_mode"] = study_mode
+
+    month = re.search(r"\bthang (\d{1,2})\b", normalized)
+    if month and 1 <= int(month.group(1)) <= 12:
+        filters["start_month"] = int(month.group(1))
+    return filters
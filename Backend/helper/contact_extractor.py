@@ -0,0 +1,138 @@
+"""
+Trích xuất cục bộ (regex) các trường thông tin liên hệ từ tin nhắn của khách
+
+- Số điện thoại Việt Nam: 0912345678, 0912 345 678, 091.234.5678, +84 912 345 678, 84912345678,
+  028 3822 1234, 0236 382 2123 → chuẩn hóa về dạng 0xxxxxxxxx
+  Chỉ nhận đầu số di động thật (032-039, 052-059, 07x, 08x, 09x) / mã vùng cố định, cách nhóm
+  thông dụng (4-3-3, 3-3-4, liền nhau) với cùng một dấu ngăn cách; bỏ qua ngày giờ (03.05.2025 08:30),
+  giá tiền và mã đơn (DH0912345678) vì trường nhận bằng regex không đi qua LLM nữa
+- Email
+- Họ tên theo mẫu câu: "tên em là Lan Anh", "em tên Minh", "mình là Nguyễn Văn A", "họ tên: ..."
+
+Field trong FieldConfig được nhận diện theo tên cột (excel_column_name), vd "Số điện thoại",
+"SĐT", "Email", "Họ và tên". Các trường còn lại (mục đích học, trình độ...) vẫn do LLM trích xuất.
+Chỉ đọc các dòng "customer: ..." của hội thoại, giá trị xuất hiện sau cùng được ưu tiên.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+from helper.vietnamese import normalize_vietnamese
+
+FIELD_KEYWORDS = {
+    "email": ("email", "e mail", "mail", "gmail"),
+    "phone": ("so dien thoai", "dien thoai", "sdt", "so dt", "phone", "mobile", "hotline"),
+    "name": ("ho ten", "ho va ten", "ten khach hang", "ten hoc vien", "ten phu huynh", "full name", "name"),
+}
+
+PHONE_CANDIDATE_RE = re.compile(r"""
+    (?<![\w+\#])(?<!\d[.,:/\-])          # không nằm trong mã đơn / dãy số dài
+    (?:
+        0(?:3[2-9]|5[2-9]|[789]\d)\d (?P<s1>[ .\-]?) \d{3} (?P=s1) \d{3}                # 0912 345 678
+      | 0(?:3[2-9]|5[2-9]|[789]\d) (?P<s2>[ .\-]?) \d{3} (?P=s2) \d{4}                  # 091 234 5678
+      | \+?84[ ]? (?:3[2-9]|5[2-9]|[789]\d)\d (?P<s3>[ .\-]?) \d{3} (?P=s3) \d{3}      # +84 912 345 678
+      | 02[48] (?P<s4>[ .\-]?) \d{4} (?P=s4) \d{4}                                      # 028 3822 1234
+      | 02[0-35-79]\d (?P<s5>[ .\-]?) \d{3} (?P=s5) \d{4}                               # 0236 382 2123
+    )
+    (?!\d|[.,:/\-]\d)
+""", re.VERBOSE)
+# Ngày / giờ bị xóa khỏi câu trước khi tìm số điện thoại: 03.05.2025, 3/5, 08:30, 8h30
+DATE_TIME_RE = re.compile(r"\b\d{1,2}[./\-]\d{1,2}(?:[./\-]\d{2,4})?\b|\b\d{1,2}[:h]\d{2}\b")
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+NAME_TRIGGER_RE = re.compile(
+    r"(?:họ\s+và\s+tên|họ\s+tên|tên\s+(?:của\s+)?(?:em|mình|tôi|tớ|con|cháu|bé)(?:\s+là)?"
+    r"|(?:em|mình|tôi|tớ)\s+tên(?:\s+là)?|(?:em|mình|tôi|tớ)\s+là)\s*[:\-]?\s*",
+    re.IGNORECASE,
+)
+# Từ kết thúc phần tên ("tên em là Lan ạ", "mình là Minh, sđt ...") - so khớp CÓ dấu
+# để không nhầm với tên riêng (mình / Minh, năm / Nam, thì / Thị)
+NAME_STOPWORDS = {
+    "ạ", "à", "nhé", "nha", "nhá", "đây", "và", "số", "sđt", "sdt", "email", "muốn", "cần",
+    "đang", "học", "ở", "tại", "năm", "nay", "hỏi", "thì", "em", "mình", "con",
+}
+NAME_MAX_WORDS = 5
+
+
+def classify_field(field_name: str) -> Optional[str]:
+    """Loại trường trích xuất được bằng regex: "email" | "phone" | "name", không thì None"""
+    text = f" {normalize_vietnamese(field_name)} "
+    for kind, keywords in FIELD_KEYWORDS.items():
+        if any(f" {keyword} " in text for keyword in keywords):
+            return kind
+    return "name" if text.strip() == "ten" else None
+
+
+def customer_lines(history: str) -> List[str]:
+    prefix = "customer:"
+    return [
+        line[len(prefix):].strip()
+        for line in (history or "").splitlines()
+        if line.startswith(prefix)
+    ]
+
+
+def normalize_phone(candidate: str) -> Optional[str]:
+    digits = re.sub(r"\D", "", candidate)
+    if digits.startswith("84"):
+        digits = "0" + digits[2:]
+    # Di động: 10 số, đầu 03/05/07/08/09 - cố định: 11 số, đầu 02
+    if len(digits) == 10 and digits[1] in "35789":
+        return digits
+    if len(digits) == 11 and digits[1] == "2":
+        return digits
+    return None
+
+
+def extract_phone(text: str) -> Optional[str]:
+    text = DATE_TIME_RE.sub(" ", text or "")
+    phones = [normalize_phone(match.group(0)) for match in PHONE_CANDIDATE_RE.finditer(text)]
+    phones = [phone for phone in phones if phone]
+    return phones[-1] if phones else None
+
+
+def extract_email(text: str) -> Optional[str]:
+    emails = EMAIL_RE.findall(text or "")
+    return emails[-1].rstrip(".").lower() if emails else None
+
+
+def extract_name(text: str) -> Optional[str]:
+    name = None
+    for match in NAME_TRIGGER_RE.finditer(text or ""):
+        words = []
+        for word in re.split(r"\s+", text[match.end():]):
+            cleaned = word.strip(".,;:!?()\"'")
+            if not cleaned or not cleaned.isalpha() or cleaned.lower() in NAME_STOPWORDS:
+                break
+            words.append(cleaned)
+            if cleaned != word or len(words) == NAME_MAX_WORDS:
+                break
+        # Sau "em là" / "mình là" chỉ nhận từ viết hoa ("em là sinh viên" không phải tên),
+        # sau "tên em là" / "họ tên:" nhận cả tên viết thường
+        if "tên" not in match.group(0).lower():
+            words = words[:next((i for i, word in enumerate(words) if not word[0].isupper()), len(words))]
+        if words:
+            name = " ".join(word.capitalize() for word in words)
+    return name
+
+
+EXTRACTORS = {"phone": extract_phone, "email": extract_email, "name": extract_name}
+
+
+def extract_contact_fields(history: str, field_names: Iterable[str]) -> Dict[str, str]:
+    """
+    Returns:
+        dict {field_name: giá trị} chỉ gồm các trường trích xuất được bằng regex
+    """
+    kinds = {name: classify_field(name) for name in field_names}
+    if not any(kinds.values()):
+        return {}
+
+    lines = customer_lines(history)
+    found = {}
+    for field_name, kind in kinds.items():
+        if kind is None:
+            continue
+        for line in reversed(lines):
+            value = EXTRACTORS[kind](line)
+            if value:
+                found[field_name] = value
+                break
+    return found
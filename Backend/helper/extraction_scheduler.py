@@ -0,0 +1,146 @@
+"""
+Lập lịch trích xuất thông tin khách hàng theo session (debounce + gộp)
+
+Trước đây mỗi tin nhắn đến tạo 1 task extract_customer_info_background (1 lần gọi LLM trên
+15 tin nhắn + có thể ghi Google Sheets) → khách gõ 5 tin ngắn liên tiếp = 5 lần gọi chồng nhau.
+
+- schedule_customer_info_extraction() chỉ đánh dấu session cần trích xuất, không chạy ngay
+- Mỗi session tối đa 1 task trong process; task chờ EXTRACTION_DEBOUNCE_SECONDS kể từ tin nhắn
+  CUỐI (tin mới đến thì chờ lại), rồi mới chạy 1 lần cho cả loạt tin
+- Tin đến trong lúc đang trích xuất → chạy thêm đúng 1 lần nữa sau khi xong
+- Watermark (Redis): thời điểm tin nhắn khách cuối cùng đã trích xuất → không có tin khách mới
+  (vd chỉ có tin admin / bot) thì bỏ qua
+- Lock Redis theo session để nhiều worker không trích xuất cùng 1 session cùng lúc; giá trị lock là
+  token riêng của từng lần chạy, chỉ xóa khi còn đúng token (lần gọi LLM lâu hơn EXTRACTION_LOCK_TTL
+  thì lock đã hết hạn và có thể đang thuộc worker khác)
+"""
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from config.redis_cache import redis_cache
+from helper.task import extract_customer_info_background
+from llm.conversation_window import get_recent_messages
+
+load_dotenv()
+
+EXTRACTION_DEBOUNCE_SECONDS = float(os.getenv("EXTRACTION_DEBOUNCE_SECONDS", 3))
+EXTRACTION_LOCK_TTL = 120
+WATERMARK_TTL = 7 * 86400
+# Số tin nhắn gần nhất dùng để tìm tin khách cuối cùng
+RECENT_MESSAGES = 10
+
+# Chỉ xóa lock khi vẫn là lock của lần chạy này
+_LOCK_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# session_id → {"task", "last_request", "dirty"}
+_sessions: Dict[int, Dict] = {}
+
+
+def _watermark_key(session_id: int) -> str:
+    return f"customer_extract:{session_id}:watermark"
+
+
+def _lock_key(session_id: int) -> str:
+    return f"customer_extract:{session_id}:lock"
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+async def _latest_customer_message_time(session_id: int) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        rows = await get_recent_messages(db, session_id, RECENT_MESSAGES)
+    for row in reversed(rows):
+        if row["sender_type"] == "customer":
+            return row["created_at"]
+    return None
+
+
+async def _has_new_customer_message(client, session_id: int, latest: Optional[str]) -> bool:
+    if latest is None:
+        return False
+    if client is None:
+        return True
+    watermark = _parse_time(await client.get(_watermark_key(session_id)))
+    latest_time = _parse_time(latest)
+    return watermark is None or latest_time is None or latest_time > watermark
+
+
+async def _extract_once(session_id: int, manager) -> bool:
+    """
+    Trích xuất 1 lần nếu có tin khách mới
+
+    Returns:
+        False nếu worker khác đang giữ lock (cần thử lại), ngược lại True
+    """
+    client = await redis_cache.get_async_client()
+    token = uuid.uuid4().hex
+    if client is not None and not await client.set(_lock_key(session_id), token, nx=True, ex=EXTRACTION_LOCK_TTL):
+        return False
+    try:
+        latest = await _latest_customer_message_time(session_id)
+        if not await _has_new_customer_message(client, session_id, latest):
+            print(f"⏭️ [EXTRACT] Session {session_id}: không có tin nhắn khách mới, bỏ qua")
+            return True
+
+        await extract_customer_info_background(session_id, None, manager)
+        if client is not None:
+            await client.set(_watermark_key(session_id), latest, ex=WATERMARK_TTL)
+        return True
+    finally:
+        if client is not None:
+            await client.eval(_LOCK_RELEASE_SCRIPT, 1, _lock_key(session_id), token)
+
+
+async def _run(session_id: int, manager):
+    state = _sessions[session_id]
+    try:
+        while True:
+            # Debounce: chờ đến khi đủ EXTRACTION_DEBOUNCE_SECONDS không có tin mới
+            while True:
+                remaining = state["last_request"] + EXTRACTION_DEBOUNCE_SECONDS - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+
+            state["dirty"] = False
+            try:
+                if not await _extract_once(session_id, manager):
+                    state["dirty"] = True
+                    state["last_request"] = time.monotonic()
+            except Exception as e:
+                print(f"⚠️ [EXTRACT] Lỗi trích xuất session {session_id}: {e}")
+
+            if not state["dirty"]:
+                break
+    finally:
+        _sessions.pop(session_id, None)
+
+
+def schedule_customer_info_extraction(session_id: int, manager):
+    """Gọi sau mỗi tin nhắn khách, thay cho asyncio.create_task(extract_customer_info_background(...))"""
+    if not session_id:
+        return
+    state = _sessions.get(session_id)
+    if state is not None:
+        state["last_request"] = time.monotonic()
+        state["dirty"] = True
+        return
+
+    state = {"task": None, "last_request": time.monotonic(), "dirty": True}
+    _sessions[session_id] = state
+    state["task"] = asyncio.create_task(_run(session_id, manager))
@@ -2,14 +2,13 @@ import asyncio
 import json
 import os
 import traceback
-from datetime import datetime, timedelta
 from httplib2 import Credentials
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from models.knowledge_base import KnowledgeBase
 from models.chat import ChatSession, Message, CustomerInfo
 from llm.llm import RAGModel
-from config.redis_cache import cache_set
+from llm import conversation_window
 from config.database import AsyncSessionLocal
 import gspread
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -217,7 +216,7 @@ async def extract_customer_info_background(session_id: int, db, manager):
 
 
 async def save_message_to_db_async(data: dict, sender_name: str, image_url: list, db: Session):
-    """Lưu tin nhắn vào database - sử dụng DB session từ tham số"""
+    """Lưu tin nhắn vào database - sử dụng DB session từ tham số, trả về ID tin nhắn"""
     try:
         message = Message(
             chat_session_id=data.get("chat_session_id"),
@@ -229,15 +228,23 @@ async def save_message_to_db_async(data: dict, sender_name: str, image_url: list
         db.add(message)
         await db.commit()
         print(f"✅ Đã lưu tin nhắn ID: {message.id}")
+        await conversation_window.append_message(
+            message.chat_session_id, message.sender_type, message.content, message_id=message.id
+        )
+        return message.id
         
     except Exception as e:
         print(f"❌ Lỗi lưu tin nhắn: {e}")
         traceback.print_exc()
         await db.rollback()
+        return None
 
 
-async def save_message_to_db_background(data: dict, sender_name: str, image_url: list):
-    """Background task: Tạo DB session riêng để lưu tin nhắn"""
+async def save_message_to_db_background(data: dict, sender_name: str, image_url: list, window_uid: str = None):
+    """
+    Background task: Tạo DB session riêng để lưu tin nhắn
+    window_uid: uid trả về từ conversation_window.append_message lúc gửi, dùng để gắn ID sau khi lưu
+    """
     async with AsyncSessionLocal() as new_db:
         try:
             message = Message(
@@ -250,6 +257,7 @@ async def save_message_to_db_background(data: dict, sender_name: str, image_url:
             new_db.add(message)
             await new_db.commit()
             print(f"✅ [Background] Đã lưu tin nhắn ID: {message.id}")
+            await conversation_window.set_message_id(message.chat_session_id, window_uid, message.id)
             
         except Exception as e:
             print(f"❌ [Background] Lỗi lưu tin nhắn: {e}")
@@ -257,70 +265,6 @@ async def save_message_to_db_background(data: dict, sender_name: str, image_url:
             await new_db.rollback()
 
 
-async def update_session_admin_async(chat_session_id: int, sender_name: str, db: Session):
-    """Cập nhật session khi admin reply - sử dụng DB session từ tham số"""
-    try:
-        result = await db.execute(select(ChatSession).filter(ChatSession.id == chat_session_id))
-        db_session = result.scalar_one_or_none()
-        if db_session:
-            db_session.status = "false"
-            db_session.time = datetime.now() + timedelta(hours=1)
-            db_session.previous_receiver = db_session.current_receiver
-            db_session.current_receiver = sender_name
-            await db.commit()
-            
-            # Cập nhật cache
-            session_cache_key = f"session:{chat_session_id}"
-            session_data = {
-                'id': db_session.id,
-                'name': db_session.name,
-                'status': db_session.status,
-                'channel': db_session.channel,
-                'page_id': db_session.page_id,
-                'current_receiver': db_session.current_receiver,
-                'previous_receiver': db_session.previous_receiver,
-                'time': db_session.time.isoformat() if db_session.time else None
-            }
-            cache_set(session_cache_key, session_data, ttl=300)
-            
-    except Exception as e:
-        print(f"❌ Lỗi cập nhật session: {e}")
-
-
-async def update_session_admin_background(chat_session_id: int, sender_name: str):
-    """Background task: Tạo DB session riêng để cập nhật session"""
-    async with AsyncSessionLocal() as new_db:
-        try:
-            result = await new_db.execute(select(ChatSession).filter(ChatSession.id == chat_session_id))
-            db_session = result.scalar_one_or_none()
-            if db_session:
-                db_session.status = "false"
-                db_session.time = datetime.now() + timedelta(hours=1)
-                db_session.previous_receiver = db_session.current_receiver
-                db_session.current_receiver = sender_name
-                await new_db.commit()
-                
-                # Cập nhật cache
-                session_cache_key = f"session:{chat_session_id}"
-                session_data = {
-                    'id': db_session.id,
-                    'name': db_session.name,
-                    'status': db_session.status,
-                    'channel': db_session.channel,
-                    'page_id': db_session.page_id,
-                    'current_receiver': db_session.current_receiver,
-                    'previous_receiver': db_session.previous_receiver,
-                    'time': db_session.time.isoformat() if db_session.time else None
-                }
-                cache_set(session_cache_key, session_data, ttl=300)
-                print(f"✅ [Background] Đã cập nhật session {chat_session_id}")
-                
-        except Exception as e:
-            print(f"❌ [Background] Lỗi cập nhật session: {e}")
-            traceback.print_exc()
-            await new_db.rollback()
-
-
 async def send_to_platform_background(channel: str, page_id: str, recipient_id: str, message_data: dict, images=None):
     """🚀 Background task: Gửi tin nhắn đến platform (Facebook, Telegram, Zalo) không block
     ✅ Các hàm send platform giờ là ASYNC, gọi trực tiếp với await
@@ -364,6 +308,7 @@ async def generate_and_send_bot_response_background(user_content: str, chat_sess
             new_db.add(message_bot)
             await new_db.commit()
             await new_db.refresh(message_bot)
+            await conversation_window.append_message(chat_session_id, "bot", mes, message_id=message_bot.id)
             
             # Tạo bot message để gửi qua websocket
             bot_message = {
@@ -428,6 +373,7 @@ async def generate_and_send_platform_bot_response_background(
             new_db.add(message_bot)
             await new_db.commit()
             await new_db.refresh(message_bot)
+            await conversation_window.append_message(chat_session_id, "bot", mes, message_id=message_bot.id)
             
             # Tạo bot message để gửi
             bot_message = {
@@ -0,0 +1,37 @@
+"""
+Chuẩn hóa tiếng Việt cho tìm kiếm từ khóa (không phân biệt dấu / hoa thường)
+
+"Lịch khai giảng HSK3 cơ sở Đống Đa" → "lich khai giang hsk3 co so dong da"
+"""
+import re
+import unicodedata
+from typing import List
+
+# Từ đệm / đại từ / từ hỏi xuất hiện ở hầu hết câu hỏi, không giúp phân biệt chunk
+STOPWORDS = {
+    "a", "ah", "oi", "nhe", "nha", "vay", "the", "thi", "la", "va", "voi", "cua",
+    "cho", "toi", "minh", "em", "anh", "chi", "ban", "ben", "khong", "co", "duoc",
+    "gi", "nao", "sao", "bao", "nhieu", "nhung", "cac", "mot", "nay", "do", "muon", "hoi",
+}
+
+
+def normalize_vietnamese(text: str) -> str:
+    """Bỏ dấu, đ → d, chữ thường, ký tự không phải chữ/số → khoảng trắng"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    text = text.replace("đ", "d")
+    text = re.sub(r"[^0-9a-z]+", " ", text)
+    return text.strip()
+
+
+def tokenize_vietnamese(text: str, drop_stopwords: bool = True) -> List[str]:
+    """Tách âm tiết đã chuẩn hóa, bỏ trùng (giữ thứ tự) và bỏ stopword"""
+    tokens = []
+    for token in normalize_vietnamese(text).split():
+        if drop_stopwords and token in STOPWORDS:
+            continue
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
@@ -0,0 +1,180 @@
+"""
+Cache câu trả lời theo ngữ nghĩa cho các câu hỏi lặp lại (học phí, học thử, sĩ số, cơ sở...)
+
+Chỉ dùng cho câu hỏi tự đủ nghĩa (search_key.is_self_contained, pipeline quyết định):
+câu hỏi phụ thuộc ngữ cảnh ("còn lớp đó thì sao") có câu trả lời khác nhau theo hội thoại
+
+Khóa bucket: phiên bản knowledge base đang active + dấu vân tay thông tin khách hàng
++ các trường bắt buộc khách CHƯA cung cấp
+- Sync lại knowledge base → phiên bản mới → bucket mới, cache cũ tự hết hạn theo TTL
+- Câu trả lời có thể nhắc tới thông tin của khách (tên, SĐT...) nên chỉ dùng lại
+  cho khách có cùng thông tin (khách mới chưa có thông tin dùng chung 1 bucket)
+- Câu trả lời thường kèm lời xin các trường bắt buộc còn thiếu → thiếu trường khác nhau
+  thì không dùng chung câu trả lời
+- Bucket đầy (ANSWER_CACHE_MAX_ENTRIES) → bỏ câu trả lời lâu nhất không được dùng (LRU,
+  sorted set {bucket}:lru điểm = thời điểm dùng gần nhất)
+
+Trong bucket, tra theo từ khóa tìm kiếm (build_search_key):
+1. Khớp chính xác từ khóa đã chuẩn hóa → HGET
+2. Không có → so cosine với embedding (rút gọn ANSWER_CACHE_DIMENSIONS chiều) của các
+   từ khóa đã cache, >= ANSWER_CACHE_THRESHOLD thì dùng lại câu trả lời
+
+Embedding từ khóa dùng chung LRU với vector search (config/get_embedding.py) nên không
+tốn thêm lần gọi API. Đếm hit / miss trong Redis, xem qua GET /llms/answer-cache/stats
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from config.get_embedding import get_embedding_chatgpt, normalize_text, reduce_embedding
+from config.redis_cache import redis_cache
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 86400))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 200))
+ANSWER_CACHE_DIMENSIONS = 256
+
+STATS_KEY = "answer_cache:stats"
+
+
+def _filled(value) -> bool:
+    return value not in (None, "", [], {})
+
+
+def missing_fields(required_fields: Optional[dict], customer_info: Optional[dict]) -> List[str]:
+    """Tên các trường bắt buộc (FieldConfig) khách chưa cung cấp, đã sắp xếp"""
+    customer_info = customer_info or {}
+    return sorted(name for name in (required_fields or {}).values() if not _filled(customer_info.get(name)))
+
+
+def customer_fingerprint(customer_info: Optional[dict], required_fields: Optional[dict] = None) -> str:
+    """Hash các field khách hàng đã có giá trị + các trường bắt buộc còn thiếu (field rỗng không làm đổi bucket)"""
+    filled = {k: v for k, v in (customer_info or {}).items() if _filled(v)}
+    missing = missing_fields(required_fields, customer_info)
+    if not filled and not missing:
+        return "anonymous"
+    payload = json.dumps([filled, missing], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def bucket_key(kb_version: int, customer_info: Optional[dict], required_fields: Optional[dict] = None) -> str:
+    return f"answer_cache:v{kb_version}:{customer_fingerprint(customer_info, required_fields)}"
+
+
+def entry_id(search_key: str) -> str:
+    return hashlib.blake2b(normalize_text(search_key).encode("utf-8"), digest_size=8).hexdigest()
+
+
+async def _record(outcome: str):
+    client = await redis_cache.get_async_binary_client()
+    if client is not None:
+        await client.hincrby(STATS_KEY, outcome, 1)
+
+
+async def lookup(search_key: str, kb_version: int, customer_info: Optional[dict],
+                 required_fields: Optional[dict] = None) -> Optional[str]:
+    """Câu trả lời đã cache cho từ khóa (hoặc từ khóa gần nghĩa), không có → None"""
+    if not ANSWER_CACHE_ENABLED or not search_key:
+        return None
+    try:
+        client = await redis_cache.get_async_binary_client()
+        if client is None:
+            return None
+        key = bucket_key(kb_version, customer_info, required_fields)
+
+        field = entry_id(search_key)
+        answer = await client.hget(f"{key}:answers", field)
+        if answer is None:
+            field, answer = await _lookup_similar(client, key, search_key)
+
+        await _record("hits" if answer is not None else "misses")
+        if answer is None:
+            return None
+        await client.zadd(f"{key}:lru", {field: time.time()})
+        return answer.decode("utf-8")
+    except Exception as e:
+        print(f"⚠️ [ANSWER CACHE] Lỗi tra cache: {e}")
+        return None
+
+
+async def _lookup_similar(client, key: str, search_key: str) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """(field, câu trả lời) của từ khóa gần nghĩa nhất, không đủ ngưỡng → (None, None)"""
+    stored = await client.hgetall(f"{key}:embeddings")
+    if not stored:
+        return None, None
+    embedding = await get_embedding_chatgpt(search_key)
+    if embedding is None:
+        return None, None
+
+    ids = list(stored.keys())
+    matrix = np.frombuffer(b"".join(stored[i] for i in ids), dtype=np.float32).reshape(len(ids), -1)
+    # Vector đã chuẩn hóa L2 → tích vô hướng = cosine
+    scores = matrix @ reduce_embedding(embedding, ANSWER_CACHE_DIMENSIONS)
+    best = int(np.argmax(scores))
+    if scores[best] < ANSWER_CACHE_THRESHOLD:
+        return None, None
+    print(f"💾 [ANSWER CACHE] Hit gần nghĩa (cosine {scores[best]:.3f})")
+    return ids[best], await client.hget(f"{key}:answers", ids[best])
+
+
+async def _evict(client, key: str):
+    """Bỏ các câu trả lời lâu nhất không được dùng để còn chỗ cho 1 câu mới"""
+    excess = await client.zcard(f"{key}:lru") - ANSWER_CACHE_MAX_ENTRIES + 1
+    if excess <= 0:
+        return
+    evicted = [field for field, _ in await client.zpopmin(f"{key}:lru", excess)]
+    if evicted:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.hdel(f"{key}:answers", *evicted)
+            pipe.hdel(f"{key}:embeddings", *evicted)
+            await pipe.execute()
+
+
+async def store(search_key: str, kb_version: int, customer_info: Optional[dict], answer: str,
+                required_fields: Optional[dict] = None):
+    """Lưu câu trả lời, bucket đã đầy (ANSWER_CACHE_MAX_ENTRIES) thì bỏ câu ít dùng nhất (LRU)"""
+    if not ANSWER_CACHE_ENABLED or not search_key or not answer:
+        return
+    try:
+        client = await redis_cache.get_async_binary_client()
+        if client is None:
+            return
+        key = bucket_key(kb_version, customer_info, required_fields)
+        field = entry_id(search_key)
+        if await client.zscore(f"{key}:lru", field) is None:
+            await _evict(client, key)
+
+        embedding = await get_embedding_chatgpt(search_key)
+        if embedding is None:
+            return
+        vector = reduce_embedding(embedding, ANSWER_CACHE_DIMENSIONS).astype(np.float32)
+
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.hset(f"{key}:answers", field, answer.encode("utf-8"))
+            pipe.hset(f"{key}:embeddings", field, vector.tobytes())
+            pipe.zadd(f"{key}:lru", {field: time.time()})
+            for suffix in ("answers", "embeddings", "lru"):
+                pipe.expire(f"{key}:{suffix}", ANSWER_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        print(f"⚠️ [ANSWER CACHE] Lỗi lưu cache: {e}")
+
+
+async def get_stats() -> Dict:
+    client = await redis_cache.get_async_binary_client()
+    stored = await client.hgetall(STATS_KEY) if client is not None else {}
+    hits = int(stored.get(b"hits", 0))
+    misses = int(stored.get(b"misses", 0))
+    return {
+        "enabled": ANSWER_CACHE_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "threshold": ANSWER_CACHE_THRESHOLD,
+    }
@@ -306,6 +306,10 @@ class BaseRAGModel:
         """Tạo câu trả lời cho query của người dùng"""
         raise NotImplementedError("Subclass must implement generate_response method")
     
+    async def generate_response_stream(self, query: str, chat_session_id: int):
+        """Tạo câu trả lời dạng stream, yield từng delta"""
+        raise NotImplementedError("Subclass must implement generate_response_stream method")
+    
     async def extract_customer_info_realtime(self, chat_session_id: int, limit_messages: int):
         """Trích xuất thông tin khách hàng theo thời gian thực"""
         raise NotImplementedError("Subclass must implement extract_customer_info_realtime method")
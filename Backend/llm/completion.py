@@ -0,0 +1,162 @@
+"""
+Lớp completion bất đồng bộ dùng chung cho các RAG model (Gemini, OpenAI)
+- Dùng client async native của từng provider → KHÔNG block event loop
+- generate(): trả về toàn bộ câu trả lời, stream(): yield từng delta
+- Giới hạn số request đồng thời theo provider bằng Semaphore
+- Client được tái sử dụng theo (provider, api_key, model_name)
+"""
+import asyncio
+import os
+from typing import AsyncIterator, Dict, Optional, Tuple
+import google.generativeai as genai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Số request LLM tối đa chạy đồng thời cho mỗi provider (trong 1 worker)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_clients: Dict[Tuple[str, str, str], "BaseCompletionClient"] = {}
+
+
+def _get_semaphore(provider: str) -> asyncio.Semaphore:
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphores[provider]
+
+
+class BaseCompletionClient:
+    """Interface chung: generate(prompt) -> str"""
+
+    provider = None
+
+    def __init__(self, api_key: str, model_name: str):
+        self.api_key = api_key
+        self.model_name = model_name
+
+    async def generate(self, prompt: str, temperature: Optional[float] = None,
+                       system: Optional[str] = None) -> str:
+        """system: phần quy tắc tĩnh, gửi riêng trước prompt để provider cache prefix"""
+        async with _get_semaphore(self.provider):
+            return await self._generate(prompt, temperature, system)
+
+    async def stream(self, prompt: str, temperature: Optional[float] = None,
+                     system: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield từng đoạn text ngay khi provider trả về"""
+        async with _get_semaphore(self.provider):
+            async for delta in self._stream(prompt, temperature, system):
+                if delta:
+                    yield delta
+
+    async def _generate(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> str:
+        raise NotImplementedError("Subclass must implement _generate method")
+
+    async def _stream(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> AsyncIterator[str]:
+        # Mặc định: provider không hỗ trợ stream → trả 1 delta duy nhất
+        yield await self._generate(prompt, temperature, system)
+
+
+class GeminiCompletionClient(BaseCompletionClient):
+    provider = "gemini"
+
+    def __init__(self, api_key: str, model_name: str):
+        super().__init__(api_key, model_name)
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        # system_instruction gắn với GenerativeModel → giữ 1 model cho mỗi bộ quy tắc
+        self._system_models: Dict[str, genai.GenerativeModel] = {}
+
+    def _model_for(self, system: Optional[str]) -> genai.GenerativeModel:
+        if not system:
+            return self.model
+        model = self._system_models.get(system)
+        if model is None:
+            model = genai.GenerativeModel(self.model_name, system_instruction=system)
+            self._system_models[system] = model
+        return model
+
+    def _generation_config(self, temperature: Optional[float]):
+        if temperature is None:
+            return None
+        return genai.GenerationConfig(temperature=temperature)
+
+    async def _generate(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> str:
+        response = await self._model_for(system).generate_content_async(
+            prompt,
+            generation_config=self._generation_config(temperature)
+        )
+        return response.text
+
+    async def _stream(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> AsyncIterator[str]:
+        response = await self._model_for(system).generate_content_async(
+            prompt,
+            generation_config=self._generation_config(temperature),
+            stream=True
+        )
+        async for chunk in response:
+            # Chunk cuối có thể không có parts (finish_reason) → bỏ qua
+            if chunk.parts:
+                yield chunk.text
+
+
+class OpenAICompletionClient(BaseCompletionClient):
+    provider = "openai"
+
+    def __init__(self, api_key: str, model_name: str):
+        super().__init__(api_key, model_name)
+        self.client = AsyncOpenAI(api_key=api_key)
+
+    @staticmethod
+    def _messages(prompt: str, system: Optional[str]):
+        # System message đứng đầu và không đổi giữa các request → OpenAI tự cache prefix
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    async def _generate(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> str:
+        kwargs = {}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt, system),
+            **kwargs
+        )
+        return response.choices[0].message.content or ""
+
+    async def _stream(self, prompt: str, temperature: Optional[float], system: Optional[str]) -> AsyncIterator[str]:
+        kwargs = {}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+
+        stream = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt, system),
+            stream=True,
+            **kwargs
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+PROVIDERS = {
+    "gemini": GeminiCompletionClient,
+    "openai": OpenAICompletionClient,
+}
+
+
+def get_completion_client(provider: str, api_key: str, model_name: str) -> BaseCompletionClient:
+    """
+    Lấy client completion đã cache theo (provider, api_key, model_name)
+    - Đổi key trong DB → tự tạo client mới
+    """
+    cache_key = (provider, api_key, model_name)
+    client = _clients.get(cache_key)
+    if client is None:
+        client = PROVIDERS[provider](api_key, model_name)
+        _clients[cache_key] = client
+    return client
@@ -0,0 +1,196 @@
+"""
+Cửa sổ hội thoại theo session trong Redis
+
+- Key chat_window:{chat_session_id} là 1 Redis list, mỗi phần tử là JSON
+  {uid, id, content, sender_type, created_at}, giữ CONVERSATION_WINDOW_SIZE tin nhắn mới nhất
+- Tin nhắn được append NGAY lúc gửi (trước khi lưu DB ở background) → RAG đọc được luôn
+  tin nhắn đang trả lời (read-your-writes), không phụ thuộc save_message_to_db_background
+- Lưu DB xong thì set_message_id() gắn ID thật vào phần tử (summary dùng ID làm watermark)
+- Đọc: 1 lệnh LRANGE thay cho query ORDER BY created_at DESC LIMIT trên bảng messages;
+  miss (key hết hạn, Redis lỗi, limit lớn hơn cửa sổ) → đọc DB và nạp lại cửa sổ
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import desc, select
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from config.redis_cache import redis_cache
+from models.chat import Message
+
+load_dotenv()
+
+CONVERSATION_WINDOW_ENABLED = os.getenv("CONVERSATION_WINDOW_ENABLED", "true").lower() == "true"
+CONVERSATION_WINDOW_SIZE = int(os.getenv("CONVERSATION_WINDOW_SIZE", 20))
+CONVERSATION_WINDOW_TTL = int(os.getenv("CONVERSATION_WINDOW_TTL", 86400))
+
+# Append nếu cửa sổ đã tồn tại, trả về 0 nếu chưa có (cần nạp từ DB trước)
+_APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[3])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Nạp cửa sổ từ DB, bỏ qua nếu request khác đã nạp trước
+_SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Gắn ID DB cho tin nhắn đã append theo uid
+_SET_ID_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+for i, raw in ipairs(items) do
+    local row = cjson.decode(raw)
+    if row['uid'] == ARGV[1] then
+        row['id'] = tonumber(ARGV[2])
+        redis.call('LSET', KEYS[1], i - 1, cjson.encode(row))
+        return 1
+    end
+end
+return 0
+"""
+
+
+def window_key(chat_session_id: int) -> str:
+    return f"chat_window:{chat_session_id}"
+
+
+async def fetch_latest_messages(db, chat_session_id: int, limit: int) -> List[Dict]:
+    """Lấy `limit` tin nhắn gần nhất từ DB, trả về theo thứ tự thời gian tăng dần"""
+    result = await db.execute(
+        select(Message)
+        .filter(Message.chat_session_id == chat_session_id)
+        .order_by(desc(Message.created_at))
+        .limit(limit)
+    )
+    messages = result.scalars().all()
+
+    return [
+        {
+            "id": m.id,
+            "content": m.content,
+            "sender_type": m.sender_type,
+            "created_at": m.created_at.isoformat() if m.created_at else None
+        }
+        for m in reversed(messages)
+    ]
+
+
+def _dumps(row: Dict) -> str:
+    return json.dumps(row, ensure_ascii=False)
+
+
+def _loads(raw: str) -> Dict:
+    row = json.loads(raw)
+    row.pop("uid", None)
+    return row
+
+
+async def _seed(client, chat_session_id: int, rows: List[Dict]) -> bool:
+    if not rows:
+        return False
+    return bool(await client.eval(
+        _SEED_SCRIPT, 1, window_key(chat_session_id),
+        CONVERSATION_WINDOW_TTL, CONVERSATION_WINDOW_SIZE, *[_dumps(row) for row in rows]
+    ))
+
+
+async def append_message(chat_session_id: int, sender_type: str, content: Optional[str],
+                         message_id: Optional[int] = None) -> Optional[str]:
+    """
+    Thêm tin nhắn vào cửa sổ lúc gửi
+
+    Returns:
+        uid của phần tử (truyền cho set_message_id sau khi lưu DB), None nếu không ghi được
+    """
+    if not CONVERSATION_WINDOW_ENABLED or not chat_session_id:
+        return None
+    uid = uuid.uuid4().hex
+    row = {
+        "uid": uid,
+        "id": message_id,
+        "content": content,
+        "sender_type": sender_type,
+        "created_at": datetime.now().isoformat(),
+    }
+    try:
+        client = await redis_cache.get_async_client()
+        if client is None:
+            return None
+        key = window_key(chat_session_id)
+        if await client.eval(_APPEND_SCRIPT, 1, key, CONVERSATION_WINDOW_TTL, CONVERSATION_WINDOW_SIZE, _dumps(row)):
+            return uid
+
+        # Cửa sổ chưa có: nạp các tin nhắn cũ từ DB rồi thêm tin nhắn mới vào cuối
+        async with AsyncSessionLocal() as db:
+            rows = await fetch_latest_messages(db, chat_session_id, CONVERSATION_WINDOW_SIZE)
+        if message_id is not None:
+            rows = [r for r in rows if r["id"] != message_id]
+        if not await _seed(client, chat_session_id, rows + [row]):
+            await client.eval(_APPEND_SCRIPT, 1, key, CONVERSATION_WINDOW_TTL, CONVERSATION_WINDOW_SIZE, _dumps(row))
+        return uid
+    except Exception as e:
+        print(f"⚠️ [WINDOW] Lỗi append session {chat_session_id}: {e}")
+        # Cửa sổ có thể thiếu tin nhắn này → xóa để lần đọc sau lấy lại từ DB
+        await invalidate(chat_session_id)
+        return None
+
+
+async def set_message_id(chat_session_id: int, uid: Optional[str], message_id: int):
+    """Gắn ID thật sau khi tin nhắn đã được lưu DB"""
+    if not uid or message_id is None:
+        return
+    try:
+        client = await redis_cache.get_async_client()
+        if client is not None:
+            await client.eval(_SET_ID_SCRIPT, 1, window_key(chat_session_id), uid, message_id)
+    except Exception as e:
+        print(f"⚠️ [WINDOW] Lỗi gắn ID {message_id} session {chat_session_id}: {e}")
+
+
+async def get_recent_messages(db, chat_session_id: int, limit: int) -> List[Dict]:
+    """`limit` tin nhắn gần nhất (thứ tự thời gian tăng dần): cửa sổ Redis, miss → DB"""
+    if CONVERSATION_WINDOW_ENABLED and limit <= CONVERSATION_WINDOW_SIZE:
+        try:
+            client = await redis_cache.get_async_client()
+            if client is not None:
+                raw_rows = await client.lrange(window_key(chat_session_id), -limit, -1)
+                if raw_rows:
+                    return [_loads(raw) for raw in raw_rows]
+        except Exception as e:
+            print(f"⚠️ [WINDOW] Lỗi đọc session {chat_session_id}, đọc DB: {e}")
+            client = None
+
+        rows = await fetch_latest_messages(db, chat_session_id, CONVERSATION_WINDOW_SIZE)
+        if client is not None:
+            try:
+                await _seed(client, chat_session_id, rows)
+            except Exception as e:
+                print(f"⚠️ [WINDOW] Lỗi nạp cửa sổ session {chat_session_id}: {e}")
+        return rows[-limit:]
+
+    return await fetch_latest_messages(db, chat_session_id, limit)
+
+
+async def invalidate(chat_session_id: int):
+    """Xóa cửa sổ (xóa tin nhắn / xóa session), lần đọc sau nạp lại từ DB"""
+    try:
+        client = await redis_cache.get_async_client()
+        if client is not None:
+            await client.delete(window_key(chat_session_id))
+    except Exception as e:
+        print(f"⚠️ [WINDOW] Lỗi xóa cửa sổ session {chat_session_id}: {e}")
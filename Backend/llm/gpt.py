@@ -6,12 +6,19 @@ from sqlalchemy import text, desc, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.get_embedding import get_embedding_chatgpt
 from llm.base_rag import BaseRAGModel
-from llm.prompt import prompt_builder
-from openai import OpenAI
+from llm.prompt import OPENAI_ANSWER_RULES
+from llm.prompt_composer import compose_answer_prompt
+from llm.completion import get_completion_client
+from llm.summary import conversation_with_summary
+from llm.llm_config import get_llm_config
+from helper.contact_extractor import extract_contact_fields
+from llm import retrieval
+from llm.pipeline import prepare_answer_context, store_answer_in_background, format_conversation
+from llm.conversation_window import get_recent_messages
 from models.llm import LLM
 from models.chat import Message, CustomerInfo
 from models.field_config import FieldConfig
-from config.redis_cache import cache_get, cache_set, cache_delete
+from config.local_cache import FIELD_CONFIGS_KEY, cached, invalidate
 from dotenv import load_dotenv
 
 # Load biến môi trường
@@ -25,71 +32,49 @@ class RAGModel(BaseRAGModel):
         
         # Khởi tạo client OpenAI với key mới nhất
         self.model_name = model_name
-        self.client = None
+        self.completion = None
         self.is_initialized = False
+        self.last_timings = {}
+        self.last_context = {}
     
     async def initialize(self):
         """Initialize model với async database query"""
         if self.is_initialized:
             return
             
-        result = await self.db_session.execute(select(LLM).filter(LLM.id == 1))
-        llm = result.scalar_one_or_none()
-        print(f"DEBUG GPT: LLM Config: {llm}")
+        # Cấu hình LLM id=1 từ cache 2 tầng (llm/llm_config.py)
+        llm = await get_llm_config(self.db_session)
         
-        # Cấu hình OpenAI
-        self.client = OpenAI(api_key=llm.key)
+        # Cấu hình OpenAI (AsyncOpenAI, dùng chung giữa các request)
+        self.completion = get_completion_client("openai", llm["key"], self.model_name)
         self.is_initialized = True
         
     def _refresh_client(self):
         """Refresh OpenAI client với API key mới nhất từ database nếu cần"""
         if self._key_changed():
             # Tạo client mới với key mới nhất  
-            self.client = OpenAI(api_key=self.llm_config.key)
+            self.completion = get_completion_client("openai", self.llm_config.key, self.model_name)
             print(f"DEBUG GPT: Refreshed OpenAI client with new key")
         
     def _ensure_fresh_client(self):
         """Đảm bảo client được refresh nếu key thay đổi"""
-        if not hasattr(self, 'client') or self._key_changed():
-            self.client = OpenAI(api_key=self.llm_config.key)
+        if not self.completion or self._key_changed():
+            self.completion = get_completion_client("openai", self.llm_config.key, self.model_name)
             print(f"DEBUG GPT: Created/Refreshed OpenAI client")
 
-    async def get_latest_messages(self, chat_session_id: int, limit: int): 
-        result = await self.db_session.execute(
-            select(Message)
-            .filter(Message.chat_session_id == chat_session_id)
-            .order_by(desc(Message.created_at))
-            .limit(limit)
-        )
-        messages = result.scalars().all()
-        
-        results = [
-            {
-                "id": m.id,
-                "content": m.content,
-                "sender_type": m.sender_type,
-                "created_at": m.created_at.isoformat() if m.created_at else None
-            }
-            for m in reversed(messages) 
-        ]
+    async def get_latest_messages(self, chat_session_id: int, limit: int, db: AsyncSession = None):
+        rows = await get_recent_messages(db or self.db_session, chat_session_id, limit)
+        return format_conversation(rows)
 
-        # return results
-        conversation = []
-        for msg in results:
-            line = f"{msg['sender_type']}: {msg['content']}"
-            conversation.append(line)
-        
-        conversation_text = "\n".join(conversation)
-        
-        return conversation_text
-
-    async def build_search_key(self, chat_session_id: int, question: str, customer_info=None) -> str:
+    async def build_search_key(self, chat_session_id: int, question: str, customer_info=None, history: str = None) -> str:
         """Xây dựng từ khóa tìm kiếm từ lịch sử và câu hỏi hiện tại"""
         # Đảm bảo model được initialize trước khi sử dụng
         if not self.is_initialized:
             await self.initialize()
         
-        history = await self.get_latest_messages(chat_session_id=chat_session_id, limit=5)
+        # history có thể được truyền sẵn từ pipeline → không query lại DB
+        if history is None:
+            history = await self.get_latest_messages(chat_session_id=chat_session_id, limit=5)
         
         # Chuẩn bị thông tin khách hàng cho context
         customer_context = ""
@@ -165,59 +150,25 @@ class RAGModel(BaseRAGModel):
         CHỈ TRẢ VỀ TỪ KHÓA, KHÔNG GIẢI THÍCH.
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-        )
+        response_text = await self.completion.generate(prompt, temperature=0.3)
 
-        return response.choices[0].message.content.strip()
+        return response_text.strip()
 
-    async def search_similar_documents(self, query: str, top_k: int) -> List[Dict]:
+    async def search_similar_documents(self, query: str, top_k: int, db: AsyncSession = None,
+                                       customer_info: dict = None) -> List[Dict]:
         """Tìm kiếm tài liệu tương tự sử dụng ChatGPT embedding"""
         try:
-            # Tạo embedding cho query
-            query_embedding = await get_embedding_chatgpt(query)
-
-            # numpy.ndarray -> list -> string (pgvector format)
-            query_embedding = query_embedding.tolist()
-            query_embedding = "[" + ",".join([str(x) for x in query_embedding]) + "]"
-
-            sql = text("""
-                SELECT id, chunk_text, search_vector <-> (:query_embedding)::vector AS similarity
-                FROM document_chunks
-                ORDER BY search_vector <-> (:query_embedding)::vector
-                LIMIT :top_k
-            """)
-
-            result = await self.db_session.execute(
-                sql, {"query_embedding": query_embedding, "top_k": top_k}
+            # Lấy ứng viên qua index ANN rồi re-rank chính xác (xem llm/retrieval.py)
+            return await retrieval.search_similar_documents(
+                db or self.db_session, query, top_k, customer_info=customer_info
             )
-            rows = result.fetchall()
-
-            results = []
-            for row in rows:
-                results.append({
-                    "content": row.chunk_text,
-                    "similarity_score": float(row.similarity)
-                })
-
-            return results
-
         except Exception as e:
             raise Exception(f"Lỗi khi tìm kiếm: {str(e)}")
 
-    async def get_field_configs(self):
-        """Lấy cấu hình fields từ bảng field_config với Redis cache"""
-        cache_key = "field_configs:required_optional"
-        
-        # Thử lấy từ cache trước
-        cached_result = cache_get(cache_key)
-        if cached_result is not None:
-            return cached_result.get('required_fields', {}), cached_result.get('optional_fields', {})
-        
-        try:
-            result = await self.db_session.execute(
+    async def get_field_configs(self, db: AsyncSession = None):
+        """Lấy cấu hình fields từ bảng field_config với cache 2 tầng (process + Redis)"""
+        async def load():
+            result = await (db or self.db_session).execute(
                 select(FieldConfig).order_by(FieldConfig.excel_column_letter)
             )
             field_configs = result.scalars().all()
@@ -232,23 +183,24 @@ class RAGModel(BaseRAGModel):
                 else:
                     optional_fields[field_name] = field_name
             
-            # Cache kết quả với TTL 24 giờ (86400 giây)
-            cache_data = {
+            return {
                 'required_fields': required_fields,
                 'optional_fields': optional_fields
             }
-            cache_set(cache_key, cache_data, ttl=86400)
-                    
-            return required_fields, optional_fields
+        
+        try:
+            # Redis giữ 24 giờ (86400 giây), xóa qua clear_field_configs_cache khi cấu hình đổi
+            cache_data = await cached(FIELD_CONFIGS_KEY, load, redis_ttl=86400)
+            return cache_data.get('required_fields', {}), cache_data.get('optional_fields', {})
         except Exception as e:
             print(f"Lỗi khi lấy field configs: {str(e)}")
             # Trả về dict rỗng nếu có lỗi
             return {}, {}
     
-    async def get_customer_infor(self, chat_session_id: int) -> dict:
+    async def get_customer_infor(self, chat_session_id: int, db: AsyncSession = None) -> dict:
         try:
             # Lấy thông tin khách hàng từ bảng customer_info
-            result = await self.db_session.execute(
+            result = await (db or self.db_session).execute(
                 select(CustomerInfo).filter(CustomerInfo.chat_session_id == chat_session_id)
             )
             customer_info = result.scalar_one_or_none()
@@ -263,121 +215,68 @@ class RAGModel(BaseRAGModel):
         except Exception as e:
             print(f"Lỗi khi lấy thông tin khách hàng: {str(e)}")
             return {}
+    async def build_answer_prompt(self, query: str, chat_session_id: int) -> dict:
+        """Chuẩn bị ngữ cảnh (lịch sử, thông tin khách, kiến thức) và ghép prompt (system + user)"""
+        # Các stage độc lập chạy song song, có đo thời gian từng stage
+        context = await prepare_answer_context(self, query, chat_session_id)
+        self.last_context = context
+        self.last_timings = context["timings"]
+        print("KNOWLEDGE FOR ANSWERING:", context["knowledge"])
+
+        # Quy tắc tĩnh làm system prompt (prefix cache), dữ liệu request cắt theo ngân sách token
+        prompt = compose_answer_prompt(OPENAI_ANSWER_RULES, query, context)
+        context["prompt_tokens"] = prompt["token_counts"]
+        return prompt
+
     async def generate_response(self, query: str, chat_session_id: int) -> str:
         try:
             # Ensure model is initialized
             if not self.is_initialized:
                 await self.initialize()
             
-            history = await self.get_latest_messages(chat_session_id=chat_session_id, limit=10)
-            customer_info = await self.get_customer_infor(chat_session_id)
-            
             if not query or query.strip() == "":
                 return "Nội dung câu hỏi trống, vui lòng nhập lại."
             
-            # Truyền customer_info vào build_search_key để tối ưu tìm kiếm
-            search = await self.build_search_key(chat_session_id, query, customer_info)
-            print(f"Search key: {search}")
-            print("-----------------------------")
-            
-            # Lấy ngữ cảnh
-            knowledge = await self.search_similar_documents(search, 10)
-            print("KNOWLEDGE FOR ANSWERING:", knowledge)
-            # Lấy cấu hình fields động
-            required_fields, optional_fields = await self.get_field_configs()
+            prompt = await self.build_answer_prompt(query, chat_session_id)
+            if self.last_context.get("cached_answer"):
+                return self.last_context["cached_answer"]
+            response_text = await self.completion.generate(
+                prompt["user"], temperature=0.3, system=prompt["system"]
+            )
+            store_answer_in_background(self.last_context, response_text.strip())
             
-            # Tạo danh sách thông tin cần thu thập
-            required_info_list = "\n".join([f"- {field_name} (bắt buộc)" for field_name in required_fields.values()])
-            optional_info_list = "\n".join([f"- {field_name} (tùy chọn)" for field_name in optional_fields.values()])
+            return response_text.strip()
             
-            prompt = f"""
-                BẠN LÀ CHUYÊN VIÊN TƯ VẤN TẠI TRUNG TÂM TIẾNG TRUNG THANHMAIHSK
-                
-                === KIẾN THỨC CƠ SỞ ===
-                {knowledge}
-
-                === THÔNG TIN KHÁCH HÀNG ĐÃ CÓ ===
-                {customer_info}
-
-                === THÔNG TIN CẦN THU THẬP ===
-                Bắt buộc: {required_info_list}
-                Tùy chọn: {optional_info_list}
-
-                === NGUYÊN TẮC QUAN TRỌNG NHẤT ===
-                
-                🚨 QUY TẮC SỐ 1 - ƯU TIÊN Ý ĐỊNH THỰC SỰ CỦA KHÁCH:
-                - PHÂN TÍCH câu hỏi/tin nhắn của khách để HIỂU Ý ĐỊNH THỰC SỰ
-                - Khách muốn biết ĐIỀU GÌ? → TRẢ LỜI ĐIỀU ĐÓ TRƯỚC
-                - ĐỪNG cứng nhắc theo quy trình nếu khách đang hỏi điều khác
-                - Sau khi TRẢ LỜI ĐẦY ĐỦ, mới cân nhắc tiếp tục quy trình
-                
-                🚨 QUY TẮC SỐ 2 - TUYỆT ĐỐI KHÔNG HỎI LẠI THÔNG TIN ĐÃ CÓ:
-                - LUÔN KIỂM TRA "THÔNG TIN KHÁCH HÀNG ĐÃ CÓ" TRƯỚC KHI HỎI BẤT KỲ ĐIỀU GÌ
-                - Nếu đã có Họ tên → KHÔNG HỎI LẠI họ tên
-                - Nếu đã có SĐT → KHÔNG HỎI LẠI số điện thoại
-                - Nếu đã có Email → KHÔNG HỎI LẠI email
-                - Nếu đã có bất kỳ thông tin nào → KHÔNG HỎI LẠI thông tin đó
-                - ĐẶC BIỆT: Khi tư vấn khóa thứ 2, thứ 3... CHỈ hỏi về khóa học, KHÔNG hỏi lại thông tin cá nhân
-                - Hỏi lại thông tin đã có = GÂY KHÓ CHỊU CỰC KỲ CHO KHÁCH HÀNG
-                
-                ⚠️ QUY TẮC SỐ 3 - CHỈ TRẢ LỜI DỰA VÀO === KIẾN THỨC CƠ SỞ ===:
-                - KHÔNG ĐƯỢC BỊA RA bất kỳ thông tin nào không có trong kiến thức cơ sở
-                - CHỈ TƯ VẤN CÁC KHÓA HỌC có trong dữ liệu kiến thức cơ sở
-                - Nếu không có thông tin trong kiến thức cơ sở: "Em cần tìm hiểu thêm về vấn đề này và sẽ phản hồi anh/chị sớm nhất ạ"
-                - CHỈ ĐƯA RA GIÁ CỦA CÁC KHÓA HỌC được nêu rõ trong kiến thức cơ sở
-                - Nếu khách hỏi về khóa học không có trong dữ liệu: "Hiện tại em cần kiểm tra lại chương trình này và sẽ tư vấn anh/chị sau ạ"
-
-                === XỬ LÝ CÂU HỎI NGOÀI LỀ - ƯU TIÊN CAO NHẤT ===
-                
-                🚨 CỰC KỲ QUAN TRỌNG: KHÁCH HÀNG KHÔNG BẮT BUỘC PHẢI THEO QUY TRÌNH
-                
-                **TRIẾT LÝ XỬ LÝ - LINH HOẠT, KHÔNG CỨNG NHẮC:**
-                - Quy trình 7 bước CHỈ LÀ THAM KHẢO, KHÔNG BẮT BUỘC
-                - Khách hàng có quyền HỎI BẤT CỨ ĐIỀU GÌ, BẤT CỨ KHI NÀO
-                - Công việc của bạn: TRẢ LỜI NHỮNG GÌ KHÁCH ĐANG QUAN TÂM
-                - QUY TRÌNH phục vụ KHÁCH HÀNG, không phải KHÁCH HÀNG phục vụ quy trình
-                
-                **NGUYÊN TẮC XỬ LÝ CÂU HỎI NGOÀI LỀ:**
-                1. PHÂN TÍCH: Khách ĐANG QUAN TÂM đến điều gì?
-                2. TẬP TRUNG: Trả lời ĐIỀU KHÁCH ĐANG HỎI, không lạc đề
-                3. TRẢ LỜI ĐẦY ĐỦ: Cung cấp MỌI thông tin liên quan từ KIẾN THỨC CƠ SỞ
-                4. KHÔNG ÉP QUY TRÌNH: Đừng cố kéo về "bước tiếp theo" khi khách chưa hài lòng
-                5. TỰ NHIÊN: Chỉ tiếp tục quy trình khi cuộc trò chuyện TỰ NHIÊN chuyển sang chủ đề khác
-
-                **THÔNG TIN LIÊN HỆ:**
-                📞 Tổng đài: 1900 633 018
-                📱 Hotline Hà Nội: 0931.715.889  
-                📱 Hotline TP.HCM: 0888 616 819
-                🌐 Website: thanhmaihsk.edu.vn
-
-                === BỐI CẢNH CUỘC TRÒ CHUYỆN ===
-                Lịch sử: {history}
-                
-                Tin nhắn mới: {query}
-
-                === HƯỚNG DẪN XỬ LÝ ===
-                1. Phân tích lịch sử hội thoại để XÁC ĐỊNH ĐANG Ở BƯỚC NÀO trong quy trình 7 bước
-                2. Kiểm tra xem đã có đủ thông tin cho bước hiện tại chưa
-                3. Nếu thiếu thông tin: Thu thập thông tin còn thiếu
-                4. Nếu đủ thông tin: Chuyển sang bước tiếp theo
-                5. CHỈ TẬP TRUNG VÀO 1 BƯỚC tại 1 thời điểm
-                6. KHÔNG nhảy bước hoặc trả lời vượt quá bước hiện tại
-                7. Luôn đảm bảo quy trình logic: Bước 1 → Bước 2 → ... → Bước 7
+        except Exception as e:
+            print(e)
+            return f"Lỗi khi sinh câu trả lời: {str(e)}"
 
-                === TRẢ LỜI CỦA BẠN ===
-               """
+    async def generate_response_stream(self, query: str, chat_session_id: int):
+        """Giống generate_response nhưng yield từng delta ngay khi model sinh ra"""
+        try:
+            # Ensure model is initialized
+            if not self.is_initialized:
+                await self.initialize()
             
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-            )
+            if not query or query.strip() == "":
+                yield "Nội dung câu hỏi trống, vui lòng nhập lại."
+                return
             
-            return response.choices[0].message.content.strip()
+            prompt = await self.build_answer_prompt(query, chat_session_id)
+            if self.last_context.get("cached_answer"):
+                yield self.last_context["cached_answer"]
+                return
+            deltas = []
+            async for delta in self.completion.stream(prompt["user"], temperature=0.3, system=prompt["system"]):
+                deltas.append(delta)
+                yield delta
+            store_answer_in_background(self.last_context, "".join(deltas).strip())
             
         except Exception as e:
+            # Có thể đã yield 1 phần câu trả lời → để người gọi thay bằng câu trả lời dự phòng,
+            # không nối text lỗi vào sau phần đã stream
             print(e)
-            return f"Lỗi khi sinh câu trả lời: {str(e)}"
+            raise
 
     async def extract_customer_info_realtime(self, chat_session_id: int, limit_messages: int):
         """Trích xuất thông tin khách hàng theo thời gian thực sử dụng OpenAI"""
@@ -386,7 +285,8 @@ class RAGModel(BaseRAGModel):
             if not self.is_initialized:
                 await self.initialize()
                 
-            history = await self.get_latest_messages(chat_session_id=chat_session_id, limit=limit_messages)
+            # Tóm tắt hội thoại (nếu có) + các tin nhắn chưa được tóm tắt
+            history = await conversation_with_summary(self.db_session, chat_session_id, limit_messages)
             
             # Lấy cấu hình fields động
             required_fields, optional_fields = await self.get_field_configs()
@@ -401,14 +301,23 @@ class RAGModel(BaseRAGModel):
                 empty_json = {field_name: None for field_name in all_fields.values()}
                 return json.dumps(empty_json)
             
-            # Tạo danh sách fields cho prompt - chỉ các fields từ field_config
+            # SĐT / email / họ tên lấy bằng regex, LLM chỉ trích xuất các trường còn thiếu
+            extracted = {field_name: None for field_name in all_fields.values()}
+            local_fields = extract_contact_fields(history, all_fields.values())
+            extracted.update(local_fields)
+            llm_fields = [field_name for field_name in all_fields.values() if field_name not in local_fields]
+            if not llm_fields:
+                print(f"⚡ [EXTRACT] Session {chat_session_id}: đủ trường bằng regex, không gọi LLM")
+                return json.dumps(extracted, ensure_ascii=False)
+            
+            # Tạo danh sách fields cho prompt - chỉ các fields còn thiếu
             fields_description = "\n".join([
                 f"- {field_name}: trích xuất {field_name.lower()} từ hội thoại"
-                for field_name in all_fields.values()
+                for field_name in llm_fields
             ])
             
-            # Tạo ví dụ JSON template - chỉ các fields từ field_config
-            example_json = {field_name: f"<{field_name}>" for field_name in all_fields.values()}
+            # Tạo ví dụ JSON template - chỉ các fields còn thiếu
+            example_json = {field_name: f"<{field_name}>" for field_name in llm_fields}
             example_json_str = json.dumps(example_json, ensure_ascii=False, indent=4)
             
             prompt = f"""
@@ -432,23 +341,22 @@ class RAGModel(BaseRAGModel):
                 {example_json_str}
                 """
                 
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-            )
-            cleaned = re.sub(r"```json|```", "", response.choices[0].message.content).strip()
+            response_text = await self.completion.generate(prompt, temperature=0)
+            cleaned = re.sub(r"```json|```", "", response_text).strip()
             
-            return cleaned
+            try:
+                llm_data = json.loads(cleaned)
+            except json.JSONDecodeError:
+                llm_data = {}
+            if isinstance(llm_data, dict):
+                extracted.update({field_name: llm_data.get(field_name) for field_name in llm_fields})
+            return json.dumps(extracted, ensure_ascii=False)
             
         except Exception as e:
             print(f"Lỗi trích xuất thông tin: {str(e)}")
             return None
     
     @staticmethod
-    def clear_field_configs_cache():
-        """Xóa cache field configs khi có thay đổi cấu hình"""
-        cache_key = "field_configs:required_optional"
-        success = cache_delete(cache_key)
-        print(f"DEBUG: {'Thành công' if success else 'Thất bại'} xóa cache field configs")
-        return success
+    async def clear_field_configs_cache():
+        """Xóa cache field configs (mọi worker) khi có thay đổi cấu hình"""
+        await invalidate(FIELD_CONFIGS_KEY)
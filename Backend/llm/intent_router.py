@@ -0,0 +1,130 @@
+"""
+Router ý định cục bộ đặt trước RAG: trả lời ngay các tin nhắn không cần tra cứu
+
+- greeting : "chào em", "hello ad"...   → LLM.system_greeting (id=1), không có thì template mặc định
+- thanks   : "cảm ơn", "thanks"...
+- goodbye  : "tạm biệt", "bye"...
+- ack      : "ok", "oke", "ok rồi"... - chỉ trả lời bằng template khi tin nhắn
+             bot trước đó KHÔNG phải câu hỏi (nếu bot vừa hỏi "đăng ký học thử không?"
+             thì "ok" là câu trả lời, phải để RAG xử lý tiếp)
+- non_text : tin nhắn thay thế NON_TEXT_PLACEHOLDER do parse_facebook / parse_zalo / parse_telegram tạo
+
+Chỉ khớp khi tin nhắn NGẮN (tối đa INTENT_MAX_TOKENS từ, tính cả từ đệm) và TOÀN BỘ tin nhắn là
+cụm từ của ý định, so nguyên từ (sau khi bỏ dấu, bỏ từ đệm như "ạ", "em", "ad", "nhé")
+→ "chào em, học phí HSK3 bao nhiêu?", "chi phí", "khi nào" vẫn đi vào RAG.
+Tin nhắn không còn chữ nào sau khi chuẩn hóa (chỉ emoji, "???", tiếng Trung, chỉ gọi "anh ơi"...)
+không phải ý định đơn giản → RAG.
+Kiểm tra: python test_intent_router.py
+Template sửa được qua biến môi trường INTENT_TEMPLATES (JSON {intent: câu trả lời})
+"""
+import json
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from helper.vietnamese import normalize_vietnamese
+from llm.conversation_window import get_recent_messages
+from llm.llm_config import get_llm_config
+
+load_dotenv()
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+
+# Tin nhắn dài hơn (kể cả từ đệm) không bao giờ là câu chào / cảm ơn thuần túy
+INTENT_MAX_TOKENS = 6
+
+NON_TEXT_PLACEHOLDER = "Hiện tại hệ thống chỉ hỗ trợ tin nhắn dạng text. Vui lòng gửi lại tin nhắn bằng văn bản."
+
+INTENT_PHRASES = {
+    "greeting": {
+        "chao", "xin chao", "hello", "hi", "helo", "hey", "alo", "chao buoi sang",
+        "chao buoi chieu", "chao buoi toi", "hi there",
+    },
+    "thanks": {
+        "cam on", "cam on nhieu", "thanks", "thank", "thank you", "thanks you", "tks", "thanks nhieu",
+        "cam on nhe", "xin cam on",
+    },
+    "goodbye": {"tam biet", "bye", "bye bye", "hen gap lai", "chao tam biet"},
+    "ack": {"ok", "oke", "okay", "okie", "oki", "ok roi", "oke roi", "uh", "um"},
+}
+
+# Từ đệm / xưng hô được bỏ qua khi so khớp
+FILLERS = {
+    "a", "ah", "oi", "nhe", "nha", "nhen", "ne", "em", "anh", "chi", "ban", "ad", "admin",
+    "shop", "thanhmaihsk", "nhieu", "lam",
+}
+
+DEFAULT_TEMPLATES = {
+    "greeting": "Dạ em chào anh/chị ạ! Em có thể hỗ trợ gì cho anh/chị về các khóa học tiếng Trung tại THANHMAIHSK ạ?",
+    "thanks": "Dạ không có gì ạ! Anh/chị cần em hỗ trợ thêm thông tin gì cứ nhắn em nhé ạ.",
+    "goodbye": "Dạ em cảm ơn anh/chị đã quan tâm THANHMAIHSK. Chúc anh/chị một ngày tốt lành ạ!",
+    "ack": "Dạ vâng ạ. Anh/chị cần em tư vấn thêm gì cứ nhắn em nhé ạ.",
+    "non_text": "Dạ hiện tại em chỉ đọc được tin nhắn dạng chữ ạ. Anh/chị vui lòng nhắn câu hỏi bằng văn bản giúp em nhé!",
+}
+
+try:
+    INTENT_TEMPLATES = {**DEFAULT_TEMPLATES, **json.loads(os.getenv("INTENT_TEMPLATES", "{}"))}
+except json.JSONDecodeError:
+    print("⚠️ [INTENT] INTENT_TEMPLATES không phải JSON hợp lệ, dùng template mặc định")
+    INTENT_TEMPLATES = dict(DEFAULT_TEMPLATES)
+
+def classify_intent(content: str) -> Optional[str]:
+    """Ý định đơn giản của tin nhắn, None = câu hỏi thực sự (đi vào RAG)"""
+    if content is None:
+        return None
+    if content.strip() == NON_TEXT_PLACEHOLDER:
+        return "non_text"
+
+    words = normalize_vietnamese(content).split()
+    if len(words) > INTENT_MAX_TOKENS:
+        return None
+    # So khớp nguyên từ: "chi phi" / "khi nao" không chứa từ "hi"
+    tokens = [token for token in words if token not in FILLERS]
+    if len(tokens) > 4:
+        return None
+    text = " ".join(tokens)
+    # Rỗng sau chuẩn hóa: emoji, dấu câu, chữ Hán, hoặc chỉ có xưng hô / từ đệm ("anh ơi", "em")
+    if not text:
+        return None
+
+    for intent, phrases in INTENT_PHRASES.items():
+        if text in phrases:
+            return intent
+    return None
+
+
+async def get_system_greeting(db) -> Optional[str]:
+    """LLM.system_greeting (id=1) từ cache cấu hình LLM (llm/llm_config.py)"""
+    return (await get_llm_config(db) or {}).get("system_greeting")
+
+
+async def _last_bot_message(db, chat_session_id: int) -> Optional[str]:
+    rows = await get_recent_messages(db, chat_session_id, 3)
+    for row in reversed(rows):
+        if row["sender_type"] == "bot":
+            return row["content"]
+    return None
+
+
+async def route_message(db, content: str, chat_session_id: int) -> Optional[str]:
+    """Câu trả lời template nếu tin nhắn là ý định đơn giản, None → cần gọi RAG"""
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    intent = classify_intent(content)
+    if intent is None:
+        return None
+
+    try:
+        if intent == "ack":
+            last_bot = await _last_bot_message(db, chat_session_id)
+            if last_bot and "?" in last_bot:
+                return None
+
+        reply = INTENT_TEMPLATES[intent]
+        if intent == "greeting":
+            reply = await get_system_greeting(db) or reply
+    except Exception as e:
+        print(f"⚠️ [INTENT] Lỗi router, chuyển sang RAG: {e}")
+        return None
+
+    print(f"🧭 [INTENT] '{content[:40]}' → {intent} (không gọi RAG)")
+    return reply
@@ -0,0 +1,40 @@
+"""
+Cấu hình LLM (bản ghi id=1) đọc qua cache 2 tầng (config/local_cache.py)
+
+Dùng chung cho RAGModel.initialize (API key), get_model_type (Gemini / GPT) và
+system_greeting của intent router → 0 query / 0 round-trip Redis mỗi tin nhắn.
+Chỉ giữ trong L1 (không chép API key sang Redis), các worker được báo xóa qua pub/sub
+khi update_llm_service gọi invalidate_llm_config().
+"""
+from typing import Optional
+from sqlalchemy import select
+from config.local_cache import LLM_CONFIG_KEY, cached, invalidate
+from models.llm import LLM
+
+
+async def get_llm_config(db) -> Optional[dict]:
+    async def load():
+        result = await db.execute(select(LLM).filter(LLM.id == 1))
+        llm = result.scalar_one_or_none()
+        if not llm:
+            return None
+        return {
+            "id": llm.id,
+            "name": llm.name,
+            "key": llm.key,
+            "prompt": llm.prompt,
+            "system_greeting": llm.system_greeting,
+            "botName": llm.botName,
+        }
+
+    return await cached(LLM_CONFIG_KEY, load, shared=False)
+
+
+def model_type_of(llm_config: Optional[dict]) -> str:
+    """"gpt" nếu tên LLM chứa gpt / openai, còn lại "gemini" """
+    name = ((llm_config or {}).get("name") or "").lower()
+    return "gpt" if ("gpt" in name or "openai" in name) else "gemini"
+
+
+async def invalidate_llm_config():
+    await invalidate(LLM_CONFIG_KEY)
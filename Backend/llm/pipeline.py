@@ -0,0 +1,216 @@
+"""
+Pipeline chuẩn bị ngữ cảnh trả lời dùng chung cho các RAG model (Gemini, OpenAI)
+
+Các stage:
+1. db_reads      : history (cửa sổ Redis, llm/conversation_window.py) + tóm tắt hội thoại + thông tin khách + field configs + phiên bản KB chạy SONG SONG
+                   (mỗi query 1 AsyncSession riêng vì AsyncSession không cho chạy query đồng thời)
+2. search_key    : câu hỏi tự đủ nghĩa → dùng nguyên văn, còn lại gọi LLM tạo từ khóa
+                   (có cache), dùng lại history đã lấy ở bước 1 (llm/search_key.py)
+3. answer_cache  : tra cache câu trả lời theo từ khóa (llm/answer_cache.py), chỉ với câu hỏi
+                   tự đủ nghĩa (context["answer_cacheable"], cũng quyết định có lưu câu trả lời không),
+                   hit → context["cached_answer"], bỏ qua bước 4 và lần gọi LLM trả lời
+4. vector_search : tìm tài liệu theo từ khóa
+   - SPECULATIVE_SEARCH=true: tìm trước theo câu hỏi gốc trong lúc chờ LLM ở bước 2,
+     nếu từ khóa trùng câu hỏi gốc thì dùng luôn kết quả này
+
+Sau bước 1, tóm tắt hội thoại được cập nhật ở background (llm/summary.py):
+history trong prompt = summary + các tin nhắn chưa được tóm tắt
+
+Thời gian từng stage được in ra và trả về trong context["timings"] (ms)
+"""
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from llm import answer_cache, retrieval, summary
+from llm.conversation_window import get_recent_messages
+from llm.search_key import clean_question, is_self_contained, resolve_search_key
+
+load_dotenv()
+
+# Tìm kiếm dự đoán theo câu hỏi gốc (tốn thêm 1 lần embedding nếu từ khóa khác câu hỏi)
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "false").lower() == "true"
+
+# Giữ reference tới task nền để không bị garbage collect giữa chừng
+_background_tasks = set()
+
+HISTORY_LIMIT = 10
+SEARCH_KEY_HISTORY_LIMIT = 5
+# Retrieval hybrid (llm/retrieval.py) xếp hạng tốt hơn → lấy ít chunk hơn, prompt ngắn hơn
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", 6))
+
+
+class StageTimer:
+    """Đo thời gian từng stage (ms), các stage có thể chạy lồng nhau / song song"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    async def track(self, name: str, coro):
+        async with self.stage(name):
+            return await coro
+
+    def report(self) -> Dict[str, float]:
+        self.timings["total"] = (time.perf_counter() - self._start) * 1000
+        stages = " | ".join(f"{name}: {ms:.0f}ms" for name, ms in self.timings.items())
+        print(f"⏱️ [PIPELINE] {self.label} | {stages}")
+        return self.timings
+
+
+def format_conversation(rows: List[Dict]) -> str:
+    return "\n".join(f"{msg['sender_type']}: {msg['content']}" for msg in rows)
+
+
+async def _with_session(fn):
+    """Chạy fn(db) với 1 AsyncSession riêng để các query chạy song song được"""
+    async with AsyncSessionLocal() as db:
+        return await fn(db)
+
+
+def _normalize_query(query: str) -> str:
+    query = re.sub(r"\s+", " ", query or "").strip().lower()
+    return query.rstrip("?.!… ")
+
+
+def _discard(task: asyncio.Task):
+    """Hủy task dự đoán, nuốt exception để không bị log 'Task exception was never retrieved'"""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def prepare_answer_context(model, query: str, chat_session_id: int) -> Dict:
+    """
+    Chuẩn bị ngữ cảnh cho prompt trả lời
+
+    Returns:
+        dict: history, history_rows (không gồm tin nhắn hiện tại và tin đã tóm tắt), summary,
+              customer_info, search_key, knowledge, required_fields, optional_fields, kb_version,
+              answer_cacheable, cached_answer, timings
+    """
+    timer = StageTimer(f"session {chat_session_id}")
+
+    speculative_task = None
+    if SPECULATIVE_SEARCH:
+        speculative_task = asyncio.create_task(timer.track(
+            "speculative_search",
+            _with_session(lambda db: model.search_similar_documents(query, SEARCH_TOP_K, db=db))
+        ))
+
+    # Stage 1: các query DB độc lập chạy song song
+    async with timer.stage("db_reads"):
+        rows, (conversation_summary, watermark), customer_info, (required_fields, optional_fields), kb_version = await asyncio.gather(
+            timer.track("history", _with_session(
+                lambda db: get_recent_messages(db, chat_session_id, HISTORY_LIMIT)
+            )),
+            timer.track("summary", _with_session(
+                lambda db: summary.get_session_summary(db, chat_session_id)
+            )),
+            timer.track("customer_info", _with_session(
+                lambda db: model.get_customer_infor(chat_session_id, db=db)
+            )),
+            timer.track("field_configs", _with_session(
+                lambda db: model.get_field_configs(db=db)
+            )),
+            timer.track("kb_version", _with_session(retrieval.get_active_kb_version)),
+        )
+
+    # Stage 2: từ khóa tìm kiếm, dùng lại phần cuối của history vừa lấy
+    # (bỏ tin nhắn hiện tại nếu đã được lưu trước khi gọi pipeline)
+    rows = summary.after_watermark(rows, watermark)
+    prior_rows = rows[:-1] if rows and rows[-1]["content"] == query else rows
+    summary.schedule_update(model.completion, chat_session_id)
+    try:
+        async with timer.stage("search_key"):
+            vocabulary = await _with_session(retrieval.get_filter_vocabulary)
+            search_key = await resolve_search_key(
+                model, chat_session_id, query, customer_info,
+                format_conversation(prior_rows[-SEARCH_KEY_HISTORY_LIMIT:]), vocabulary
+            )
+    except BaseException:
+        if speculative_task:
+            _discard(speculative_task)
+        raise
+    print(f"Search key: {search_key}")
+
+    # Stage 3: cache câu trả lời - câu hỏi phụ thuộc ngữ cảnh hội thoại không dùng / không lưu cache
+    answer_cacheable = is_self_contained(clean_question(query), vocabulary)
+    cached_answer = None
+    if answer_cacheable:
+        async with timer.stage("answer_cache"):
+            cached_answer = await answer_cache.lookup(search_key, kb_version, customer_info, required_fields)
+    if cached_answer is not None:
+        if speculative_task:
+            _discard(speculative_task)
+        return {
+            "history": format_conversation(rows),
+            "history_rows": prior_rows,
+            "summary": conversation_summary,
+            "customer_info": customer_info,
+            "search_key": search_key,
+            "knowledge": [],
+            "required_fields": required_fields,
+            "optional_fields": optional_fields,
+            "kb_version": kb_version,
+            "answer_cacheable": answer_cacheable,
+            "cached_answer": cached_answer,
+            "timings": timer.report(),
+        }
+
+    # Stage 4: vector search (dùng kết quả dự đoán nếu từ khóa trùng câu hỏi gốc)
+    knowledge = None
+    async with timer.stage("vector_search"):
+        # Kết quả dự đoán chỉ lọc metadata theo câu hỏi (chạy trước khi có customer_info)
+        if speculative_task and _normalize_query(search_key) == _normalize_query(query):
+            try:
+                knowledge = await speculative_task
+                print("🎯 Speculative search hit: dùng kết quả tìm theo câu hỏi gốc")
+            except Exception as e:
+                print(f"⚠️ Speculative search lỗi, tìm lại theo từ khóa: {e}")
+        elif speculative_task:
+            _discard(speculative_task)
+
+        if knowledge is None:
+            knowledge = await model.search_similar_documents(
+                search_key, SEARCH_TOP_K, customer_info=customer_info
+            )
+
+    return {
+        "history": format_conversation(rows),
+        "history_rows": prior_rows,
+        "summary": conversation_summary,
+        "customer_info": customer_info,
+        "search_key": search_key,
+        "knowledge": knowledge,
+        "required_fields": required_fields,
+        "optional_fields": optional_fields,
+        "kb_version": kb_version,
+        "answer_cacheable": answer_cacheable,
+        "cached_answer": None,
+        "timings": timer.report(),
+    }
+
+
+def store_answer_in_background(context: Dict, answer: str):
+    """Lưu câu trả lời vừa sinh vào cache, không chặn việc trả kết quả cho khách"""
+    if not context.get("answer_cacheable"):
+        return
+    task = asyncio.create_task(answer_cache.store(
+        context["search_key"], context["kb_version"], context["customer_info"], answer,
+        context["required_fields"]
+    ))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
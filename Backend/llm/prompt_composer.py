@@ -0,0 +1,135 @@
+"""
+Ghép prompt trả lời theo ngân sách token
+
+- Quy tắc tĩnh (llm/prompt.py) đi riêng thành system prompt, luôn đứng ĐẦU và giống hệt
+  nhau giữa các request → OpenAI / Gemini cache được prefix (giảm token tính phí + latency)
+- Dữ liệu từng request (kiến thức, thông tin khách, lịch sử, câu hỏi) ở user message phía sau
+- Kiến thức: bỏ chunk trùng / gần trùng, giữ thứ tự xếp hạng, cắt theo PROMPT_KNOWLEDGE_TOKENS
+- Lịch sử: tóm tắt hội thoại (llm/summary.py) + tin nhắn mới nhất, tổng cộng trong PROMPT_HISTORY_TOKENS
+- Đếm token bằng tiktoken nếu có cài, không có thì ước lượng theo số ký tự
+"""
+import os
+from typing import Dict, List
+from dotenv import load_dotenv
+from helper.vietnamese import tokenize_vietnamese
+
+load_dotenv()
+
+PROMPT_KNOWLEDGE_TOKENS = int(os.getenv("PROMPT_KNOWLEDGE_TOKENS", 2500))
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", 1200))
+# Tỉ lệ token chung của 2 chunk (Jaccard) từ mức này trở lên coi là trùng
+DUPLICATE_OVERLAP = 0.9
+# Ước lượng khi không có tiktoken: tiếng Việt có dấu ~3 ký tự / token
+CHARS_PER_TOKEN = 3
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def dedupe_chunks(contents: List[str]) -> List[str]:
+    """Bỏ chunk trùng hoặc gần trùng với 1 chunk xếp hạng cao hơn"""
+    kept, kept_tokens = [], []
+    for content in contents:
+        tokens = set(tokenize_vietnamese(content, drop_stopwords=False))
+        duplicate = False
+        for other in kept_tokens:
+            union = tokens | other
+            if not union or len(tokens & other) / len(union) >= DUPLICATE_OVERLAP:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(content)
+            kept_tokens.append(tokens)
+    return kept
+
+
+def fit_knowledge(knowledge: List[Dict], budget: int) -> List[str]:
+    """Nội dung chunk (đã bỏ trùng) theo thứ tự xếp hạng, dừng khi hết ngân sách token"""
+    selected, used = [], 0
+    for content in dedupe_chunks([item["content"] for item in knowledge or []]):
+        tokens = count_tokens(content)
+        if selected and used + tokens > budget:
+            break
+        selected.append(content)
+        used += tokens
+    return selected
+
+
+def fit_history(rows: List[Dict], budget: int) -> List[str]:
+    """Các dòng "sender: nội dung" mới nhất vừa ngân sách, trả về theo thứ tự thời gian"""
+    lines, used = [], 0
+    for row in reversed(rows or []):
+        line = f"{row['sender_type']}: {row['content']}"
+        tokens = count_tokens(line)
+        if lines and used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+    return list(reversed(lines))
+
+
+def render_context(knowledge: str, customer_info, required_info_list: str,
+                   optional_info_list: str, history: str, query: str, summary: str = None) -> str:
+    """Phần dữ liệu của từng request, đặt SAU quy tắc tĩnh"""
+    summary_section = f"=== TÓM TẮT HỘI THOẠI TRƯỚC ĐÓ ===\n{summary}\n\n" if summary else ""
+    return (
+        f"=== KIẾN THỨC CƠ SỞ ===\n{knowledge}\n\n"
+        f"=== THÔNG TIN KHÁCH HÀNG ĐÃ CÓ ===\n{customer_info}\n\n"
+        f"=== THÔNG TIN CẦN THU THẬP ===\n"
+        f"Bắt buộc: {required_info_list}\n"
+        f"Tùy chọn: {optional_info_list}\n\n"
+        f"{summary_section}"
+        f"=== BỐI CẢNH CUỘC TRÒ CHUYỆN ===\n"
+        f"Lịch sử: {history}\n\n"
+        f"Tin nhắn mới: {query}\n\n"
+        f"=== TRẢ LỜI CỦA BẠN ==="
+    )
+
+
+def compose_answer_prompt(rules: str, query: str, context: Dict) -> Dict:
+    """
+    Returns:
+        dict: system (quy tắc tĩnh), user (dữ liệu request), token_counts
+    """
+    knowledge = fit_knowledge(context["knowledge"], PROMPT_KNOWLEDGE_TOKENS)
+    summary = context.get("summary")
+    # Tóm tắt dùng chung ngân sách với lịch sử, phần còn lại cho các tin nhắn mới nhất
+    summary_tokens = count_tokens(summary)
+    history = fit_history(context["history_rows"], max(PROMPT_HISTORY_TOKENS - summary_tokens, 0))
+    required_info_list = "\n".join(f"- {name} (bắt buộc)" for name in context["required_fields"].values())
+    optional_info_list = "\n".join(f"- {name} (tùy chọn)" for name in context["optional_fields"].values())
+
+    knowledge_text = "\n\n".join(f"[{i}] {content}" for i, content in enumerate(knowledge, start=1))
+    history_text = "\n".join(history)
+    user = render_context(
+        knowledge_text, context["customer_info"], required_info_list,
+        optional_info_list, history_text, query, summary
+    )
+
+    token_counts = {
+        "system": count_tokens(rules),
+        "knowledge": count_tokens(knowledge_text),
+        "summary": summary_tokens,
+        "history": count_tokens(history_text),
+        "user": count_tokens(user),
+    }
+    token_counts["total"] = token_counts["system"] + token_counts["user"]
+    print(
+        f"🧮 [PROMPT] system {token_counts['system']} (prefix cố định) | "
+        f"knowledge {token_counts['knowledge']} ({len(knowledge)}/{len(context['knowledge'] or [])} chunk) | "
+        f"summary {token_counts['summary']} | "
+        f"history {token_counts['history']} ({len(history)}/{len(context['history_rows'] or [])} tin) | "
+        f"total {token_counts['total']} tokens"
+    )
+    return {"system": rules, "user": user, "token_counts": token_counts}
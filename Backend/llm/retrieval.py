@@ -0,0 +1,274 @@
+"""
+Tìm kiếm vector trên document_chunks dùng chung cho các RAG model
+
+2 chế độ (VECTOR_SEARCH_MODE):
+- ann  (mặc định): lấy ANN_CANDIDATES ứng viên qua index HNSW trên search_vector_ann
+        (vector rút gọn ANN_DIMENSIONS chiều), rồi re-rank chính xác bằng search_vector đầy đủ
+- exact: scan tuần tự, tính khoảng cách 3072 chiều cho mọi row (cách cũ)
+
+Cả 2 chế độ chỉ đọc phiên bản chunk đang active (knowledge_index_state)
+
+VECTOR_SEARCH_BACKEND=memory: bỏ qua Postgres, search trên index NumPy trong process
+(llm/vector_index.py) - phù hợp knowledge base nhỏ (1 sheet)
+
+RETRIEVAL_MODE=hybrid (mặc định): thêm tìm kiếm từ khóa full-text trên search_text
+(chunk_text đã bỏ dấu, helper/vietnamese.py) để bắt mã khóa học / cơ sở / thành phố,
+rồi gộp 2 bảng xếp hạng bằng reciprocal rank fusion: score = Σ 1 / (RRF_K + rank).
+Khi đó similarity_score là điểm RRF (càng cao càng liên quan), không còn là khoảng cách L2.
+RETRIEVAL_MODE=vector: chỉ tìm kiếm vector như cũ
+
+Lọc theo metadata (helper/chunk_metadata.py): khóa học / thành phố / cơ sở / hình thức /
+tháng khai giảng nhận diện từ câu hỏi và thông tin khách hàng → chỉ search trong chunk
+khớp metadata (chunk không có metadata đó, VD chính sách chung, vẫn được giữ).
+Lọc xong không còn chunk nào thì search lại không lọc
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import text
+from dotenv import load_dotenv
+from config.get_embedding import get_embedding_chatgpt, reduce_embedding
+from helper.chunk_metadata import TEXT_FIELDS, extract_filters
+from helper.vietnamese import tokenize_vietnamese
+from llm.vector_index import vector_index
+
+load_dotenv()
+
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "postgres").lower()
+VECTOR_SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "ann").lower()
+# Số ứng viên lấy từ index ANN trước khi re-rank (>= top_k)
+ANN_CANDIDATES = int(os.getenv("ANN_CANDIDATES", 40))
+# hnsw.ef_search mặc định của pgvector là 40 → phải >= số ứng viên cần lấy
+HNSW_DEFAULT_EF_SEARCH = 40
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# Số kết quả lấy từ mỗi nhánh (vector / từ khóa) trước khi gộp
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = 60
+# Giây giữ danh sách giá trị metadata (khóa học, cơ sở...) dùng nhận diện bộ lọc
+FILTER_VOCABULARY_TTL = float(os.getenv("FILTER_VOCABULARY_TTL", 60))
+
+ACTIVE_VERSION_SQL = "COALESCE((SELECT active_version FROM knowledge_index_state WHERE id = 1), 0)"
+
+
+async def get_active_kb_version(db) -> int:
+    result = await db.execute(text(f"SELECT {ACTIVE_VERSION_SQL}"))
+    return result.scalar_one()
+
+
+def to_query_vector(vector) -> np.ndarray:
+    """Tham số vector cho câu SQL: ndarray float32, codec binary asyncpg (config/pgvector_codec.py) gửi thẳng"""
+    return np.asarray(vector, dtype=np.float32)
+
+
+_vocabulary_cache = {"expires_at": 0.0, "value": {}}
+
+
+async def get_filter_vocabulary(db) -> Dict[str, set]:
+    """Các giá trị metadata đang có ở phiên bản active (cache FILTER_VOCABULARY_TTL giây)"""
+    if VECTOR_SEARCH_BACKEND == "memory":
+        await vector_index.refresh()
+        return vector_index.vocabulary
+
+    if time.monotonic() < _vocabulary_cache["expires_at"]:
+        return _vocabulary_cache["value"]
+
+    vocabulary = {}
+    for field in TEXT_FIELDS:
+        result = await db.execute(text(f"""
+            SELECT DISTINCT {field} FROM document_chunks
+            WHERE kb_version = {ACTIVE_VERSION_SQL} AND {field} IS NOT NULL
+        """))
+        vocabulary[field] = set(result.scalars().all())
+
+    _vocabulary_cache.update(expires_at=time.monotonic() + FILTER_VOCABULARY_TTL, value=vocabulary)
+    return vocabulary
+
+
+async def resolve_filters(db, query: str, customer_info: dict = None) -> Dict:
+    """Bộ lọc từ thông tin khách hàng, câu hỏi được ưu tiên nếu cùng field"""
+    vocabulary = await get_filter_vocabulary(db)
+    if not any(vocabulary.values()):
+        return {}
+
+    filters = {}
+    if customer_info:
+        customer_text = " . ".join(str(value) for value in customer_info.values() if value)
+        filters = extract_filters(customer_text, vocabulary)
+        filters.pop("start_month", None)
+    filters.update(extract_filters(query, vocabulary))
+    return filters
+
+
+def build_filter_sql(filters: Dict) -> str:
+    """Điều kiện AND cho bộ lọc metadata, giá trị truyền qua tham số :filter_<field>"""
+    clauses = []
+    for field in filters:
+        if field == "start_month":
+            clauses.append("(start_date IS NULL OR EXTRACT(MONTH FROM start_date) = :filter_start_month)")
+        else:
+            clauses.append(f"({field} IS NULL OR {field} = :filter_{field})")
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def filter_params(filters: Dict) -> Dict:
+    return {f"filter_{field}": value for field, value in filters.items()}
+
+
+def build_search_sql(mode: str, table: str = "document_chunks", version_filter: bool = True,
+                     filter_sql: str = "") -> str:
+    """
+    Câu SQL search dùng chung: mỗi tham số vector xuất hiện 1 lần,
+    khoảng cách tính 1 lần ở SELECT và ORDER BY theo alias
+    """
+    where = f"WHERE kb_version = {ACTIVE_VERSION_SQL}{filter_sql}" if version_filter else ""
+
+    if mode == "exact":
+        return f"""
+            SELECT id, chunk_text, search_vector <-> CAST(:query_embedding AS vector) AS similarity
+            FROM {table}
+            {where}
+            ORDER BY similarity
+            LIMIT :top_k
+        """
+
+    return f"""
+        WITH candidates AS (
+            SELECT id, chunk_text, search_vector,
+                   search_vector_ann <-> CAST(:query_embedding_ann AS vector) AS ann_distance
+            FROM {table}
+            {where}
+            ORDER BY ann_distance
+            LIMIT :candidates
+        )
+        SELECT id, chunk_text, search_vector <-> CAST(:query_embedding AS vector) AS similarity
+        FROM candidates
+        ORDER BY similarity
+        LIMIT :top_k
+    """
+
+
+async def search_by_embedding(db, query_embedding, top_k: int, mode: str = None,
+                              table: str = "document_chunks", version_filter: bool = True,
+                              filters: Dict = None):
+    """Trả về list row (id, chunk_text, similarity) gần query_embedding nhất"""
+    mode = mode or VECTOR_SEARCH_MODE
+    params = {"query_embedding": to_query_vector(query_embedding), "top_k": top_k}
+    filter_sql = ""
+    if filters:
+        # Tập chunk sau khi lọc nhỏ → scan chính xác rẻ, tránh HNSW lọc sau làm thiếu kết quả
+        mode = "exact"
+        filter_sql = build_filter_sql(filters)
+        params.update(filter_params(filters))
+
+    if mode != "exact":
+        candidates = max(ANN_CANDIDATES, top_k)
+        params["query_embedding_ann"] = to_query_vector(reduce_embedding(query_embedding))
+        params["candidates"] = candidates
+        if candidates > HNSW_DEFAULT_EF_SEARCH:
+            # set_config(..., true) = SET LOCAL, chỉ có hiệu lực trong transaction hiện tại
+            await db.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                {"ef_search": str(candidates)}
+            )
+
+    result = await db.execute(text(build_search_sql(mode, table, version_filter, filter_sql)), params)
+    return result.fetchall()
+
+
+def build_lexical_query(query: str) -> str:
+    """Token đã bỏ dấu nối bằng OR cho to_tsquery (chỉ gồm [0-9a-z] nên không cần escape)"""
+    return " | ".join(tokenize_vietnamese(query))
+
+
+async def lexical_search(db, lexical_query: str, limit: int, filters: Dict = None):
+    """Chunk khớp từ khóa ở phiên bản active, xếp theo ts_rank_cd"""
+    filters = filters or {}
+    result = await db.execute(text(f"""
+        SELECT id, chunk_text,
+               ts_rank_cd(to_tsvector('simple', coalesce(search_text, '')),
+                          to_tsquery('simple', :lexical_query)) AS rank
+        FROM document_chunks
+        WHERE kb_version = {ACTIVE_VERSION_SQL}{build_filter_sql(filters)}
+          AND to_tsvector('simple', coalesce(search_text, '')) @@ to_tsquery('simple', :lexical_query)
+        ORDER BY rank DESC
+        LIMIT :limit
+    """), {"lexical_query": lexical_query, "limit": limit, **filter_params(filters)})
+    return result.fetchall()
+
+
+def reciprocal_rank_fusion(rankings: List[List], top_k: int) -> List:
+    """Gộp nhiều danh sách key đã xếp hạng → top_k (key, score) theo Σ 1 / (RRF_K + rank)"""
+    scores: Dict = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1.0 / (RRF_K + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+async def _hybrid_search_postgres(db, query: str, top_k: int, query_embedding, filters: Dict) -> List[Dict]:
+    lexical_query = build_lexical_query(query)
+    lexical_rows = await lexical_search(db, lexical_query, HYBRID_CANDIDATES, filters) if lexical_query else []
+    vector_rows = await search_by_embedding(
+        db, await query_embedding, max(HYBRID_CANDIDATES, top_k), filters=filters
+    )
+
+    texts = {row.id: row.chunk_text for row in vector_rows}
+    texts.update({row.id: row.chunk_text for row in lexical_rows})
+    fused = reciprocal_rank_fusion(
+        [[row.id for row in vector_rows], [row.id for row in lexical_rows]], top_k
+    )
+    return [{"content": texts[chunk_id], "similarity_score": score} for chunk_id, score in fused]
+
+
+async def _vector_search_postgres(db, top_k: int, query_embedding, filters: Dict) -> List[Dict]:
+    rows = await search_by_embedding(db, await query_embedding, top_k, filters=filters)
+    return [{"content": row.chunk_text, "similarity_score": float(row.similarity)} for row in rows]
+
+
+async def _search_memory(query: str, top_k: int, query_embedding, filters: Dict) -> List[Dict]:
+    await vector_index.refresh()
+    query_embedding = await query_embedding
+    allowed = vector_index.filter_mask(filters)
+    texts = vector_index.texts
+
+    if RETRIEVAL_MODE != "hybrid":
+        return [
+            {"content": texts[i], "similarity_score": distance}
+            for i, distance in vector_index.search_ids(query_embedding, top_k, allowed)
+        ]
+
+    candidates = max(HYBRID_CANDIDATES, top_k)
+    fused = reciprocal_rank_fusion([
+        [i for i, _ in vector_index.search_ids(query_embedding, candidates, allowed)],
+        vector_index.lexical_ids(tokenize_vietnamese(query), candidates, allowed),
+    ], top_k)
+    return [{"content": texts[i], "similarity_score": score} for i, score in fused]
+
+
+async def _search(db, query: str, top_k: int, query_embedding, filters: Dict) -> List[Dict]:
+    if VECTOR_SEARCH_BACKEND == "memory":
+        return await _search_memory(query, top_k, query_embedding, filters)
+    if RETRIEVAL_MODE == "hybrid":
+        return await _hybrid_search_postgres(db, query, top_k, query_embedding, filters)
+    return await _vector_search_postgres(db, top_k, query_embedding, filters)
+
+
+async def search_similar_documents(db, query: str, top_k: int, customer_info: dict = None) -> List[Dict]:
+    # Gọi API embedding song song với các query không cần embedding (bộ lọc, từ khóa)
+    embedding_task = asyncio.create_task(get_embedding_chatgpt(query))
+    try:
+        filters = await resolve_filters(db, query, customer_info)
+        if filters:
+            print(f"🔎 [RETRIEVAL] Lọc metadata: {filters}")
+            results = await _search(db, query, top_k, embedding_task, filters)
+            if results:
+                return results
+            print("🔎 [RETRIEVAL] Không có chunk khớp bộ lọc, tìm lại không lọc")
+        return await _search(db, query, top_k, embedding_task, {})
+    finally:
+        if not embedding_task.done():
+            embedding_task.cancel()
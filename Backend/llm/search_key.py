@@ -0,0 +1,121 @@
+"""
+Từ khóa tìm kiếm không cần gọi LLM khi có thể
+
+Prompt của build_search_key yêu cầu GIỮ NGUYÊN câu hỏi nếu đã đủ thông tin → với câu
+hỏi tự đủ nghĩa (nhận diện bằng heuristic cục bộ) dùng luôn câu hỏi làm từ khóa.
+Các câu còn lại vẫn gọi LLM, kết quả cache theo hash(đoạn cuối history, thông tin khách,
+câu hỏi) trong Redis (namespace search_key dùng codec text: "2025" đọc lại vẫn là str).
+
+Heuristic "tự đủ nghĩa" (trên text đã bỏ dấu):
+- Không có cụm tham chiếu ngữ cảnh ("khóa đó", "lớp này", "còn ... thì sao"...) - so khớp
+  nguyên từ trên text đã bỏ dấu, không dùng âm tiết đơn "do" / "nay" / "gia" vì trùng với
+  "trình độ", "hôm nay", "tham gia"
+- Có ít nhất MIN_CONTENT_TOKENS từ có nghĩa (bỏ stopword)
+- Hỏi học phí / nội dung / lộ trình... → phải nêu tên khóa học
+- Hỏi lịch / khai giảng → phải nêu thêm online/offline hoặc cơ sở / thành phố
+  (đúng quy tắc 3 của prompt build_search_key)
+Tin nhắn đầu tiên (chưa có history, chưa có thông tin khách) luôn dùng nguyên văn.
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, Optional
+from dotenv import load_dotenv
+from config.redis_cache import async_cache_get, async_cache_set
+from helper.chunk_metadata import extract_filters, normalize_value
+from helper.vietnamese import tokenize_vietnamese
+
+load_dotenv()
+
+SEARCH_KEY_FAST_PATH = os.getenv("SEARCH_KEY_FAST_PATH", "true").lower() == "true"
+SEARCH_KEY_CACHE_TTL = int(os.getenv("SEARCH_KEY_CACHE_TTL", 3600))
+MIN_CONTENT_TOKENS = 2
+
+# Từ chỉ định đi kèm danh từ ("khóa đó", "lớp này"...) - đứng 1 mình thì trùng với từ thường
+_DEMONSTRATIVE_NOUNS = ("khoa", "lop", "cai", "ben", "co so", "chuong trinh", "goi")
+ANAPHORA = tuple(
+    f"{noun} {marker}" for noun in _DEMONSTRATIVE_NOUNS for marker in ("do", "ay", "kia", "nay")
+) + (
+    "vi do", "o do", "nhu vay", "the con", "thi sao", "con gi", "cung vay", "tuong tu", "nhu tren",
+)
+COURSE_DEPENDENT_TOPICS = (
+    "hoc phi", "bang gia", "muc gia", "gia bao nhieu", "gia the nao", "gia tien", "gia ca", "gia khoa",
+    "bao nhieu tien", "chi phi", "giao trinh", "noi dung", "hoc gi", "thoi luong",
+    "bao lau", "lo trinh", "dau ra", "so buoi",
+)
+SCHEDULE_TOPICS = ("lich", "khai giang")
+COURSE_KEYWORDS = ("giao tiep", "tre em", "thieu nhi", "cap toc", "co ban", "1 kem 1", "so cap", "trung cap", "cao cap")
+COURSE_CODE_RE = re.compile(r"\b(hskk|hsk|yct|bct|tocfl)\d+\b")
+
+
+def _contains(text: str, phrases: Iterable[str]) -> bool:
+    """text và phrase đều đã chuẩn hóa, so khớp nguyên cụm từ (ranh giới từ, không khớp 1 phần từ)"""
+    return any(re.search(rf"\b{re.escape(phrase)}\b", text) for phrase in phrases)
+
+
+def clean_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question or "").strip().rstrip("?.!… ")
+
+
+def is_self_contained(question: str, vocabulary: Dict[str, Iterable[str]]) -> bool:
+    text = normalize_value(question)
+    if _contains(text, ANAPHORA):
+        return False
+    if len(tokenize_vietnamese(question)) < MIN_CONTENT_TOKENS:
+        return False
+
+    filters = extract_filters(question, vocabulary)
+    has_course = (
+        "course" in filters
+        or COURSE_CODE_RE.search(text) is not None
+        or _contains(text, COURSE_KEYWORDS)
+    )
+    if _contains(text, COURSE_DEPENDENT_TOPICS) and not has_course:
+        return False
+    if _contains(text, SCHEDULE_TOPICS) and not (
+        filters.keys() & {"study_mode", "campus", "city"}
+    ):
+        return False
+    return True
+
+
+def fast_search_key(question: str, history: str, customer_info: Optional[dict],
+                    vocabulary: Dict[str, Iterable[str]]) -> Optional[str]:
+    """Câu hỏi dùng được nguyên văn làm từ khóa → trả về câu hỏi đã làm sạch, ngược lại None"""
+    if not SEARCH_KEY_FAST_PATH:
+        return None
+    question = clean_question(question)
+    if not question:
+        return None
+    if not (history or "").strip() and not customer_info:
+        return question
+    return question if is_self_contained(question, vocabulary) else None
+
+
+def cache_key(question: str, history: str, customer_info: Optional[dict]) -> str:
+    payload = json.dumps(
+        [history or "", customer_info or {}, clean_question(question)],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return f"search_key:{hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+async def resolve_search_key(model, chat_session_id: int, question: str, customer_info: Optional[dict],
+                             history: str, vocabulary: Dict[str, Iterable[str]]) -> str:
+    """Fast path → cache Redis → LLM (model.build_search_key), kết quả LLM được cache lại"""
+    search_key = fast_search_key(question, history, customer_info, vocabulary)
+    if search_key is not None:
+        print("⚡ [SEARCH KEY] Câu hỏi tự đủ nghĩa, dùng nguyên văn")
+        return search_key
+
+    key = cache_key(question, history, customer_info)
+    cached = await async_cache_get(key)
+    if cached:
+        print("💾 [SEARCH KEY] Cache hit")
+        return cached
+
+    search_key = await model.build_search_key(chat_session_id, question, customer_info, history=history)
+    if search_key:
+        await async_cache_set(key, search_key, SEARCH_KEY_CACHE_TTL)
+    return search_key
@@ -0,0 +1,174 @@
+"""
+Tóm tắt hội thoại cuốn chiếu theo từng session
+
+- chat_sessions.summary             : bản tóm tắt các tin nhắn cũ (mục đích học, trình độ,
+                                      khóa học đã chọn, hình thức, cơ sở, thắc mắc còn mở...)
+- chat_sessions.summary_message_id  : watermark - id tin nhắn cuối cùng đã được gộp vào summary
+
+Prompt dùng "summary + các tin nhắn sau watermark" thay vì N tin nhắn nguyên văn.
+Sau mỗi lượt trả lời, schedule_update() chạy nền: khi số tin nhắn sau watermark vượt
+SUMMARY_KEEP_RECENT + SUMMARY_BATCH thì gộp phần cũ (giữ lại SUMMARY_KEEP_RECENT tin mới nhất)
+vào summary bằng 1 lần gọi LLM, ghi có điều kiện watermark chưa đổi (chống 2 worker ghi đè nhau).
+Mỗi lần gộp tối đa SUMMARY_MAX_FOLD tin nhắn cũ nhất / SUMMARY_MAX_FOLD_TOKENS token (session
+cũ tồn đọng hàng trăm tin không tạo ra 1 prompt khổng lồ); còn tồn đọng thì watermark tiến
+từng bước và tự lên lịch chạy tiếp.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from llm.conversation_window import get_recent_messages
+from llm.prompt_composer import count_tokens
+from models.chat import ChatSession, Message
+
+load_dotenv()
+
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+# Số tin nhắn mới nhất luôn giữ nguyên văn (không gộp vào summary)
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", 6))
+# Gộp khi có ít nhất chừng này tin nhắn cũ hơn phần giữ nguyên văn (tránh gọi LLM mỗi lượt)
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", 6))
+# Giới hạn phần gộp trong 1 lần gọi LLM
+SUMMARY_MAX_FOLD = int(os.getenv("SUMMARY_MAX_FOLD", 40))
+SUMMARY_MAX_FOLD_TOKENS = int(os.getenv("SUMMARY_MAX_FOLD_TOKENS", 4000))
+SUMMARY_MAX_WORDS = 200
+
+# Session đang được tóm tắt trong process này
+_running = set()
+_background_tasks = set()
+
+
+async def get_session_summary(db, chat_session_id: int) -> Tuple[Optional[str], Optional[int]]:
+    """(summary, watermark) của session, chưa có → (None, None)"""
+    result = await db.execute(
+        select(ChatSession.summary, ChatSession.summary_message_id).where(ChatSession.id == chat_session_id)
+    )
+    row = result.first()
+    return (row.summary, row.summary_message_id) if row else (None, None)
+
+
+def after_watermark(rows: List[Dict], watermark: Optional[int]) -> List[Dict]:
+    """Bỏ các tin nhắn đã nằm trong summary"""
+    if watermark is None:
+        return rows
+    return [row for row in rows if row["id"] is None or row["id"] > watermark]
+
+
+async def conversation_with_summary(db, chat_session_id: int, limit: int) -> str:
+    """Summary (nếu có) + tối đa `limit` tin nhắn sau watermark, dạng text cho prompt"""
+    from llm.pipeline import format_conversation
+
+    summary, watermark = await get_session_summary(db, chat_session_id)
+    rows = after_watermark(await get_recent_messages(db, chat_session_id, limit), watermark)
+    conversation = format_conversation(rows)
+    if summary:
+        return f"Tóm tắt các tin nhắn trước: {summary}\n{conversation}"
+    return conversation
+
+
+def build_summary_prompt(summary: Optional[str], conversation: str) -> str:
+    return f"""
+        Cập nhật bản tóm tắt cuộc tư vấn giữa khách hàng và chuyên viên trung tâm tiếng Trung.
+
+        Tóm tắt hiện tại:
+        {summary or "(chưa có)"}
+
+        Tin nhắn mới cần gộp vào:
+        {conversation}
+
+        YÊU CẦU:
+        - Giữ lại: mục đích học, trình độ hiện tại, khóa học đang quan tâm / đã chọn,
+          hình thức học (online/offline), thành phố / cơ sở, lịch mong muốn,
+          các câu hỏi khách đã hỏi và điều bot đã cam kết, thắc mắc còn chưa giải đáp
+        - KHÔNG chép lại lịch khai giảng, bảng giá hay nội dung dài bot đã gửi, chỉ ghi "đã gửi lịch HSK3 cơ sở X"
+        - Tối đa {SUMMARY_MAX_WORDS} từ, gạch đầu dòng ngắn gọn
+        - CHỈ TRẢ VỀ BẢN TÓM TẮT MỚI, KHÔNG GIẢI THÍCH
+        """
+
+
+def limit_fold(rows: List[Dict], max_tokens: int = SUMMARY_MAX_FOLD_TOKENS) -> List[Dict]:
+    """Các tin nhắn cũ nhất có tổng token <= max_tokens (luôn lấy ít nhất 1 tin)"""
+    total = 0
+    for i, row in enumerate(rows):
+        total += count_tokens(row["content"] or "")
+        if total > max_tokens and i > 0:
+            return rows[:i]
+    return rows
+
+
+async def update_summary(completion, chat_session_id: int) -> bool:
+    """
+    Gộp các tin nhắn cũ nhất sau watermark vào summary nếu đủ số lượng
+
+    Returns:
+        True nếu vẫn còn tin nhắn tồn đọng cần gộp tiếp
+    """
+    from llm.pipeline import format_conversation
+
+    async with AsyncSessionLocal() as db:
+        summary, watermark = await get_session_summary(db, chat_session_id)
+
+        # Chỉ đọc phần cũ nhất: tối đa SUMMARY_MAX_FOLD tin để gộp + SUMMARY_KEEP_RECENT tin giữ lại
+        fetch_limit = SUMMARY_MAX_FOLD + SUMMARY_KEEP_RECENT
+        query = select(Message.id, Message.sender_type, Message.content).where(
+            Message.chat_session_id == chat_session_id
+        )
+        if watermark is not None:
+            query = query.where(Message.id > watermark)
+        result = await db.execute(query.order_by(Message.id).limit(fetch_limit))
+        rows = [dict(row._mapping) for row in result.all()]
+
+        to_fold = rows[:max(len(rows) - SUMMARY_KEEP_RECENT, 0)]
+        if len(to_fold) < SUMMARY_BATCH:
+            return False
+        to_fold = limit_fold(to_fold)
+        # Đọc đủ fetch_limit tin hoặc phải cắt theo token → phía sau có thể còn tồn đọng
+        backlog = len(rows) == fetch_limit or len(to_fold) < len(rows) - SUMMARY_KEEP_RECENT
+
+        new_summary = (await completion.generate(
+            build_summary_prompt(summary, format_conversation(to_fold)), temperature=0
+        )).strip()
+        if not new_summary:
+            return False
+
+        new_watermark = to_fold[-1]["id"]
+        condition = (
+            ChatSession.summary_message_id.is_(None) if watermark is None
+            else ChatSession.summary_message_id == watermark
+        )
+        result = await db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == chat_session_id, condition)
+            .values(summary=new_summary, summary_message_id=new_watermark)
+        )
+        await db.commit()
+        if not result.rowcount:
+            # Worker khác vừa cập nhật watermark, để lần chạy sau xử lý tiếp
+            return False
+        print(f"📝 [SUMMARY] Session {chat_session_id}: gộp {len(to_fold)} tin nhắn (watermark {new_watermark})")
+        return backlog
+
+
+async def _run_update(completion, chat_session_id: int):
+    backlog = False
+    try:
+        backlog = await update_summary(completion, chat_session_id)
+    except Exception as e:
+        print(f"⚠️ [SUMMARY] Lỗi tóm tắt session {chat_session_id}: {e}")
+    finally:
+        _running.discard(chat_session_id)
+    if backlog:
+        print(f"📝 [SUMMARY] Session {chat_session_id}: còn tin nhắn tồn đọng, gộp tiếp")
+        schedule_update(completion, chat_session_id)
+
+
+def schedule_update(completion, chat_session_id: int):
+    """Chạy update_summary ở background, mỗi session tối đa 1 lần chạy cùng lúc"""
+    if not SUMMARY_ENABLED or completion is None or chat_session_id in _running:
+        return
+    _running.add(chat_session_id)
+    task = asyncio.create_task(_run_update(completion, chat_session_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
@@ -0,0 +1,202 @@
+"""
+Index vector trong process (NumPy) cho knowledge base nhỏ
+
+- Giữ toàn bộ vector của phiên bản chunk đang active trong 1 ma trận liên tục
+  float32 (mặc định, nhanh nhất) hoặc float16 (VECTOR_INDEX_DTYPE, RAM giảm 1/2
+  nhưng search chậm hơn vì phải đổi sang float32 theo block trước khi nhân)
+- Search = 1 phép nhân ma trận + argpartition, không round-trip Postgres
+- Kiểm tra phiên bản active tối đa mỗi VECTOR_INDEX_CHECK_INTERVAL giây;
+  khi đổi phiên bản chỉ tải vector của chunk có content_hash mới, chunk cũ dùng lại vector
+- Kèm index từ khóa (token đã bỏ dấu → chunk) để retrieval hybrid không cần Postgres
+"""
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, text
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from helper.chunk_metadata import METADATA_FIELDS, TEXT_FIELDS
+from helper.vietnamese import tokenize_vietnamese
+from models.knowledge_base import DocumentChunk
+
+load_dotenv()
+
+VECTOR_INDEX_DTYPE = np.float16 if os.getenv("VECTOR_INDEX_DTYPE", "float32") == "float16" else np.float32
+VECTOR_INDEX_CHECK_INTERVAL = float(os.getenv("VECTOR_INDEX_CHECK_INTERVAL", 5))
+# Số row mỗi lần nhân ma trận khi lưu float16 (đổi sang float32 theo block để dùng BLAS)
+FLOAT16_BLOCK_SIZE = 4096
+
+
+class InMemoryVectorIndex:
+    def __init__(self, dtype=VECTOR_INDEX_DTYPE):
+        self.dtype = dtype
+        self.version: Optional[int] = None
+        self.texts: List[str] = []
+        self.hashes: List[str] = []
+        self.matrix = np.zeros((0, 0), dtype=dtype)
+        self.sq_norms = np.zeros(0, dtype=np.float32)
+        self.postings: Dict[str, List[int]] = {}
+        # field metadata → mảng giá trị theo vị trí chunk (dtype object, None = không có)
+        self.metadata: Dict[str, np.ndarray] = {}
+        self.vocabulary: Dict[str, set] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _active_version(self, session) -> int:
+        result = await session.execute(text(
+            "SELECT COALESCE((SELECT active_version FROM knowledge_index_state WHERE id = 1), 0)"
+        ))
+        return result.scalar_one()
+
+    async def refresh(self, force: bool = False):
+        """Tải lại index nếu phiên bản active đã đổi (kiểm tra theo chu kỳ)"""
+        if not force and time.monotonic() - self._checked_at < VECTOR_INDEX_CHECK_INTERVAL:
+            return
+
+        async with self._lock:
+            if not force and time.monotonic() - self._checked_at < VECTOR_INDEX_CHECK_INTERVAL:
+                return
+
+            async with AsyncSessionLocal() as session:
+                version = await self._active_version(session)
+                if version != self.version:
+                    await self._load(session, version)
+            self._checked_at = time.monotonic()
+
+    async def _load(self, session, version: int):
+        start = time.perf_counter()
+        result = await session.execute(
+            select(
+                DocumentChunk.id, DocumentChunk.content_hash, DocumentChunk.chunk_text,
+                *(getattr(DocumentChunk, field) for field in METADATA_FIELDS)
+            )
+            .where(DocumentChunk.kb_version == version)
+            .where(DocumentChunk.search_vector.is_not(None))
+            .order_by(DocumentChunk.id)
+        )
+        rows = result.all()
+
+        # Chunk không đổi (cùng content_hash) → dùng lại vector đang giữ
+        known = {h: i for i, h in enumerate(self.hashes) if h}
+        missing_ids = [row.id for row in rows if row.content_hash not in known]
+
+        fetched: Dict[int, np.ndarray] = {}
+        for offset in range(0, len(missing_ids), 500):
+            batch = missing_ids[offset:offset + 500]
+            result = await session.execute(
+                select(DocumentChunk.id, DocumentChunk.search_vector).where(DocumentChunk.id.in_(batch))
+            )
+            for row in result.all():
+                fetched[row.id] = np.asarray(row.search_vector, dtype=np.float32)
+
+        vectors = []
+        for row in rows:
+            if row.content_hash in known:
+                vectors.append(self.matrix[known[row.content_hash]])
+            else:
+                vectors.append(fetched[row.id])
+
+        matrix = np.ascontiguousarray(np.vstack(vectors), dtype=self.dtype) if vectors else np.zeros((0, 0), dtype=self.dtype)
+
+        postings = defaultdict(list)
+        for i, row in enumerate(rows):
+            for token in tokenize_vietnamese(row.chunk_text, drop_stopwords=False):
+                postings[token].append(i)
+
+        metadata = {
+            field: np.array([getattr(row, field) for row in rows], dtype=object)
+            for field in METADATA_FIELDS
+        }
+        vocabulary = {
+            field: {value for value in metadata[field] if value is not None}
+            for field in TEXT_FIELDS
+        }
+
+        # Gán cùng lúc → search đang chạy không thấy index nửa cũ nửa mới
+        (self.matrix, self.sq_norms, self.texts, self.hashes, self.postings,
+         self.metadata, self.vocabulary, self.version) = (
+            matrix,
+            np.einsum("ij,ij->i", matrix, matrix, dtype=np.float32),
+            [row.chunk_text for row in rows],
+            [row.content_hash for row in rows],
+            dict(postings),
+            metadata,
+            vocabulary,
+            version,
+        )
+        print(
+            f"🧠 [VECTOR INDEX] version {version}: {len(rows)} chunk "
+            f"(tải mới {len(missing_ids)}, dùng lại {len(rows) - len(missing_ids)}) "
+            f"| {matrix.nbytes / 1024 / 1024:.1f}MB {np.dtype(self.dtype).name} "
+            f"| {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+
+    def _dot(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        return np.concatenate([
+            matrix[i:i + FLOAT16_BLOCK_SIZE].astype(np.float32) @ query
+            for i in range(0, len(matrix), FLOAT16_BLOCK_SIZE)
+        ])
+
+    def filter_mask(self, filters: Dict) -> Optional[np.ndarray]:
+        """Mask chunk khớp bộ lọc metadata (giống build_filter_sql: chunk thiếu metadata vẫn khớp)"""
+        if not filters:
+            return None
+        mask = np.ones(len(self.texts), dtype=bool)
+        for field, value in filters.items():
+            if field == "start_month":
+                column = self.metadata["start_date"]
+                mask &= np.array([d is None or d.month == value for d in column], dtype=bool)
+            else:
+                column = self.metadata[field]
+                mask &= (column == None) | (column == value)  # noqa: E711 (so sánh từng phần tử)
+        return mask
+
+    def search_ids(self, query_embedding, top_k: int, allowed: np.ndarray = None) -> List[Tuple[int, float]]:
+        """Top-k (vị trí chunk, khoảng cách L2) - giống toán tử <-> của pgvector"""
+        matrix, sq_norms = self.matrix, self.sq_norms
+        if len(sq_norms) == 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        # ||q - v||² = ||q||² + ||v||² - 2 q·v
+        distances = np.float32(query @ query) + sq_norms - 2 * self._dot(matrix, query)
+        if allowed is not None:
+            distances = np.where(allowed, distances, np.inf)
+
+        k = min(top_k, len(sq_norms) if allowed is None else int(allowed.sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(i), float(np.sqrt(max(distances[i], 0.0)))) for i in top]
+
+    def lexical_ids(self, tokens: List[str], top_k: int, allowed: np.ndarray = None) -> List[int]:
+        """Top-k vị trí chunk chứa nhiều token của câu hỏi nhất (token hiếm được tính điểm cao hơn)"""
+        postings, total = self.postings, len(self.texts)
+        scores: Dict[int, float] = defaultdict(float)
+        for token in tokens:
+            docs = postings.get(token)
+            if not docs:
+                continue
+            idf = math.log(1 + total / len(docs))
+            for i in docs:
+                if allowed is None or allowed[i]:
+                    scores[i] += idf
+        return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+    def search(self, query_embedding, top_k: int) -> List[Dict]:
+        """Top-k theo khoảng cách L2"""
+        texts = self.texts
+        return [
+            {"content": texts[i], "similarity_score": distance}
+            for i, distance in self.search_ids(query_embedding, top_k)
+        ]
+
+
+vector_index = InMemoryVectorIndex()
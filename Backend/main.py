@@ -1,5 +1,8 @@
 from fastapi import FastAPI, Request
 from config.database import create_tables
+from config.sheet import backfill_ann_vectors
+from config.local_cache import start_invalidation_listener
+from config.redis_cache import get_cache_stats
 from datetime import datetime
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -30,10 +33,20 @@ load_dotenv()
 
 app = FastAPI()
 
+# Giữ tham chiếu tới task nền lúc khởi động (event loop chỉ giữ weak reference)
+_startup_tasks = set()
+
 # Startup event để tạo tables async
 @app.on_event("startup")
 async def startup_event():
     await create_tables()
+    # Tính vector rút gọn cho chunk cũ (index ANN), chạy nền để không chặn khởi động
+    # (advisory lock Postgres: chỉ 1 worker uvicorn chạy, các worker khác bỏ qua)
+    task = asyncio.create_task(backfill_ann_vectors())
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
+    # Nhận tin invalidate cache cấu hình (L1) từ các worker khác
+    start_invalidation_listener()
 
 app.include_router(user_router.router)
 app.include_router(company_router.router)
@@ -75,4 +88,9 @@ app.mount("/upload", StaticFiles(directory=UPLOAD_DIR), name="upload")
 
 @app.get("/")
 def read_root():
-    return {"message": "Hello FastAPI"}
\ No newline at end of file
+    return {"message": "Hello FastAPI"}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit / miss của các hàm dùng cache_result (worker đang xử lý request)"""
+    return get_cache_stats()
\ No newline at end of file
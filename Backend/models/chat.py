@@ -46,6 +46,9 @@ class ChatSession(Base):
     name = Column(String)
     current_receiver = Column(String, default="Bot")
     previous_receiver = Column(String)
+    # Tóm tắt cuốn chiếu các tin nhắn cũ (llm/summary.py), summary_message_id = id tin nhắn cuối đã tóm tắt
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
     chat_session_tags = relationship("ChatSessionTag", back_populates="chat_session", cascade="all, delete-orphan")
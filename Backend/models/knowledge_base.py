@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, Boolean, Date, DateTime, ForeignKey, func
 from datetime import datetime
 from config.database import Base
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
+from config.pgvector_codec import BinaryVector
+from config.get_embedding import ANN_DIMENSIONS
 
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_base"
@@ -22,7 +23,29 @@ class DocumentChunk(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     chunk_text = Column(Text, nullable=False)
-    search_vector = Column(Vector(3072))
+    # chunk_text đã bỏ dấu / chữ thường (helper/vietnamese.py), có index full-text
+    search_text = Column(Text)
+    search_vector = Column(BinaryVector(3072))
+    # Vector rút gọn (ANN_DIMENSIONS chiều, đã chuẩn hóa) có index HNSW, dùng lấy ứng viên trước khi re-rank
+    search_vector_ann = Column(BinaryVector(ANN_DIMENSIONS))
+    # sha256 của chunk_text → re-sync chỉ embed chunk mới / thay đổi
+    content_hash = Column(String(64), index=True)
+    # Phiên bản bộ chunk, search chỉ đọc phiên bản đang active (xem KnowledgeIndexState)
+    kb_version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    # Metadata lấy từ cột của sheet (helper/chunk_metadata.py), dùng lọc trước khi search
+    course = Column(String(255), index=True)
+    city = Column(String(255), index=True)
+    campus = Column(String(255), index=True)
+    study_mode = Column(String(20), index=True)
+    start_date = Column(Date, index=True)
     
     knowledge_base_id = Column(Integer, ForeignKey("knowledge_base.id"))
-    
+
+
+class KnowledgeIndexState(Base):
+    """Con trỏ tới phiên bản document_chunks đang active (1 row duy nhất, id = 1)"""
+    __tablename__ = "knowledge_index_state"
+
+    id = Column(Integer, primary_key=True)
+    active_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -68,6 +68,7 @@ async def update_alert_status(session_id: int, alert_data: dict, db: AsyncSessio
     try:
         from models.chat import ChatSession
         from sqlalchemy import select
+        from services.chat_service import invalidate_admin_history_cache
         
         result = await db.execute(select(ChatSession).filter(ChatSession.id == session_id))
         chat_session = result.scalar_one_or_none()
@@ -76,6 +77,7 @@ async def update_alert_status(session_id: int, alert_data: dict, db: AsyncSessio
         
         chat_session.alert = alert_data.get("alert", "false")
         await db.commit()
+        await invalidate_admin_history_cache()
         
         return {"success": True, "message": "Alert status updated successfully"}
     except Exception as e:
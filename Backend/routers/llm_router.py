@@ -6,7 +6,8 @@ from controllers.llm_controller import (
     update_llm_controller,
     delete_llm_controller,
     get_llm_by_id_controller,
-    get_all_llms_controller
+    get_all_llms_controller,
+    get_answer_cache_stats_controller
 )
 
 router = APIRouter(prefix="/llms", tags=["LLMs"])
@@ -25,6 +26,10 @@ async def update_llm(llm_id: int, request: Request, db: AsyncSession = Depends(g
 async def delete_llm(llm_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_llm_controller(llm_id, db)
 
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats():
+    return await get_answer_cache_stats_controller()
+
 @router.get("/{llm_id}")
 async def get_llm_by_id(llm_id: int, db: AsyncSession = Depends(get_db)):
     return await get_llm_by_id_controller(llm_id, db)
@@ -8,7 +8,7 @@ from models.chat import ChatSession, Message, CustomerInfo
 from models.facebook_page import FacebookPage
 from models.telegram_page import TelegramBot
 from models.zalo import ZaloBot 
-from config.database import SessionLocal
+from config.database import AsyncSessionLocal, SessionLocal
 from sqlalchemy import text, select
 from models.llm import LLM  # Import LLM model để check name
 from datetime import datetime, timedelta
@@ -17,44 +17,31 @@ import random
 import json
 import requests
 import traceback
+import uuid
 from config.save_base64_image import save_base64_image
-from config.redis_cache import cache_get, cache_set, cache_delete
-from helper.task import save_message_to_db_async, update_session_admin_async, save_message_to_db_background, update_session_admin_background
+from config.redis_cache import async_cache_result
+from llm.intent_router import route_message
+from llm import conversation_window
+from llm.llm_config import get_llm_config, invalidate_llm_config, model_type_of
+from config.local_cache import bot_token_key, cached
+from helper.task import save_message_to_db_async, save_message_to_db_background
+from services.session_state import session_state, to_state
 import time
 
-# Cache để tránh query database liên tục
-_model_type_cache = None
-_cache_timestamp = None
-_cache_ttl = 300  # 5 phút
+# Cache các query thống kê / danh sách của trang admin (config/redis_cache.py::async_cache_result)
+DASHBOARD_CACHE_TTL = 300
+DASHBOARD_STALE_TTL = 3600
+ADMIN_HISTORY_CACHE_TTL = 5
+ADMIN_HISTORY_STALE_TTL = 25
+# Câu trả lời lưu / gửi khi stream lỗi giữa chừng (thay cho phần câu trả lời dở dang)
+STREAM_FALLBACK_REPLY = "Dạ hệ thống đang bận, anh/chị vui lòng gửi lại câu hỏi sau ít phút giúp em nhé ạ."
 
 async def get_model_type(db_session):
     """
-    Lấy loại model từ database với cache
+    Lấy loại model từ cấu hình LLM (cache 2 tầng, các worker được báo xóa khi cấu hình đổi)
     """
-    global _model_type_cache, _cache_timestamp
-    
-    current_time = time.time()
-    
-    # Kiểm tra cache
-    if (_model_type_cache is not None and 
-        _cache_timestamp is not None and 
-        current_time - _cache_timestamp < _cache_ttl):
-        return _model_type_cache
-    
     try:
-        # Lấy từ database
-        result = await db_session.execute(select(LLM).filter(LLM.id == 1))
-        llm_config = result.scalar_one_or_none()
-        
-        if not llm_config or not llm_config.name:
-            _model_type_cache = "gemini"
-        else:
-            llm_name = llm_config.name.lower()
-            _model_type_cache = "gpt" if ("gpt" in llm_name or "openai" in llm_name) else "gemini"
-        
-        _cache_timestamp = current_time
-        return _model_type_cache
-        
+        return model_type_of(await get_llm_config(db_session))
     except Exception as e:
         print(f"Error getting model type: {e}")
         return "gemini"  # Default fallback
@@ -81,12 +68,24 @@ async def create_rag_model(db_session):
         from llm.llm import RAGModel
         return RAGModel(db_session=db_session)
 
-def clear_model_type_cache():
-    """Clear cache loại model khi có thay đổi cấu hình LLM"""
-    global _model_type_cache, _cache_timestamp
-    _model_type_cache = None
-    _cache_timestamp = None
+async def clear_model_type_cache():
+    """Clear cache loại model khi có thay đổi cấu hình LLM (mọi worker)"""
+    await invalidate_llm_config()
     print("Model type cache cleared")
+
+async def generate_bot_reply(db, content: str, chat_session_id: int) -> str:
+    """
+    Câu trả lời của bot: chào / cảm ơn / tin nhắn không phải text... trả lời ngay bằng
+    template (llm/intent_router.py), còn lại mới tạo RAG model và gọi LLM
+    """
+    reply = await route_message(db, content, chat_session_id)
+    if reply is not None:
+        return reply
+
+    rag = await create_rag_model(db)
+    await rag.initialize()
+    return await rag.generate_response(content, chat_session_id)
+
 async def create_session_service(url_channel: str, db):
     session = ChatSession(
         name=f"W-{random.randint(10**7, 10**8 - 1)}",
@@ -110,9 +109,6 @@ async def update_tag_chat_session(id: int, data: dict, db):
     await db.commit()
     await db.refresh(chatSession)
     
-    # Clear cache sau khi update
-    clear_session_cache(id)
-    
     return chatSession
         
 async def check_session_service(sessionId, url_channel, db):
@@ -157,47 +153,16 @@ async def send_message_service(data: dict, user, db):
     db.add(message)
     await db.commit()
     await db.refresh(message)
+    await conversation_window.append_message(
+        message.chat_session_id, message.sender_type, message.content, message_id=message.id
+    )
     
     print("ngon")
     
     response_messages = []  
     
-    # Cache session với Redis
     chat_session_id = data.get("chat_session_id")
-    session_cache_key = f"session:{chat_session_id}"
-    
-    # Kiểm tra cache trước
-    cached_session = cache_get(session_cache_key)
-    if cached_session:
-        # Tạo session object từ cache
-        session = ChatSession(
-            id=cached_session['id'],
-            name=cached_session['name'],
-            status=cached_session['status'],
-            channel=cached_session['channel'],
-            page_id=cached_session.get('page_id'),
-            current_receiver=cached_session.get('current_receiver'),
-            previous_receiver=cached_session.get('previous_receiver'),
-            time=datetime.fromisoformat(cached_session['time']) if cached_session.get('time') else None
-        )
-    else:
-        # Lấy từ database và cache lại
-        result = await db.execute(select(ChatSession).filter(ChatSession.id == chat_session_id))
-        session = result.scalar_one_or_none()
-        if session:
-            session_data = {
-                'id': session.id,
-                'name': session.name,
-                'status': session.status,
-                'channel': session.channel,
-                'page_id': session.page_id,
-                'current_receiver': session.current_receiver,
-                'previous_receiver': session.previous_receiver,
-                'time': session.time.isoformat() if session.time else None
-            }
-            cache_set(session_cache_key, session_data, ttl=300)  # Cache 5 phút
-    
-    
+    session = await session_state.get(chat_session_id, db)
     
     response_messages.append({
         "id": message.id,
@@ -206,60 +171,38 @@ async def send_message_service(data: dict, user, db):
         "sender_name": message.sender_name,
         "content": message.content,
         "image": json.loads(message.image) if message.image else [],
-        "session_name": session.name,
-        "session_status" : session.status
+        "session_name": session["name"],
+        "session_status" : session["status"]
     })
     
     
     if data.get("sender_type") == "admin":
-        result = await db.execute(select(ChatSession).filter(ChatSession.id == chat_session_id))
-        db_session = result.scalar_one_or_none()
-        db_session.status = "false" 
-        db_session.time = datetime.now() + timedelta(hours=1)
-        db_session.previous_receiver = db_session.current_receiver 
-        db_session.current_receiver = sender_name
-        
-        await db.commit()
-        
-        # Cập nhật cache
-        session_data = {
-            'id': db_session.id,
-            'name': db_session.name,
-            'status': db_session.status,
-            'channel': db_session.channel,
-            'page_id': db_session.page_id,
-            'current_receiver': db_session.current_receiver,
-            'previous_receiver': db_session.previous_receiver,
-            'time': db_session.time.isoformat() if db_session.time else None
-        }
-        cache_set(session_cache_key, session_data, ttl=300)
-        
-        # Cập nhật session object cho response
-        session = db_session
+        # Admin tiếp nhận → chặn bot 1 giờ (Redis + DB)
+        session = await session_state.admin_takeover(chat_session_id, sender_name, db)
         
         response_messages[0] = {
             "id": message.id,
-            "chat_session_id": session.id,
+            "chat_session_id": session["id"],
             "sender_type": message.sender_type,
             "sender_name": message.sender_name,
             "content": message.content,
             "image": json.loads(message.image) if message.image else [],
-            "session_name": session.name,
-            "session_status": session.status,
-            "current_receiver": session.current_receiver,
-            "previous_receiver": session.previous_receiver,
-            "time" : session.time.isoformat()
+            "session_name": session["name"],
+            "session_status": session["status"],
+            "current_receiver": session["current_receiver"],
+            "previous_receiver": session["previous_receiver"],
+            "time" : session["time"]
         }
 
         
-        name_to_send = session.name[2:]
+        name_to_send = session["name"][2:]
         
         # ✅ Gọi async functions trực tiếp
-        if session.channel == "facebook":
-            await send_fb(session.page_id, name_to_send, message, image_url, db)
-        elif session.channel == "telegram":
+        if session["channel"] == "facebook":
+            await send_fb(session["page_id"], name_to_send, message, image_url, db)
+        elif session["channel"] == "telegram":
             await send_telegram(name_to_send, message, db)
-        elif session.channel == "zalo":
+        elif session["channel"] == "zalo":
             await send_zalo(name_to_send, message, None, db)
         
         
@@ -268,12 +211,10 @@ async def send_message_service(data: dict, user, db):
     
     
     
-    elif await check_repply_cached(chat_session_id, db) :
+    elif await session_state.can_reply(chat_session_id, db, session) :
         
         print("ok")
-        rag = await create_rag_model(db)
-        await rag.initialize()
-        mes = await rag.generate_response(message.content, session.id)
+        mes = await generate_bot_reply(db, message.content, session["id"])
         
         
         
@@ -285,6 +226,9 @@ async def send_message_service(data: dict, user, db):
         db.add(message_bot)
         await db.commit()
         await db.refresh(message_bot)
+        await conversation_window.append_message(
+            message_bot.chat_session_id, "bot", message_bot.content, message_id=message_bot.id
+        )
 
         print(message_bot)
         
@@ -294,10 +238,10 @@ async def send_message_service(data: dict, user, db):
             "sender_type": message_bot.sender_type,
             "sender_name": message_bot.sender_name,
             "content": message_bot.content,
-            "session_name": session.name,
-            "session_status" : session.status,
-            "current_receiver": session.current_receiver,
-            "previous_receiver": session.previous_receiver
+            "session_name": session["name"],
+            "session_status" : session["status"],
+            "current_receiver": session["current_receiver"],
+            "previous_receiver": session["previous_receiver"]
         })
     
     
@@ -320,38 +264,11 @@ async def send_message_fast_service(data: dict, user, db):
             print("❌ Error saving images:", e) 
             traceback.print_exc()
     
-    session_data = None
     response_messages = []
-    # Lấy session từ cache hoặc database  
-    session_cache_key = f"session:{chat_session_id}"
-    cached_session = cache_get(session_cache_key)
-    
-    if not cached_session :
-        
-        result = await db.execute(select(ChatSession).filter(ChatSession.id == chat_session_id))
-        session = result.scalar_one_or_none()
-        
-        if not session:
-            return []
-        
-        session_data = {
-            'id': session.id,
-            'name': session.name,
-            'status': session.status,
-            'channel': session.channel,
-            'page_id': session.page_id,
-            'current_receiver': session.current_receiver,
-            'previous_receiver': session.previous_receiver,
-            'time': session.time.isoformat() if session.time else None
-        }
-        
-        cache_set(session_cache_key, session_data, ttl=300)
-        
-
-            
-    
-    else:
-        session_data  = cached_session
+    # Lấy session từ Redis hash (1 HGETALL), miss thì database
+    session_data = await session_state.get(chat_session_id, db)
+    if not session_data:
+        return []
         
     user_message = {
         "id": None,
@@ -366,33 +283,17 @@ async def send_message_fast_service(data: dict, user, db):
     
     response_messages.append(user_message)
     
-    # 🚀 Lưu tin nhắn vào database (background task với DB session riêng)
-    asyncio.create_task(save_message_to_db_background(data, sender_name, image_url))
+    # 🚀 Ghi vào cửa sổ hội thoại ngay, lưu database ở background (DB session riêng)
+    window_uid = await conversation_window.append_message(chat_session_id, data.get("sender_type"), data.get("content"))
+    asyncio.create_task(save_message_to_db_background(data, sender_name, image_url, window_uid))
     
     # Xử lý admin message
     if data.get("sender_type") == "admin":
-        # ✅ CẬP NHẬT CACHE NGAY LẬP TỨC để chặn bot reply
-        new_time = datetime.now() + timedelta(hours=1)
-        
-        # Cập nhật session_data trong cache
-        session_data["status"] = "false"
-        session_data["current_receiver"] = sender_name
-        session_data["previous_receiver"] = session_data.get("current_receiver")
-        session_data["time"] = new_time.isoformat()
-        
-        # Lưu lại cache với status mới
-        session_cache_key = f"session:{chat_session_id}"
-        cache_set(session_cache_key, session_data, ttl=300)
-        
-        # ✅ XÓA cache check_repply để force check lại
-        repply_cache_key = f"check_repply:{chat_session_id}"
-        cache_delete(repply_cache_key)
+        # ✅ Chặn bot reply: Lua trên Redis hash (nguyên tử) rồi UPDATE DB
+        session_data = await session_state.admin_takeover(chat_session_id, sender_name, db) or session_data
         
         print(f"✅ Admin nhắn → Chặn bot 1 giờ cho session {chat_session_id}")
         
-        # 🚀 Cập nhật database trong background (không block)
-        asyncio.create_task(update_session_admin_background(chat_session_id, sender_name))
-        
         response_messages[0] = {
             "id": None,
             "chat_session_id": chat_session_id,
@@ -404,7 +305,7 @@ async def send_message_fast_service(data: dict, user, db):
             "session_status": "false",
             "current_receiver": sender_name,
             "previous_receiver": session_data.get("previous_receiver"),
-            "time": new_time.isoformat()
+            "time": session_data.get("time")
         }
 
         
@@ -420,10 +321,8 @@ async def send_message_fast_service(data: dict, user, db):
         return response_messages
     
     # Xử lý bot reply
-    elif await check_repply_cached(chat_session_id, db):
-        rag = await create_rag_model(db)
-        await rag.initialize()
-        mes = await rag.generate_response(data.get("content"), session_data["id"])
+    elif await session_state.can_reply(chat_session_id, db, session_data):
+        mes = await generate_bot_reply(db, data.get("content"), session_data["id"])
         
         response_messages.append({
             "id": None,
@@ -443,11 +342,106 @@ async def send_message_fast_service(data: dict, user, db):
             "sender_type": "bot",
             "content": mes
         }
-        asyncio.create_task(save_message_to_db_background(bot_data, None, []))
+        window_uid = await conversation_window.append_message(chat_session_id, "bot", mes)
+        asyncio.create_task(save_message_to_db_background(bot_data, None, [], window_uid))
         
     
     return response_messages
 
+async def _single_delta(text: str):
+    yield text
+
+async def send_message_stream_service(data: dict, db):
+    """
+    🚀 Phiên bản stream của send_message_fast_service cho tin nhắn customer (web)
+    - Async generator, yield từng frame theo thứ tự để controller đẩy qua WebSocket:
+      1. Tin nhắn customer (echo)
+      2. Nhiều frame {"type": "bot_delta"} khi model đang sinh câu trả lời
+      3. Frame cuối {"type": "bot_done"} chứa toàn bộ nội dung + ID tin nhắn đã lưu
+         (model lỗi giữa chừng → nội dung là STREAM_FALLBACK_REPLY, client thay phần đã stream)
+    """
+    chat_session_id = data.get("chat_session_id")
+    
+    # Xử lý ảnh nếu có
+    image_url = []
+    if data.get("image"):
+        try:
+            image_url = save_base64_image(data.get("image"))
+        except Exception as e:
+            print("❌ Error saving images:", e) 
+            traceback.print_exc()
+    
+    session_data = await session_state.get(chat_session_id, db)
+    if not session_data:
+        return
+    
+    yield {
+        "id": None,
+        "chat_session_id": chat_session_id,
+        "sender_type": data.get("sender_type"),
+        "sender_name": None,
+        "content": data.get("content"),
+        "image": image_url,
+        "session_name": session_data["name"],
+        "session_status": session_data["status"]
+    }
+    
+    # 🚀 Ghi vào cửa sổ hội thoại ngay, lưu database ở background (DB session riêng)
+    window_uid = await conversation_window.append_message(chat_session_id, data.get("sender_type"), data.get("content"))
+    asyncio.create_task(save_message_to_db_background(data, None, image_url, window_uid))
+    
+    if not await session_state.can_reply(chat_session_id, db, session_data):
+        return
+    
+    stream_id = uuid.uuid4().hex
+    parts = []
+    try:
+        reply = await route_message(db, data.get("content"), session_data["id"])
+        if reply is not None:
+            # Ý định đơn giản: 1 delta duy nhất là câu trả lời template
+            deltas = _single_delta(reply)
+        else:
+            rag = await create_rag_model(db)
+            await rag.initialize()
+            deltas = rag.generate_response_stream(data.get("content"), session_data["id"])
+        
+        async for delta in deltas:
+            parts.append(delta)
+            yield {
+                "type": "bot_delta",
+                "stream_id": stream_id,
+                "chat_session_id": chat_session_id,
+                "sender_type": "bot",
+                "delta": delta
+            }
+        mes = "".join(parts).strip()
+    except Exception as e:
+        # Không lưu câu trả lời dở dang / text lỗi
+        print(f"❌ [STREAM] Lỗi sinh câu trả lời session {chat_session_id}: {e}")
+        mes = STREAM_FALLBACK_REPLY
+    
+    # Lưu bot message NGAY (không background) để frame cuối có ID thật
+    bot_data = {
+        "chat_session_id": chat_session_id,
+        "sender_type": "bot",
+        "content": mes
+    }
+    message_id = await save_message_to_db_async(bot_data, None, [], db)
+    
+    yield {
+        "type": "bot_done",
+        "stream_id": stream_id,
+        "id": message_id,
+        "chat_session_id": chat_session_id,
+        "sender_type": "bot",
+        "sender_name": None,
+        "content": mes,
+        "session_name": session_data["name"],
+        "session_status": session_data["status"],
+        "current_receiver": session_data["current_receiver"],
+        "previous_receiver": session_data["previous_receiver"]
+    }
+
 async def send_to_platform_async(session, data, sender_name, db: Session):
     """Gửi tin nhắn đến platform bất đồng bộ"""
     try:
@@ -468,9 +462,7 @@ async def send_to_platform_async(session, data, sender_name, db: Session):
 
 async def generate_and_send_bot_response_async(data: dict, chat_session_id: int, session, db: Session):
     try:
-        rag = await create_rag_model(db)
-        await rag.initialize()
-        mes = await rag.generate_response(data.get("content"), session.id)
+        mes = await generate_bot_reply(db, data.get("content"), session.id)
         
         message_bot = Message(
             chat_session_id=chat_session_id,
@@ -557,59 +549,72 @@ async def get_history_chat_service(chat_session_id: int, page: int = 1, limit: i
     
 async def get_all_history_chat_service(db):
     try:
-        query = text("""
-                SELECT 
-                    cs.id AS session_id,
-                    cs.status,
-                    cs.channel,
-                    cs.url_channel,
-                    cs.alert,
-                    ci.customer_data::text AS customer_data, 
-                    cs.name,
-                    cs.time,
-                    cs.current_receiver,
-                    cs.previous_receiver,
-                    m.sender_type,
-                    m.content,
-                    m.sender_name, 
-                    m.created_at AS created_at,
-                    COALESCE(JSON_AGG(t.name) FILTER (WHERE t.name IS NOT NULL), '[]') AS tag_names,
-                    COALESCE(JSON_AGG(t.id) FILTER (WHERE t.id IS NOT NULL), '[]') AS tag_ids
-                FROM chat_sessions cs
-                LEFT JOIN customer_info ci ON cs.id = ci.chat_session_id
-                JOIN messages m ON cs.id = m.chat_session_id
-                JOIN (
-                    SELECT
-                        chat_session_id,
-                        MAX(created_at) AS latest_time
-                    FROM messages
-                    GROUP BY chat_session_id
-                ) AS latest ON cs.id = latest.chat_session_id AND m.created_at = latest.latest_time
-                LEFT JOIN chat_session_tag cst ON cs.id = cst.chat_session_id
-                LEFT JOIN tag t ON t.id = cst.tag_id
-                GROUP BY 
-                    cs.id, cs.status, cs.channel, ci.customer_data::text,
-                    cs.name, cs.time, cs.alert, cs.current_receiver, cs.previous_receiver,
-                    m.sender_type, m.content, m.sender_name, m.created_at
-                ORDER BY m.created_at DESC;
-        """)
-        
-        result = await db.execute(query)
-        rows = result.fetchall()
-        conversations = []
-        for row in rows:
-            row_dict = dict(row._mapping)
-            try:
-                row_dict["image"] = json.loads(row_dict["image"]) if row_dict.get("image") else []
-            except Exception:
-                row_dict["image"] = []  
-            conversations.append(row_dict)
-            
-        return conversations
+        return await _load_all_history_chat()
     except Exception as e:
         print(e)
         traceback.print_exc()
 
+@async_cache_result("admin_history", ttl=ADMIN_HISTORY_CACHE_TTL, stale_ttl=ADMIN_HISTORY_STALE_TTL)
+async def _load_all_history_chat():
+    """Danh sách hội thoại + tin nhắn cuối (query nặng nhất của trang admin), cache ngắn"""
+    query = text("""
+            SELECT 
+                cs.id AS session_id,
+                cs.status,
+                cs.channel,
+                cs.url_channel,
+                cs.alert,
+                ci.customer_data::text AS customer_data, 
+                cs.name,
+                cs.time,
+                cs.current_receiver,
+                cs.previous_receiver,
+                m.sender_type,
+                m.content,
+                m.sender_name, 
+                m.created_at AS created_at,
+                COALESCE(JSON_AGG(t.name) FILTER (WHERE t.name IS NOT NULL), '[]') AS tag_names,
+                COALESCE(JSON_AGG(t.id) FILTER (WHERE t.id IS NOT NULL), '[]') AS tag_ids
+            FROM chat_sessions cs
+            LEFT JOIN customer_info ci ON cs.id = ci.chat_session_id
+            JOIN messages m ON cs.id = m.chat_session_id
+            JOIN (
+                SELECT
+                    chat_session_id,
+                    MAX(created_at) AS latest_time
+                FROM messages
+                GROUP BY chat_session_id
+            ) AS latest ON cs.id = latest.chat_session_id AND m.created_at = latest.latest_time
+            LEFT JOIN chat_session_tag cst ON cs.id = cst.chat_session_id
+            LEFT JOIN tag t ON t.id = cst.tag_id
+            GROUP BY 
+                cs.id, cs.status, cs.channel, ci.customer_data::text,
+                cs.name, cs.time, cs.alert, cs.current_receiver, cs.previous_receiver,
+                m.sender_type, m.content, m.sender_name, m.created_at
+            ORDER BY m.created_at DESC;
+    """)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        rows = result.fetchall()
+    conversations = []
+    for row in rows:
+        row_dict = dict(row._mapping)
+        try:
+            row_dict["image"] = json.loads(row_dict["image"]) if row_dict.get("image") else []
+        except Exception:
+            row_dict["image"] = []
+        # Cache lưu JSON → đổi datetime sang ISO giống FastAPI trả về
+        for field in ("time", "created_at"):
+            if row_dict.get(field) is not None:
+                row_dict[field] = row_dict[field].isoformat()
+        conversations.append(row_dict)
+
+    return conversations
+
+async def invalidate_admin_history_cache():
+    await _load_all_history_chat.invalidate()
+
 async def get_all_customer_service(data: dict, db):
     channel = data.get("channel")
     tag_id = data.get("tag_id")
@@ -647,99 +652,6 @@ async def get_all_customer_service(data: dict, db):
     # result lúc này là list[RowMapping] → có thể convert sang list[dict]
     return [dict(row) for row in rows]
 
-async def check_repply_cached(id: int, db):
-    """Check repply với Redis cache"""
-    try:
-        # Kiểm tra cache trước
-        repply_cache_key = f"check_repply:{id}"
-        cached_result = cache_get(repply_cache_key)
-        
-        if cached_result is not None:
-            return cached_result['can_reply']
-        
-        # Lấy session từ cache hoặc database
-        session_cache_key = f"session:{id}"
-        cached_session = cache_get(session_cache_key)
-        
-        if cached_session:
-            session_status = cached_session['status']
-            session_time = datetime.fromisoformat(cached_session['time']) if cached_session.get('time') else None
-        else:
-            result = await db.execute(select(ChatSession).filter(ChatSession.id == id))
-            session = result.scalar_one_or_none()
-            if not session:
-                return False
-            session_status = session.status
-            session_time = session.time
-        
-        can_reply = False
-        
-        # Logic check repply
-        if session_time and datetime.now() > session_time and session_status == "false":
-            # Cập nhật database
-            result = await db.execute(select(ChatSession).filter(ChatSession.id == id))
-            session = result.scalar_one_or_none()
-            if session:
-                session.status = "true"
-                session.time = None
-                await db.commit()
-                await db.refresh(session)
-                
-                # Cập nhật cache session
-                session_data = {
-                    'id': session.id,
-                    'name': session.name,
-                    'status': session.status,
-                    'channel': session.channel,
-                    'page_id': session.page_id,
-                    'current_receiver': session.current_receiver,
-                    'previous_receiver': session.previous_receiver,
-                    'time': session.time.isoformat() if session.time else None
-                }
-                cache_set(session_cache_key, session_data, ttl=300)
-                can_reply = True
-        elif session_status == "true":
-            can_reply = True
-        
-        # Cache kết quả check_repply trong 300 giây
-        cache_set(repply_cache_key, {'can_reply': can_reply}, ttl=300)
-        
-        return can_reply
-        
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
-        return False
-
-async def check_repply(id : int, db):
-    try:
-        result = await db.execute(select(ChatSession).filter(ChatSession.id == id))
-        session = result.scalar_one_or_none()
-        
-        if not session:
-            return False
-        
-        if session.time and datetime.now() > session.time and session.status == "false":
-            session.status = "true"
-            session.time = None
-            await db.commit()
-            await db.refresh(session)
-
-            return True
-
-        if session.status == "true":
-            return True
-        
-        print(type(session.status))
-        return False 
-    except Exception as e:
-        print(e)
-        traceback.print_exc()
-        return False
-
-
-
-
 async def sendMessage(data: dict, content: str, db):
     image_url = []
     if data.get("image"):  # Đổi từ "images" thành "image" để nhất quán với FE
@@ -769,6 +681,7 @@ async def sendMessage(data: dict, content: str, db):
         db.add(message)
         await db.commit()
         await db.refresh(message)
+        await conversation_window.append_message(session_id, "bot", content, message_id=message.id)
 
         # ✅ Gửi tin nhắn đến platform sau khi tạo message (async)
         name_to_send = session.name[2:]
@@ -928,13 +841,14 @@ async def send_fb(page_id : str, sender_id, data, images=None, db=None):
         should_close = False
     
     try:
-        # Async query
-        result = await db.execute(select(FacebookPage).filter(FacebookPage.page_id == page_id))
-        page = result.scalar_one_or_none()
-        if not page:
+        # Token của page (cache 2 tầng, chỉ query khi miss)
+        async def load_page_token():
+            result = await db.execute(select(FacebookPage.access_token).filter(FacebookPage.page_id == page_id))
+            return result.scalar_one_or_none()
+
+        PAGE_ACCESS_TOKEN = await cached(bot_token_key("facebook", page_id), load_page_token, shared=False)
+        if not PAGE_ACCESS_TOKEN:
             return
-           
-        PAGE_ACCESS_TOKEN = page.access_token
         url_text = f"https://graph.facebook.com/v23.0/{page_id}/messages?access_token={PAGE_ACCESS_TOKEN}"
         url_image = f"https://graph.facebook.com/v23.0/me/messages?access_token={PAGE_ACCESS_TOKEN}"
         
@@ -1072,10 +986,11 @@ async def send_telegram(chat_id, message, db=None):
     else:
         should_close = False
     try:
-        result = await db.execute(select(TelegramBot).filter(TelegramBot.id == 1))
-        token = result.scalar_one_or_none()
-        
-        TELEGRAM_TOKEN = token.bot_token
+        async def load_bot_token():
+            result = await db.execute(select(TelegramBot.bot_token).filter(TelegramBot.id == 1))
+            return result.scalar_one_or_none()
+
+        TELEGRAM_TOKEN = await cached(bot_token_key("telegram", 1), load_bot_token, shared=False)
         
         # Kiểm tra nếu có ảnh - hỗ trợ cả Message object và dictionary
         images_data = None
@@ -1206,14 +1121,15 @@ async def send_zalo(chat_id, message, images_base64, db=None):
         should_close = False
     
     try:
-        # Lấy thông tin Zalo bot - Async query
-        result = await db.execute(select(ZaloBot).filter(ZaloBot.id == 1))
-        zalo = result.scalar_one_or_none()
-        if not zalo:
+        # Lấy access token Zalo bot (cache 2 tầng, chỉ query khi miss)
+        async def load_access_token():
+            result = await db.execute(select(ZaloBot.access_token).filter(ZaloBot.id == 1))
+            return result.scalar_one_or_none()
+
+        ACCESS_TOKEN = await cached(bot_token_key("zalo", 1), load_access_token, shared=False)
+        if not ACCESS_TOKEN:
             print("❌ Không tìm thấy Zalo bot configuration")
             return
-            
-        ACCESS_TOKEN = zalo.access_token
         
         # Lấy nội dung tin nhắn (text luôn có)
         content_text = ""
@@ -1315,55 +1231,23 @@ async def send_message_page_service(data: dict, db):
     
     session_name = f"{prefix}-{data['sender_id']}"
     
-    # Tạo cache key cho session dựa trên name
-    session_name_cache_key = f"session_by_name:{session_name}"
+    # Session theo name: session_by_name → id → Redis hash, miss thì database
+    session_data = await session_state.get_by_name(session_name, db)
     
-    # Kiểm tra cache trước
-    cached_session_id = cache_get(session_name_cache_key)
-    
-    session_data = None
-    
-    if cached_session_id:
-        # Lấy session data từ cache theo ID
-        session_cache_key = f"session:{cached_session_id}"
-        session_data = cache_get(session_cache_key)
-    
-    # Nếu không có trong cache, query từ database
     if not session_data:
-        result = await db.execute(select(ChatSession).filter(ChatSession.name == session_name))
-        session = result.scalar_one_or_none()
-        
-        url_channel = None
-        
-        if not session:
-            # Tạo session mới
-            session = ChatSession(
-                name=session_name,
-                channel=data["platform"],
-                page_id = data.get("page_id", ""),
-                url_channel = url_channel
-            )
-            
-            db.add(session)
-            await db.commit()
-            await db.refresh(session)
-        
-        # Cache session data
-        session_data = {
-            'id': session.id,
-            'name': session.name,
-            'status': session.status,
-            'channel': session.channel,
-            'page_id': session.page_id,
-            'current_receiver': session.current_receiver,
-            'previous_receiver': session.previous_receiver,
-            'time': session.time.isoformat() if session.time else None
-        }
+        # Tạo session mới
+        session = ChatSession(
+            name=session_name,
+            channel=data["platform"],
+            page_id = data.get("page_id", ""),
+            url_channel = None
+        )
         
-        # Cache session theo ID và name
-        session_cache_key = f"session:{session.id}"
-        cache_set(session_cache_key, session_data, ttl=300)
-        cache_set(session_name_cache_key, session.id, ttl=300)
+        db.add(session)
+        await db.commit()
+        await db.refresh(session)
+        await session_state.put(session)
+        session_data = to_state(session)
     
     response_messages = []
     
@@ -1387,13 +1271,12 @@ async def send_message_page_service(data: dict, db):
         "sender_type": "customer",
         "content": data["message"]
     }
-    asyncio.create_task(save_message_to_db_background(message_data, None, []))
+    window_uid = await conversation_window.append_message(session_data['id'], "customer", data["message"])
+    asyncio.create_task(save_message_to_db_background(message_data, None, [], window_uid))
     
     # Xử lý bot reply
-    if await check_repply_cached(session_data['id'], db):
-        rag = await create_rag_model(db)
-        await rag.initialize()
-        mes = await rag.generate_response(data["message"], session_data['id'])
+    if await session_state.can_reply(session_data['id'], db, session_data):
+        mes = await generate_bot_reply(db, data["message"], session_data['id'])
         
         bot_message = {
             "id": None,
@@ -1414,7 +1297,8 @@ async def send_message_page_service(data: dict, db):
             "sender_type": "bot",
             "content": mes
         }
-        asyncio.create_task(save_message_to_db_background(bot_data, None, []))
+        window_uid = await conversation_window.append_message(session_data['id'], "bot", mes)
+        asyncio.create_task(save_message_to_db_background(bot_data, None, [], window_uid))
 
         # Gửi trả lời dựa trên platform tương ứng
         try:
@@ -1435,27 +1319,6 @@ async def send_message_page_service(data: dict, db):
     
     return response_messages
 
-def clear_session_cache(session_id: int):
-    """Clear cache cho session và check_repply"""
-    session_cache_key = f"session:{session_id}"
-    repply_cache_key = f"check_repply:{session_id}"
-    cache_delete(session_cache_key)
-    cache_delete(repply_cache_key)
-
-def update_session_cache(session, ttl=300):
-    session_cache_key = f"session:{session.id}"
-    session_data = {
-        'id': session.id,
-        'name': session.name,
-        'status': session.status,
-        'channel': session.channel,
-        'page_id': session.page_id,
-        'current_receiver': session.current_receiver,
-        'previous_receiver': session.previous_receiver,
-        'time': session.time.isoformat() if session.time else None
-    }
-    cache_set(session_cache_key, session_data, ttl=ttl)
-
 async def update_chat_session(id: int, data: dict, user, db: Session):
     try:
         result = await db.execute(select(ChatSession).filter(ChatSession.id == id))
@@ -1482,8 +1345,9 @@ async def update_chat_session(id: int, data: dict, user, db: Session):
         await db.commit()
         await db.refresh(chatSession)
         
-        # Clear cache sau khi update
-        clear_session_cache(id)
+        # Ghi đè trạng thái session trong Redis bằng bản ghi vừa commit
+        await session_state.put(chatSession)
+        await invalidate_admin_history_cache()
         
         return {
             "chat_session_id": chatSession.id,
@@ -1512,6 +1376,7 @@ async def update_tag_chat_session_service(id: int, data: dict, db):
         
         await db.commit()
         await db.refresh(chatSession)
+        await invalidate_admin_history_cache()
         return chatSession
         
     except Exception as e:
@@ -1523,11 +1388,13 @@ async def delete_chat_session(ids: list[int], db):
     if not sessions:
         return 0
     
-    # Clear cache cho từng session trước khi xóa
+    # Xóa trạng thái session trong Redis trước khi xóa
     for s in sessions:
-        clear_session_cache(s.id)
+        await session_state.delete(s.id)
+        await conversation_window.invalidate(s.id)
         await db.delete(s)
     await db.commit()
+    await invalidate_admin_history_cache()
     return len(sessions)
 
 async def delete_message(chatId: int, ids: list[int], db):
@@ -1547,10 +1414,27 @@ async def delete_message(chatId: int, ids: list[int], db):
     for m in messages:
         await db.delete(m)
     await db.commit()
+    await conversation_window.invalidate(chatId)
+    await invalidate_admin_history_cache()
     return len(messages)
 
 async def get_dashboard_summary(db: Session) -> Dict[str, Any]:
     try:
+        return await _load_dashboard_summary()
+    except Exception as e:
+        print(f"Error generating dashboard summary: {e}")
+        traceback.print_exc()
+        return {
+            "barData": [],
+            "pieData": [],
+            "lineData": [],
+            "tableData": [],
+        }
+
+@async_cache_result("dashboard", ttl=DASHBOARD_CACHE_TTL, stale_ttl=DASHBOARD_STALE_TTL)
+async def _load_dashboard_summary() -> Dict[str, Any]:
+    """3 query thống kê trên toàn bộ bảng messages; lỗi không được cache (get_dashboard_summary bắt)"""
+    async with AsyncSessionLocal() as db:
         # 1️⃣ Tổng số tin nhắn theo kênh (barData + pieData)
         bar_query = text("""
             SELECT 
@@ -1638,16 +1522,6 @@ async def get_dashboard_summary(db: Session) -> Dict[str, Any]:
             "tableData": table_data,
         }
 
-    except Exception as e:
-        print(f"Error generating dashboard summary: {e}")
-        traceback.print_exc()
-        return {
-            "barData": [],
-            "pieData": [],
-            "lineData": [],
-            "tableData": [],
-        }
-
 async def update_chat_session_tag(id: int, data: dict, db: Session):
     try:
         result = await db.execute(select(ChatSession).filter(ChatSession.id == id))
@@ -1661,8 +1535,7 @@ async def update_chat_session_tag(id: int, data: dict, db: Session):
         await db.commit()
         await db.refresh(chatSession)
         
-        # Clear cache sau khi update
-        clear_session_cache(id)
+        await invalidate_admin_history_cache()
         
         return chatSession
         
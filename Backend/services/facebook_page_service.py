@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from config.local_cache import bot_token_key, invalidate
 from models.facebook_page import FacebookPage
 import json
 
@@ -25,6 +26,8 @@ async def create_page_service(data: dict, db: AsyncSession):
     db.add(page)
     await db.commit()
     await db.refresh(page)
+    # Access token được cache 2 tầng trong send_fb
+    await invalidate(bot_token_key("facebook", page.page_id))
     return page
 
 
@@ -47,6 +50,8 @@ async def update_page_service(page_id: int, data: dict, db: AsyncSession):
 
     await db.commit()
     await db.refresh(page)
+    # Access token được cache 2 tầng trong send_fb
+    await invalidate(bot_token_key("facebook", page.page_id))
     return page
 
 
@@ -57,6 +62,7 @@ async def delete_page_service(page_id: int, db: AsyncSession):
         return None
     await db.delete(page)
     await db.commit()
+    await invalidate(bot_token_key("facebook", page.page_id))
     return True
         
         
@@ -84,6 +90,7 @@ async def facebook_callback_service(payload: dict, db: AsyncSession):
             existing_page.page_name = page_name
             await db.commit()
             await db.refresh(existing_page)
+            await invalidate(bot_token_key("facebook", page_id))
         else:
             new_page = FacebookPage(
                 page_id=page_id,
@@ -4,9 +4,9 @@ from models.field_config import FieldConfig
 from llm.llm import RAGModel
 
 # Helper function to clear cache
-def _clear_cache():
+async def _clear_cache():
     try:
-        RAGModel.clear_field_configs_cache()
+        await RAGModel.clear_field_configs_cache()
     except Exception as e:
         print(f"Lỗi khi xóa cache field configs: {str(e)}")
 
@@ -21,7 +21,7 @@ async def create_field_config_service(data: dict, db: AsyncSession):
     await db.commit()
     await db.refresh(field_config)
     
-    _clear_cache()
+    await _clear_cache()
     
     return field_config
 
@@ -42,7 +42,7 @@ async def update_field_config_service(config_id: int, data: dict, db: AsyncSessi
     await db.commit()
     await db.refresh(field_config)
     
-    _clear_cache()
+    await _clear_cache()
     
     return field_config
 
@@ -56,7 +56,7 @@ async def delete_field_config_service(config_id: int, db: AsyncSession):
     await db.commit()
     
     # Xóa cache field configs sau khi xóa
-    _clear_cache()
+    await _clear_cache()
     
     return field_config
 
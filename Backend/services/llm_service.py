@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models.llm import LLM
+from llm import answer_cache
+from llm.llm_config import invalidate_llm_config
 
 async def create_llm_service(data: dict, db: AsyncSession):
     llm_instance = LLM(
@@ -26,6 +28,8 @@ async def update_llm_service(llm_id: int, data: dict, db: AsyncSession):
     llm_instance.botName = data.get('botName', llm_instance.botName)
     await db.commit()
     await db.refresh(llm_instance)
+    # Xóa cache cấu hình LLM (API key, loại model, lời chào) ở mọi worker
+    await invalidate_llm_config()
     return llm_instance
 
 
@@ -36,6 +40,7 @@ async def delete_llm_service(llm_id: int, db: AsyncSession):
         return None
     await db.delete(llm_instance)
     await db.commit()
+    await invalidate_llm_config()
     return llm_instance
 
 
@@ -52,4 +57,8 @@ async def get_llm_by_id_service(llm_id: int, db: AsyncSession):
 
 async def get_all_llms_service(db: AsyncSession):
     result = await db.execute(select(LLM))
-    return result.scalars().all()
\ No newline at end of file
+    return result.scalars().all()
+
+
+async def get_answer_cache_stats_service():
+    return await answer_cache.get_stats()
@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from models.chat import ChatSession, CustomerInfo
 from models.facebook_page import FacebookPage
-from config.redis_cache import cache_get, cache_set, cache_delete
+from services.session_state import can_reply, session_state, takeover_expired, to_state
 
 
 class SessionService:
@@ -42,10 +42,8 @@ class SessionService:
         return self.create_session(channel, page_id)
     
     def get_session_by_id(self, session_id: int) -> Optional[ChatSession]:
-        """Lấy session theo ID với caching"""
-        # Kiểm tra cache trước
-        session_cache_key = f"session:{session_id}"
-        cached_session = cache_get(session_cache_key)
+        """Lấy session theo ID, đọc trạng thái từ services/session_state.py"""
+        cached_session = session_state.get_sync(session_id)
         
         if cached_session:
             # Tạo session object từ cache
@@ -97,65 +95,32 @@ class SessionService:
             self.db.rollback()
             return False
     
-    def update_session_cache(self, session: ChatSession, ttl: int = 300):
-        """Cập nhật cache cho session"""
-        session_cache_key = f"session:{session.id}"
-        session_data = {
-            'id': session.id,
-            'name': session.name,
-            'status': session.status,
-            'channel': session.channel,
-            'page_id': session.page_id,
-            'current_receiver': session.current_receiver,
-            'previous_receiver': session.previous_receiver,
-            'time': session.time.isoformat() if session.time else None
-        }
-        cache_set(session_cache_key, session_data, ttl=ttl)
+    def update_session_cache(self, session: ChatSession):
+        """Ghi đè trạng thái session trong Redis"""
+        session_state.put_sync(session)
     
     def clear_session_cache(self, session_id: int):
-        """Xóa cache của session"""
-        session_cache_key = f"session:{session_id}"
-        repply_cache_key = f"check_repply:{session_id}"
-        cache_delete(session_cache_key)
-        cache_delete(repply_cache_key)
+        """Xóa trạng thái session trong Redis"""
+        session_state.delete_sync(session_id)
     
     def check_can_reply(self, session_id: int) -> bool:
-        """Kiểm tra có thể reply tự động không với Redis cache"""
+        """Kiểm tra có thể reply tự động không (suy ra từ trạng thái session)"""
         try:
-            # Kiểm tra cache trước
-            repply_cache_key = f"check_repply:{session_id}"
-            cached_result = cache_get(repply_cache_key)
-            
-            if cached_result is not None:
-                return cached_result['can_reply']
-            
-            # Lấy session
             session = self.get_session_by_id(session_id)
             if not session:
                 return False
             
-            can_reply = False
-            
-            # Logic check repply
-            if (session.time and datetime.now() > session.time and 
-                session.status == "false"):
-                # Cập nhật database
+            state = to_state(session)
+            if takeover_expired(state):
+                # Hết hạn admin tiếp nhận → mở lại bot
                 db_session = self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
                 db_session.status = "true"
                 db_session.time = None
                 self.db.commit()
                 self.db.refresh(db_session)
-                
-                # Cập nhật cache session
                 self.update_session_cache(db_session)
-                can_reply = True
-            elif session.status == "true":
-                can_reply = True
-            
-            # Cache kết quả check_repply
-            cache_set(repply_cache_key, {'can_reply': can_reply}, ttl=300)
             
-            return can_reply
+            return can_reply(state)
             
         except Exception as e:
             return False
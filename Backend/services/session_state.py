@@ -0,0 +1,360 @@
+"""
+Trạng thái chat session dùng chung cho mọi đường xử lý tin nhắn (web, admin, Facebook / Telegram / Zalo)
+
+- Key session_state:{id} là 1 Redis hash: id, name, status, channel, page_id, current_receiver,
+  previous_receiver, time (ISO) - trường None không lưu trong hash
+- Đọc: 1 lệnh HGETALL; miss → đọc Postgres rồi nạp vào hash (không ghi đè nếu request khác vừa nạp)
+- Ghi: write-through - cập nhật hash (Lua, nguyên tử) rồi UPDATE Postgres trong cùng request;
+  UPDATE lỗi thì xóa hash để lần đọc sau lấy lại từ Postgres
+- can_reply suy ra từ status / time của chính hash (không cache riêng check_repply:{id} nữa):
+  status "true" → bot trả lời; status "false" + time đã qua → hết hạn admin tiếp nhận, mở lại bot
+- SESSION_STATE_TTL dài (mặc định 7 ngày, gia hạn mỗi lần ghi) vì hash luôn được cập nhật cùng DB,
+  không còn đọc lại DB sau mỗi 5 phút không có tin nhắn
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import select, update
+from dotenv import load_dotenv
+from config.database import AsyncSessionLocal
+from config.redis_cache import async_cache_get, async_cache_set, redis_cache
+from models.chat import ChatSession
+
+load_dotenv()
+
+SESSION_STATE_TTL = int(os.getenv("SESSION_STATE_TTL", 7 * 86400))
+ADMIN_TAKEOVER_HOURS = 1
+
+FIELDS = ("id", "name", "status", "channel", "page_id", "current_receiver", "previous_receiver", "time")
+
+# Nạp hash từ DB, bỏ qua nếu đã có (request khác vừa nạp / vừa ghi)
+_SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Admin tiếp nhận: chặn bot đến ARGV[2], người tiếp nhận cũ → previous_receiver
+_TAKEOVER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local current = redis.call('HGET', KEYS[1], 'current_receiver')
+if current then
+    redis.call('HSET', KEYS[1], 'previous_receiver', current)
+else
+    redis.call('HDEL', KEYS[1], 'previous_receiver')
+end
+redis.call('HSET', KEYS[1], 'status', 'false', 'time', ARGV[2], 'current_receiver', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# Mở lại bot khi hết hạn tiếp nhận, chỉ khi time chưa bị admin khác gia hạn
+_RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'status') == 'false' and redis.call('HGET', KEYS[1], 'time') == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'status', 'true')
+    redis.call('HDEL', KEYS[1], 'time')
+    return 1
+end
+return 0
+"""
+
+
+def state_key(session_id: int) -> str:
+    return f"session_state:{session_id}"
+
+
+def name_key(session_name: str) -> str:
+    return f"session_by_name:{session_name}"
+
+
+def to_state(session: ChatSession) -> Dict:
+    return {
+        "id": session.id,
+        "name": session.name,
+        "status": session.status,
+        "channel": session.channel,
+        "page_id": session.page_id,
+        "current_receiver": session.current_receiver,
+        "previous_receiver": session.previous_receiver,
+        "time": session.time.isoformat() if session.time else None,
+    }
+
+
+def _from_hash(raw) -> Optional[Dict]:
+    """HGETALL (dict, hoặc list phẳng [k, v, ...] trả về từ Lua) → state, rỗng → None"""
+    if not raw:
+        return None
+    if isinstance(raw, list):
+        raw = dict(zip(raw[::2], raw[1::2]))
+    state = {field: raw.get(field) for field in FIELDS}
+    state["id"] = int(state["id"])
+    return state
+
+
+def _hash_mapping(state: Dict) -> Dict:
+    return {field: state[field] for field in FIELDS if state.get(field) is not None}
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def takeover_expired(state: Dict, now: Optional[datetime] = None) -> bool:
+    takeover_until = _parse_time(state.get("time"))
+    return state.get("status") == "false" and takeover_until is not None and (now or datetime.now()) > takeover_until
+
+
+def can_reply(state: Optional[Dict], now: Optional[datetime] = None) -> bool:
+    """Bot được trả lời session này không (chỉ đọc, không mở lại bot)"""
+    if not state:
+        return False
+    return state.get("status") == "true" or takeover_expired(state, now)
+
+
+class SessionStateStore:
+    async def _load(self, db, **filters) -> Optional[ChatSession]:
+        query = select(ChatSession).filter_by(**filters)
+        if db is not None:
+            return (await db.execute(query)).scalar_one_or_none()
+        async with AsyncSessionLocal() as new_db:
+            return (await new_db.execute(query)).scalar_one_or_none()
+
+    async def _write_through(self, session_id: int, statement) -> Optional[int]:
+        """
+        UPDATE Postgres bằng DB session riêng (không commit transaction của request)
+
+        Returns:
+            số row đã cập nhật, lỗi → None
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(statement)
+                await db.commit()
+            return result.rowcount
+        except Exception as e:
+            print(f"❌ [SESSION STATE] Lỗi ghi DB session {session_id}: {e}")
+            await self.delete(session_id)
+            return None
+
+    async def get(self, session_id: int, db=None) -> Optional[Dict]:
+        """State của session (dict theo FIELDS), không có session → None"""
+        if not session_id:
+            return None
+        client = None
+        try:
+            client = await redis_cache.get_async_client()
+            if client is not None:
+                state = _from_hash(await client.hgetall(state_key(session_id)))
+                if state is not None:
+                    return state
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi đọc Redis session {session_id}: {e}")
+            client = None
+
+        session = await self._load(db, id=session_id)
+        if session is None:
+            return None
+        state = to_state(session)
+        if client is not None:
+            await self._seed(client, state)
+        return state
+
+    async def _seed(self, client, state: Dict):
+        try:
+            args = [item for pair in _hash_mapping(state).items() for item in pair]
+            await client.eval(_SEED_SCRIPT, 1, state_key(state["id"]), SESSION_STATE_TTL, *args)
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi nạp Redis session {state['id']}: {e}")
+
+    async def get_by_name(self, session_name: str, db=None) -> Optional[Dict]:
+        """Session Facebook / Telegram / Zalo theo tên (F-/T-/Z-{sender_id})"""
+        session_id = await async_cache_get(name_key(session_name))
+        state = await self.get(session_id, db) if session_id else None
+        if state is not None:
+            return state
+
+        session = await self._load(db, name=session_name)
+        if session is None:
+            return None
+        await self.put(session)
+        return to_state(session)
+
+    async def put(self, session: ChatSession):
+        """Ghi đè hash từ bản ghi vừa commit (tạo session, admin sửa trạng thái...)"""
+        state = to_state(session)
+        try:
+            client = await redis_cache.get_async_client()
+            if client is None:
+                return
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.delete(state_key(session.id))
+                pipe.hset(state_key(session.id), mapping=_hash_mapping(state))
+                pipe.expire(state_key(session.id), SESSION_STATE_TTL)
+                await pipe.execute()
+            if session.name:
+                await async_cache_set(name_key(session.name), session.id, SESSION_STATE_TTL)
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi ghi Redis session {session.id}: {e}")
+            await self.delete(session.id)
+
+    async def delete(self, session_id: int):
+        try:
+            client = await redis_cache.get_async_client()
+            if client is not None:
+                await client.delete(state_key(session_id))
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi xóa Redis session {session_id}: {e}")
+
+    async def admin_takeover(self, session_id: int, admin_name: str, db=None,
+                             hours: int = ADMIN_TAKEOVER_HOURS) -> Optional[Dict]:
+        """
+        Admin nhắn → chặn bot `hours` giờ, admin thành current_receiver
+        Cập nhật Redis trước (bot ở worker khác thấy ngay), rồi Postgres
+
+        Returns:
+            state sau khi cập nhật, None nếu session không tồn tại
+        """
+        takeover_until = (datetime.now() + timedelta(hours=hours)).isoformat()
+        state = None
+        try:
+            client = await redis_cache.get_async_client()
+            if client is not None:
+                args = (_TAKEOVER_SCRIPT, 1, state_key(session_id), SESSION_STATE_TTL, takeover_until, admin_name or "")
+                state = _from_hash(await client.eval(*args))
+                if state is None and await self.get(session_id, db) is not None:
+                    # Chưa có trong Redis → đã nạp từ DB, chạy lại
+                    state = _from_hash(await client.eval(*args))
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi admin tiếp nhận session {session_id} trên Redis: {e}")
+            state = None
+
+        written = await self._write_through(
+            session_id,
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(
+                status="false",
+                time=datetime.fromisoformat(takeover_until),
+                previous_receiver=ChatSession.current_receiver,
+                current_receiver=admin_name,
+            ),
+        )
+        if state is None and written is not None:
+            # Redis không dùng được → state từ DB
+            state = await self.get(session_id)
+        return state
+
+    async def _release_in_redis(self, state: Dict) -> Optional[bool]:
+        """Lua mở lại bot: True đã mở, False time đã đổi / hash không còn, None không dùng được Redis"""
+        try:
+            client = await redis_cache.get_async_client()
+            if client is None:
+                return None
+            return await client.eval(_RELEASE_SCRIPT, 1, state_key(state["id"]), state["time"]) == 1
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi mở lại bot session {state['id']} trên Redis: {e}")
+            return None
+
+    async def release_if_expired(self, state: Dict) -> bool:
+        """
+        Hết hạn admin tiếp nhận → mở lại bot (Redis + Postgres), True nếu bot được trả lời
+        state chỉ được sửa thành "true" khi Redis / Postgres thực sự đã mở lại bot
+        """
+        if state.get("status") == "true":
+            return True
+        if not takeover_expired(state):
+            return False
+
+        released = await self._release_in_redis(state)
+        if released is False:
+            # Admin khác vừa tiếp nhận / gia hạn, hoặc hash đã hết hạn → đọc lại state
+            fresh = await self.get(state["id"])
+            if fresh is None:
+                return False
+            state.update(fresh)
+            if state.get("status") == "true":
+                return True
+            if not takeover_expired(state):
+                return False
+            # Hash vừa được nạp lại từ DB, thời hạn tiếp nhận vẫn đã qua → thử lại 1 lần
+            released = await self._release_in_redis(state)
+            if not released:
+                return False
+
+        updated = await self._write_through(
+            state["id"],
+            update(ChatSession)
+            .where(
+                ChatSession.id == state["id"],
+                ChatSession.status == "false",
+                ChatSession.time <= datetime.now(),
+            )
+            .values(status="true", time=None),
+        )
+        if released is None and not updated:
+            # Không có Redis và DB không đổi (admin khác vừa tiếp nhận / đã mở lại) → theo DB
+            fresh = await self.get(state["id"])
+            if fresh is None:
+                return False
+            state.update(fresh)
+            return state.get("status") == "true"
+
+        state["status"], state["time"] = "true", None
+        return True
+
+    async def can_reply(self, session_id: int, db=None, state: Optional[Dict] = None) -> bool:
+        """
+        Thay cho check_repply / check_repply_cached
+        state: đã đọc bằng get() trong request → không đọc Redis lần nữa
+        """
+        try:
+            if state is None:
+                state = await self.get(session_id, db)
+            if state is None:
+                return False
+            return await self.release_if_expired(state)
+        except Exception as e:
+            print(f"❌ [SESSION STATE] Lỗi kiểm tra can_reply session {session_id}: {e}")
+            return False
+
+    # ================== SYNC (services/session_service.py) ==================
+    def get_sync(self, session_id: int) -> Optional[Dict]:
+        try:
+            client = redis_cache.get_sync_client()
+            return _from_hash(client.hgetall(state_key(session_id))) if client is not None else None
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi đọc Redis session {session_id}: {e}")
+            return None
+
+    def put_sync(self, session: ChatSession):
+        state = to_state(session)
+        try:
+            client = redis_cache.get_sync_client()
+            if client is None:
+                return
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(state_key(session.id))
+            pipe.hset(state_key(session.id), mapping=_hash_mapping(state))
+            pipe.expire(state_key(session.id), SESSION_STATE_TTL)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi ghi Redis session {session.id}: {e}")
+
+    def delete_sync(self, session_id: int):
+        try:
+            client = redis_cache.get_sync_client()
+            if client is not None:
+                client.delete(state_key(session_id))
+        except Exception as e:
+            print(f"⚠️ [SESSION STATE] Lỗi xóa Redis session {session_id}: {e}")
+
+
+session_state = SessionStateStore()
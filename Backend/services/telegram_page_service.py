@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from config.local_cache import bot_token_key, invalidate
 from models.telegram_page import TelegramBot
 
 
@@ -20,6 +21,8 @@ async def create_bot_service(data: dict, db: AsyncSession):
     db.add(bot)
     await db.commit()
     await db.refresh(bot)
+    # Token bot được cache 2 tầng trong send_telegram
+    await invalidate(bot_token_key("telegram", bot.id))
     return bot
 
 
@@ -37,6 +40,8 @@ async def update_bot_service(bot_id: int, data: dict, db: AsyncSession):
 
     await db.commit()
     await db.refresh(bot)
+    # Token bot được cache 2 tầng trong send_telegram
+    await invalidate(bot_token_key("telegram", bot.id))
     return bot
 
 
@@ -47,4 +52,5 @@ async def delete_bot_service(bot_id: int, db: AsyncSession):
         return None
     await db.delete(bot)
     await db.commit()
+    await invalidate(bot_token_key("telegram", bot_id))
     return True
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+🧪 Test script để kiểm tra lớp completion (llm/completion.py) KHÔNG block event loop
+
+Chạy script này để test:
+1. N hội thoại gọi LLM đồng thời (mỗi hội thoại = build_search_key + generate_response)
+2. So sánh với cách gọi SYNC cũ (generate_content / chat.completions.create trong async def)
+3. Đo độ trễ event loop (heartbeat) trong lúc các request đang chạy
+
+Không cần API key: dùng provider giả lập với độ trễ cố định.
+
+Usage:
+    python test_concurrent_llm.py
+"""
+
+import asyncio
+import time
+
+from llm import completion
+from llm.completion import BaseCompletionClient, get_completion_client
+
+# ===== CẤU HÌNH =====
+NUM_CONVERSATIONS = 20
+LLM_LATENCY = 0.5  # giây cho mỗi lần gọi LLM giả lập
+
+
+class FakeCompletionClient(BaseCompletionClient):
+    """Provider giả lập: I/O bất đồng bộ giống AsyncOpenAI / generate_content_async"""
+    provider = "fake"
+
+    async def _generate(self, prompt, temperature, system=None):
+        await asyncio.sleep(LLM_LATENCY)
+        return f"reply: {prompt[:20]}"
+
+
+class BlockingCompletionClient(BaseCompletionClient):
+    """Mô phỏng code cũ: gọi SDK sync bên trong async def"""
+    provider = "blocking"
+
+    async def _generate(self, prompt, temperature, system=None):
+        time.sleep(LLM_LATENCY)
+        return f"reply: {prompt[:20]}"
+
+
+completion.PROVIDERS["fake"] = FakeCompletionClient
+completion.PROVIDERS["blocking"] = BlockingCompletionClient
+
+
+async def run_conversation(client: BaseCompletionClient, idx: int) -> float:
+    """1 tin nhắn khách = 2 lần gọi LLM nối tiếp (search key → answer)"""
+    start = time.perf_counter()
+    search_key = await client.generate(f"search key cho câu hỏi {idx}")
+    await client.generate(f"answer với {search_key}")
+    return time.perf_counter() - start
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    """Đo độ trễ event loop: sleep 50ms, ghi lại thời gian thực tế bị trễ"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.05)
+        lags.append(time.perf_counter() - start - 0.05)
+
+
+async def measure(provider: str, num_conversations: int):
+    client = get_completion_client(provider, "test-key", "test-model")
+
+    stop = asyncio.Event()
+    lags = []
+    hb_task = asyncio.create_task(heartbeat(stop, lags))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_conversation(client, i) for i in range(num_conversations)])
+    total = time.perf_counter() - start
+
+    stop.set()
+    await hb_task
+    max_lag = max(lags) if lags else total
+    return total, max_lag
+
+
+async def test_concurrent_conversations():
+    print(f"\n{'='*70}")
+    print(f"🧪 TEST: {NUM_CONVERSATIONS} hội thoại đồng thời qua lớp completion async")
+    print(f"{'='*70}\n")
+
+    single, _ = await measure("fake", 1)
+    total, max_lag = await measure("fake", NUM_CONVERSATIONS)
+
+    print(f"⏱️  1 hội thoại:              {single*1000:.0f}ms")
+    print(f"⏱️  {NUM_CONVERSATIONS} hội thoại đồng thời:    {total*1000:.0f}ms")
+    print(f"💓 Event loop lag tối đa:     {max_lag*1000:.0f}ms")
+
+    ok = total < single * 1.5 and max_lag < LLM_LATENCY / 2
+    if ok:
+        print(f"\n✅ PASS: {NUM_CONVERSATIONS} hội thoại hoàn tất trong ~thời gian của 1 hội thoại")
+    else:
+        print(f"\n❌ FAIL: Có blocking! Tổng thời gian gấp {total/single:.1f} lần 1 hội thoại")
+    return ok
+
+
+async def test_blocking_baseline(num_conversations: int = 4):
+    print(f"\n{'='*70}")
+    print(f"🧪 BASELINE: {num_conversations} hội thoại với lời gọi SDK sync (code cũ)")
+    print(f"{'='*70}\n")
+
+    total, max_lag = await measure("blocking", num_conversations)
+    print(f"⏱️  {num_conversations} hội thoại:  {total*1000:.0f}ms (≈ {num_conversations} x 2 x {LLM_LATENCY*1000:.0f}ms)")
+    print(f"💓 Event loop lag tối đa:  {max_lag*1000:.0f}ms → mọi websocket/webhook bị treo")
+
+
+async def main():
+    ok = await test_concurrent_conversations()
+    await test_blocking_baseline()
+    return ok
+
+
+if __name__ == "__main__":
+    print("\n🚀 Khởi động test lớp completion...\n")
+    ok = asyncio.run(main())
+    print("\n✨ Test hoàn tất!\n")
+    raise SystemExit(0 if ok else 1)
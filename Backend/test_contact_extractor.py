@@ -0,0 +1,93 @@
+"""
+🧪 Kiểm tra trích xuất số điện thoại / email / họ tên bằng regex (helper/contact_extractor.py)
+
+Trường nhận được bằng regex KHÔNG đi qua LLM (llm/llm.py, llm/gpt.py) nên số nhận nhầm
+(ngày giờ, giá tiền, mã đơn) sẽ bị lưu thẳng vào thông tin khách → phải trả về None.
+
+Không cần DB / Redis / API key.
+
+Usage:
+    python test_contact_extractor.py
+"""
+
+from helper.contact_extractor import extract_contact_fields, extract_email, extract_name, extract_phone
+
+# (câu của khách, số điện thoại mong đợi) - None = không có số điện thoại
+PHONE_CASES = [
+    # Số hợp lệ, các cách viết thông dụng
+    ("sđt em 0912345678 nhé", "0912345678"),
+    ("0912 345 678", "0912345678"),
+    ("0912.345.678", "0912345678"),
+    ("0912-345-678", "0912345678"),
+    ("091 234 5678", "0912345678"),
+    ("091.234.5678", "0912345678"),
+    ("+84 912 345 678", "0912345678"),
+    ("+84912345678", "0912345678"),
+    ("84912345678", "0912345678"),
+    ("số bàn 028 3822 1234", "02838221234"),
+    ("0236 382 2123", "02363822123"),
+    ("sđt:0356789123", "0356789123"),
+    ("số cũ 0912345678, số mới 0987654321", "0987654321"),
+    # Ngày / giờ
+    ("cho em hỏi lớp ngày 03.05.2025 08:30", None),
+    ("lớp khai giảng 05/06/2025 lúc 18:00", None),
+    ("ngày 03-05-2025 8h30 có lớp không", None),
+    ("03.05.2025 0912345678", "0912345678"),
+    # Giá tiền
+    ("học phí 3.500.000đ ạ", None),
+    ("khóa này 0,9 triệu hay 09.500.000 ạ", None),
+    ("giá 1 200 000 vnđ", None),
+    # Mã đơn / mã học viên
+    ("mã đơn DH0912345678", None),
+    ("mã đơn #0912345678", None),
+    ("mã học viên HV-0912345678-01", None),
+    ("đơn 09123456789012", None),
+    # Đầu số / cách nhóm không hợp lệ
+    ("0112345678", None),
+    ("0412 345 678", None),
+    ("0912.345 678", None),
+    ("09 12 34 56 78", None),
+]
+
+NAME_CASES = [
+    ("tên em là Lan Anh ạ", "Lan Anh"),
+    ("mình là Minh, sđt 0912345678", "Minh"),
+    ("em là sinh viên", None),
+]
+
+EMAIL_CASES = [
+    ("email em là Lan.Anh@Gmail.com.", "lan.anh@gmail.com"),
+    ("không có email", None),
+]
+
+
+def check(title, extractor, cases):
+    print(f"\n{title}")
+    failed = 0
+    for text, expected in cases:
+        actual = extractor(text)
+        ok = actual == expected
+        failed += not ok
+        print(f"  {'✅' if ok else '❌'} {text!r:<50} → {actual!r} (mong đợi {expected!r})")
+    return failed
+
+
+def main():
+    failed = check("📞 Số điện thoại", extract_phone, PHONE_CASES)
+    failed += check("👤 Họ tên", extract_name, NAME_CASES)
+    failed += check("📧 Email", extract_email, EMAIL_CASES)
+
+    history = "customer: ngày 03.05.2025 08:30 còn lớp không\nbot: Dạ còn ạ\ncustomer: đơn DH0912345678"
+    fields = extract_contact_fields(history, ["Số điện thoại", "Mục đích học"])
+    ok = fields == {}
+    failed += not ok
+    print(f"\n{'✅' if ok else '❌'} extract_contact_fields không có số thật → {fields}")
+
+    total = len(PHONE_CASES) + len(NAME_CASES) + len(EMAIL_CASES) + 1
+    print(f"\n{total - failed}/{total} trường hợp đúng")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
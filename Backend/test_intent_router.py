@@ -0,0 +1,63 @@
+"""
+🧪 Kiểm tra bảng phân loại ý định của llm/intent_router.py (classify_intent)
+
+Không cần DB / Redis / API key: chỉ gọi hàm phân loại thuần.
+Các tin nhắn không phải xác nhận thật ("anh ơi", emoji, tiếng Trung...) KHÔNG được ra "ack",
+nếu không bot sẽ trả lời "Dạ vâng ạ" thay vì chuyển câu hỏi vào RAG.
+
+Usage:
+    python test_intent_router.py
+"""
+
+from llm.intent_router import NON_TEXT_PLACEHOLDER, classify_intent
+
+# (tin nhắn, ý định mong đợi) - None = câu hỏi thực sự, đi vào RAG
+CASES = [
+    ("这个课多少钱？", None),
+    ("你好", None),
+    ("???", None),
+    ("😊", None),
+    ("👍", None),
+    ("anh ơi", None),
+    ("chị ạ", None),
+    ("em", None),
+    ("lắm", None),
+    ("", None),
+    ("   ", None),
+    ("chào em, học phí HSK3 bao nhiêu?", None),
+    ("chi phí", None),
+    ("khi nào", None),
+    ("chi phí khóa HSK3", None),
+    ("khi nào khai giảng", None),
+    ("chào", "greeting"),
+    ("chào em cho chị hỏi lịch học", None),
+    ("chào anh chị em bạn ad admin shop ơi nhé", None),
+    ("hi", "greeting"),
+    ("hi there", "greeting"),
+    ("chiều nay học không", None),
+    ("ok", "ack"),
+    ("Oke ạ", "ack"),
+    ("ok rồi em nhé", "ack"),
+    ("Chào em", "greeting"),
+    ("hello ad", "greeting"),
+    ("Cảm ơn nhiều ạ", "thanks"),
+    ("tạm biệt nhé", "goodbye"),
+    (NON_TEXT_PLACEHOLDER, "non_text"),
+]
+
+
+def main():
+    failed = 0
+    for content, expected in CASES:
+        actual = classify_intent(content)
+        ok = actual == expected
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {content[:40]!r:<45} → {actual!r} (mong đợi {expected!r})")
+
+    print(f"\n{len(CASES) - failed}/{len(CASES)} trường hợp đúng")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
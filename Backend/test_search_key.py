@@ -0,0 +1,56 @@
+"""
+🧪 Kiểm tra heuristic "câu hỏi tự đủ nghĩa" của llm/search_key.py (is_self_contained)
+
+Câu tự đủ nghĩa → dùng nguyên văn làm từ khóa (không gọi LLM) và được dùng cache câu trả lời.
+Đặc biệt kiểm tra các từ thường trùng với từ tham chiếu / chủ đề sau khi bỏ dấu:
+"trình độ" (đó), "hôm nay" (này), "tham gia" (giá).
+
+Không cần DB / Redis / API key.
+
+Usage:
+    python test_search_key.py
+"""
+
+from llm.search_key import clean_question, is_self_contained
+
+VOCABULARY = {"campus": {"dong da", "cau giay"}, "city": {"ha noi"}}
+
+# (câu hỏi, tự đủ nghĩa?)
+CASES = [
+    # Từ thường trùng âm tiết với từ tham chiếu / chủ đề
+    ("Trình độ HSK3 tương đương gì", True),
+    ("Hôm nay trung tâm có mở cửa không", True),
+    ("Làm sao để tham gia thi thử", True),
+    ("Lớp HSK4 yêu cầu trình độ đầu vào thế nào", True),
+    ("Thi HSK ở đâu", True),
+    # Tham chiếu ngữ cảnh thật
+    ("Khóa đó học phí bao nhiêu", False),
+    ("Lớp này học mấy buổi", False),
+    ("Còn cơ sở Cầu Giấy thì sao", False),
+    ("Cái này giá bao nhiêu", False),
+    # Chủ đề cần tên khóa học
+    ("Học phí bao nhiêu", False),
+    ("Giá bao nhiêu vậy", False),
+    ("Học phí HSK3 bao nhiêu", True),
+    ("Giá khóa giao tiếp bao nhiêu", True),
+    # Lịch cần hình thức / cơ sở
+    ("Lịch khai giảng HSK3", False),
+    ("Lịch khai giảng HSK3 cơ sở Đống Đa", True),
+]
+
+
+def main():
+    failed = 0
+    for question, expected in CASES:
+        actual = is_self_contained(clean_question(question), VOCABULARY)
+        ok = actual == expected
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {question!r:<50} → {actual} (mong đợi {expected})")
+
+    print(f"\n{len(CASES) - failed}/{len(CASES)} trường hợp đúng")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()